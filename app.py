@@ -1,703 +1,408 @@
-import streamlit as st
 import pandas as pd
-import plotly.express as px
-import os
-import numpy as np
+import streamlit as st
+
+from inclusion import geo, warmup
+from inclusion.catalog import DRILLDOWN_METRICS
+from inclusion.correlations import correlation_table
+from inclusion.cube import ALL, load_cube
+from inclusion.data import fingerprint
+from inclusion.drilldown import MunicipalIndex, load_municipal
+from inclusion.figcache import cached_figure, plotly_chart_json
+from inclusion.figures import (account_labels, credit_labels, indicator_labels, infrastructure_labels,
+                               infrastructure_metrics, institution_colors, institution_labels)
+from inclusion.index_engine import COMPONENT_GROUPS, DEFAULT_SPEC, IndexEngine, spec_from_groups
+from inclusion.metrics import (account_columns, add_derived_metrics, credit_columns, indicators,
+                               institution_columns)
+from inclusion.peers import TYPE_COL, PeerIndex
+from inclusion.profiling import debug_panel, profiled, timed, widget_state
+from inclusion.state import STATE_COLUMNS, load_state, ranking
+from inclusion.whatif import ALLOCATIONS, Addition, Simulator
 
 # Set page configuration
 st.set_page_config(page_title="Financial Inclusion MX", page_icon="💸", layout="centered")
 
-@st.cache_data
-def load_data():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(current_dir, 'State-Level_Consolidated_Dataset.csv')
-    df = pd.read_csv(file_path)
-    df.columns = df.columns.str.strip()
-    percentage_columns = [col for col in df.columns if col.startswith('%')]
-    for col in percentage_columns:
-        if df[col].dtype == 'object':
-            df[col] = df[col].str.replace(',', '.').astype(float)
+# Build every figure the pages can show into the figure cache, once per process
+warmup.start()
+
+# Timing and memory per section of this rerun; shown below the page with ?debug=1
+with profiled('state', context=widget_state(st.session_state)) as profile:
+    debug = st.experimental_get_query_params().get('debug', ['0'])[0] == '1'
+    profile.mark('0. Data loading')
+
+    def section(title):
+        """Start a numbered section: a header plus a new profiling section."""
+        profile.mark(title)
+        st.header(title)
+
+    # Read-only frame shared by every session (and, through shared memory, every
+    # worker process); derived columns go on a per-rerun shallow copy
+    @st.cache_resource
+    def load_data():
+        return load_state()
+
+    df = load_data()
+
+    @st.cache_resource
+    def load_municipal_index():
+        return MunicipalIndex(load_municipal(), sort_metrics=DRILLDOWN_METRICS)
+
+    # One index engine per frame, shared across sessions so every weighting is computed once
+    @st.cache_resource
+    def state_index_engine():
+        return IndexEngine(load_data())
+
+    @st.cache_resource
+    def municipal_index_engine():
+        return IndexEngine(load_municipal_index().frame)
+
+    # Nearest-neighbour index over the municipal indicators, built once and shared by every session
+    @st.cache_resource
+    def peer_index():
+        return PeerIndex(load_municipal_index().frame)
+
+    # Rollup cube of the municipal data over region x population type (see
+    # inclusion.cube), written at ingest and shared by every session
+    @st.cache_resource
+    def load_rollup_cube():
+        return load_cube()
+
+    # Data versions for the figure cache keys
+    @st.cache_resource
+    def data_versions():
+        return {'state': fingerprint(load_data()), 'municipal': fingerprint(load_municipal_index().frame)}
+
+    # inclusion.catalog.state_figures() lists every chart this page can show, for
+    # the cache warm-up and the static export; keep it in step with the calls below
+    def show_chart(chart, source, version, use_container_width=False, **params):
+        """Render a chart from inclusion.figures, served from the figure cache when
+        the same (data version, chart, params) was already built."""
+        plotly_chart_json(cached_figure(chart, source, version, **params), use_container_width)
+
+    versions = data_versions()
+    with timed('pandas'):
+        df = add_derived_metrics(df)
+
+    # State name -> Clave_Estado, used to look states up in the municipal index
+    state_keys = {name: int(clave) for name, clave in df['Clave_Estado'].dropna().items()}
+
+    def filtered_states(region, population_type):
+        """Frame and version of the state comparisons in sections 2-6: the published
+        figures of the states of `region` or, for one population type, the rates of
+        those municipalities re-derived from the rollup cube."""
+        if population_type == ALL:
+            if region == ALL:
+                return df, versions['state']
+            return df[df.index.isin(rollup.states_of(region))], f"{versions['state']}:{region}"
+        table = rollup.table('state', population_type, region,
+                             rates=[col for col in STATE_COLUMNS if col in rollup.rates],
+                             counts=['Poblacion', 'Poblacion_adulta', 'Superficie_km2'])
+        table['Clave_Estado'] = table.index.map(state_keys)
+        return add_derived_metrics(table), f'cube:{rollup.version}:{region}:{population_type}'
+
+    def select_drilldown_state(key):
+        state = st.selectbox("Drill down into a state's municipalities:", ['(none)'] + list(state_keys),
+                             key=f'drilldown_{key}')
+        return None if state == '(none)' else state
+
+    def state_comparison(chart, source, version, map_metric, title, colorbar_title, **params):
+        """A per-state bar chart from inclusion.figures, or the map of `map_metric` in map view."""
+        if map_view:
+            show_chart('state_map', source, f"{version}:{geo_versions['state']}", use_container_width=True,
+                       metric=map_metric, title=title, colorbar_title=colorbar_title)
         else:
-            df[col] = df[col].astype(float)
-    df.set_index('Estado', inplace=True)
-    # Filter out "Sin identificar"
-    df = df[df.index != 'Sin identificar']
-    return df
-
-df = load_data()
-
-st.title('Financial Inclusion Analysis - Mexico, June 2024')
-
-# 1. Population Demographics
-st.header('1. Population demographics')
-df['Adult_Population_Percentage'] = df['Poblacion_adulta'] / df['Poblacion'] * 100
-df['Superficie_km2'] = df['Superficie_km2'].fillna(df['Superficie_km2'].median())
-
-fig = px.scatter(df, x='Poblacion', y='Adult_Population_Percentage', 
-                 size='Superficie_km2', hover_name=df.index, 
-                 labels={'Poblacion': 'total population', 
-                         'Adult_Population_Percentage': 'adult population as (%)', 
-                         'Superficie_km2': 'Area (km²)'},
-                 title='Population demographics by state; size represents area')
-st.plotly_chart(fig)
-
-# 2. Banking Infrastructure Availability
-st.header('2. Banking infrastructure availability')
-
-# Add a dictionary for friendly names
-infrastructure_labels = {
-    'Sucursales_banca_comercial_10mil_adultos': 'Commercial bank branches',
-    'Cajeros_10mil_adultos': 'ATMs',
-    'Corresponsales_10mil_adultos': 'Banking agents (corresponsales)'
-}
-
-infrastructure_metrics = {
-    'Sucursales_banca_comercial_10mil_adultos': '#1f77b4',
-    'Cajeros_10mil_adultos': '#2ca02c',
-    'Corresponsales_10mil_adultos': '#d62728'
-}
-
-selected_metric = st.selectbox('Select infrastructure type:', 
-                             list(infrastructure_metrics.keys()),
-                             format_func=lambda x: infrastructure_labels[x],
-                             key='infrastructure')
-
-fig = px.bar(df.sort_values(selected_metric, ascending=False), 
-             y=selected_metric, 
-             title=f'{infrastructure_labels[selected_metric]} per 10,000 Adults',
-             color_discrete_sequence=[infrastructure_metrics[selected_metric]])
-
-fig.update_layout(
-    xaxis_title='state', 
-    yaxis_title='number per 10,000 adults', 
-    height=600,
-    xaxis_tickangle=-45
-)
-st.plotly_chart(fig)
-
-# 3. Account Ownership by Type
-st.header('3. Account ownership by type')
-account_columns = [
-    'Cuentas_Nivel1_10mil_adultos_Banca', 
-    'Cuentas_Nivel2_10mil_adultos_Banca', 
-    'Cuentas_Nivel3_10mil_adultos_Banca', 
-    'Cuentas_cuentas_transaccionales_tradicionales_10mil_adultos_Banca'
-]
-
-account_labels = {
-    'Cuentas_Nivel1_10mil_adultos_Banca': 'Cuentas nivel 1',
-    'Cuentas_Nivel2_10mil_adultos_Banca': 'Cuentas nivel 2',
-    'Cuentas_Nivel3_10mil_adultos_Banca': 'Cuentas nivel 3',
-    'Cuentas_cuentas_transaccionales_tradicionales_10mil_adultos_Banca': 'Cuentas transaccionales tradicionales'
-}
-
-view_type = st.radio('Select view type', ['Absolute numbers', 'Percentage'])
-
-if view_type == 'Absolute numbers':
-    account_data_abs = df[account_columns]
-    account_data_renamed = account_data_abs.rename(columns=account_labels)
-    fig = px.bar(
-        account_data_renamed.sort_values(list(account_labels.values())[0], ascending=False),
-        y=list(account_labels.values()),
-        title='Account ownership by type per 10,000 adults'
-    )
-    fig.update_layout(
-        xaxis_title='state', 
-        yaxis_title='accounts per 10,000 adults', 
-        barmode='stack', 
-        height=700
-    )
-else:
-    account_data_percentage = df[account_columns].div(df[account_columns].sum(axis=1), axis=0) * 100
-    account_data_renamed = account_data_percentage.rename(columns=account_labels)
-    fig = px.bar(
-        account_data_renamed.sort_values(list(account_labels.values())[0], ascending=False),
-        y=list(account_labels.values()),
-        title='Account Ownership by Type (Percentage)'
-    )
-    fig.update_layout(
-        xaxis_title='State', 
-        yaxis_title='Percentage', 
-        barmode='stack', 
-        height=700
-    )
-
-fig.update_layout(
-    legend=dict(
-        orientation="v",
-        yanchor="top",
-        y=1,
-        xanchor="left",
-        x=1.02,
-        font=dict(size=10)
-    ),
-    margin=dict(l=50, r=300, t=80, b=200),
-    xaxis_tickangle=-45,
-    height=700
-)
-st.plotly_chart(fig, use_container_width=True)
-
-# 4. Credit Product Penetration
-st.header('4. Credit product penetration')
-credit_columns = [
-    'Creditos_hipotecarios_10mil_adultos_Banca', 
-    'Creditos_personales_10mil_adultos_Banca', 
-    'Creditos_nomina_10mil_adultos_Banca', 
-    'Creditos_automotrices_10mil_adultos_Banca', 
-    'Creditos_ABCD_10mil_adultos_Banca'
-]
-
-credit_labels = {
-    'Creditos_hipotecarios_10mil_adultos_Banca': 'Mortgage (Hipotecarios)',
-    'Creditos_personales_10mil_adultos_Banca': 'Personal (Personales)',
-    'Creditos_nomina_10mil_adultos_Banca': 'Salary (Nómina)',
-    'Creditos_automotrices_10mil_adultos_Banca': 'Automotive (Automotriz)',
-    'Creditos_ABCD_10mil_adultos_Banca': 'ABCD'
-}
-
-credit_data_renamed = df[credit_columns].rename(columns=credit_labels)
-fig = px.bar(
-    credit_data_renamed.sort_values('Mortgage (Hipotecarios)', ascending=False), 
-    y=list(credit_labels.values()),
-    title='Credit product penetration per 10,000 adults'
-)
-fig.update_layout(
-    xaxis_title='state', 
-    yaxis_title='credits per 10,000 adults', 
-    barmode='stack', 
-    height=700,
-    legend=dict(
-        orientation="v",
-        yanchor="top",
-        y=1,
-        xanchor="left",
-        x=1.02,
-        font=dict(size=10)
-    ),
-    margin=dict(l=50, r=300, t=80, b=200),
-    xaxis_tickangle=-45
-)
-st.plotly_chart(fig, use_container_width=True)
-
-# 5. Mobile Banking Adoption
-st.header('5. Mobile banking adoption')
-df['Mobile_Banking_Penetration'] = df['Contratos_celular_10mil_adultos'] / 10000
-
-fig = px.bar(
-    df.sort_values('Mobile_Banking_Penetration', ascending=False), 
-    y='Mobile_Banking_Penetration', 
-    title='Mobile banking adoption by state'
-)
-fig.update_layout(
-    xaxis_title='state', 
-    yaxis_title='mobile banking contracts per adult', 
-    height=600,
-    xaxis_tickangle=-45
-)
-st.plotly_chart(fig)
-
-# 6. Comparison of different financial institutions
-st.header('6. Comparison of different financial institutions')
-institution_columns = ['Sucursales_banca_comercial_10mil_adultos', 
-                       'Sucursales_banca_desarrollo_10mil_adultos', 
-                       'Sucursales_cooperativas_10mil_adultos', 
-                       'Sucursales_microfinancieras_10mil_adultos']
-institution_data = df[institution_columns]
-
-institution_colors = {
-    'Sucursales_banca_comercial_10mil_adultos': '#1f77b4',
-    'Sucursales_banca_desarrollo_10mil_adultos': '#ff7f0e',
-    'Sucursales_cooperativas_10mil_adultos': '#2ca02c',
-    'Sucursales_microfinancieras_10mil_adultos': '#d62728'
-}
-
-institution_view = st.radio('Select view', ['Individual institutions', 'Total branches'])
-
-institution_labels = {
-    'Sucursales_banca_comercial_10mil_adultos': 'Commercial banks',
-    'Sucursales_banca_desarrollo_10mil_adultos': 'Development banks',
-    'Sucursales_cooperativas_10mil_adultos': 'Cooperatives',
-    'Sucursales_microfinancieras_10mil_adultos': 'Microfinance institutions',
-    'variable': 'Institution type'
-}
-
-if institution_view == 'Individual institutions':
-    selected_institution = st.selectbox('Select institution type', 
-                                      institution_columns,
-                                      format_func=lambda x: institution_labels[x])
-    fig = px.bar(df.sort_values(selected_institution, ascending=False), 
-                 y=selected_institution,
-                 title=f'{institution_labels[selected_institution]} per 10,000 adults',
-                 color_discrete_sequence=[institution_colors[selected_institution]],
-                 labels={
-                     selected_institution: institution_labels[selected_institution],
-                     "variable": ""  # This removes the "Institution type" label
-                 })
-    fig.update_layout(
-        xaxis_title='state', 
-        yaxis_title='branches per 10,000 adults', 
-        height=700,
-        width=1200,
-        showlegend=False,  # This hides the legend for individual view
-        margin=dict(l=50, r=300, t=80, b=200),
-        xaxis_tickangle=-45
-    )
-    st.plotly_chart(fig)
-else:
-    df['Total_Branches'] = institution_data.sum(axis=1)
-    
-    # Create a new DataFrame with renamed columns for plotting
-    plot_data = df[institution_columns].copy()
-    plot_data.columns = [institution_labels[col] for col in institution_columns]
-    
-    fig = px.bar(plot_data.sort_values('Commercial banks', ascending=False), 
-                 y=list(institution_labels.values())[:4],  # Only take the first 4 values (excluding 'variable')
-                 title='Total financial institution branches per 10,000 adults',
-                 color_discrete_map={
-                     'Commercial banks': '#1f77b4',
-                     'Development banks': '#ff7f0e',
-                     'Cooperatives': '#2ca02c',
-                     'Microfinance institutions': '#d62728'
-                 })
-    fig.update_layout(
-        xaxis_title='state', 
-        yaxis_title='branches per 10,000 adults', 
-        barmode='stack', 
-        height=700,
-        legend=dict(
-            orientation="v",
-            yanchor="top",
-            y=1,
-            xanchor="left",
-            x=1.02,
-            font=dict(size=10)
-        ),
-        margin=dict(l=50, r=300, t=80, b=200),
-        xaxis_tickangle=-45
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-# 7. Relationships between Various Indicators and Financial Inclusion
-st.header('7. Relationships between various indicators and financial inclusion index')
-df['FI_Index'] = (
-    df['Sucursales_banca_comercial_10mil_adultos'] + 
-    df['Cajeros_10mil_adultos'] + 
-    df['Corresponsales_10mil_adultos'] +
-    df[account_columns].sum(axis=1) / 1000 +
-    df[credit_columns].sum(axis=1) / 1000
-) / 5
-
-df['Poblacion'] = df['Poblacion'].fillna(df['Poblacion'].median())
-
-indicators = [
-    'TPV_10mil_adultos', 
-    'Sucursales_banca_comercial_10mil_adultos', 
-    'Cajeros_10mil_adultos', 
-    'Corresponsales_10mil_adultos', 
-    'Contratos_celular_10mil_adultos'
-]
-
-indicator_labels = {
-    'TPV_10mil_adultos': 'POS',
-    'Sucursales_banca_comercial_10mil_adultos': 'Commercial bank branches', 
-    'Cajeros_10mil_adultos': 'ATMs',
-    'Corresponsales_10mil_adultos': 'Banking agents',
-    'Contratos_celular_10mil_adultos': 'Mobile banking contracts'
-}
-
-for indicator in indicators:
-    fig = px.scatter(
-        df, 
-        x=indicator, 
-        y='FI_Index', 
-        size='Poblacion', 
-        hover_name=df.index, 
-        labels={
-            indicator: f'{indicator_labels[indicator]} per 10,000 adults', 
-            'FI_Index': 'Financial Inclusion Index',
-            'Poblacion': 'Population'
-        },
-        title=f'Relationship between {indicator_labels[indicator]} and Financial Inclusion Index; size = population'
-    )
-    st.plotly_chart(fig)
-
-    correlation = df[indicator].corr(df['FI_Index'])
-    st.write(f"*Correlation between {indicator_labels[indicator]} and Financial Inclusion Index: {correlation:.2f}*")
-
-# 8. Top and Bottom States in Financial Inclusion
-st.header('8. Financial Inclusion Index by state')
-
-# Filter out "Sin identificar"
-df_filtered = df[df.index != 'Sin identificar']
-
-top_3_fi = df_filtered['FI_Index'].nlargest(3)
-bottom_3_fi = df_filtered['FI_Index'].nsmallest(3)
-
-st.write("Top 3 states with highest financial inclusion:")
-st.write(top_3_fi)
-st.write("Bottom 3 states with lowest financial inclusion:")
-st.write(bottom_3_fi)
-
-# Add bar chart for all states (excluding "Sin identificar")
-fig = px.bar(df_filtered.sort_values('FI_Index', ascending=False), 
-             y='FI_Index',
-             title='Financial Inclusion Index by state',
-             color_discrete_sequence=['#90EE90'])  # Light green color
-
-fig.update_layout(
-    xaxis_title='State',
-    yaxis_title='Financial Inclusion Index',
-    height=600,
-    xaxis_tickangle=-45,
-    showlegend=False
-)
-
-st.plotly_chart(fig)
-
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-
-@st.cache_data
-def load_data():
-    df = pd.read_csv("Base_de_Datos_de_Inclusion_Financiera_202406 - Hoja 1.csv")
-    return df
-
-df = load_data()
-
-year_col = "Periodo_Año"
-quarter_col = "Periodo_Trimestre"
-
-# Filter data according to rules:
-df_filtered = pd.DataFrame()
-for year in df[year_col].unique():
-    if year == 2024:
-        df_year = df[(df[year_col] == year) & (df[quarter_col] == "2T")]
+            show_chart(chart, source, version, **params)
+
+    def municipal_drilldown(y, key, title, yaxis_title, labels=None, colors=None, index=None, version=None):
+        """Bar chart (or, for one metric in map view, map) of the municipalities
+        of the state picked in the drill-down selectbox."""
+        state = select_drilldown_state(key)
+        if state is None:
+            return
+        if map_view and len(y) == 1 and geo.available('municipal'):
+            show_chart('municipal_map', index or load_municipal_index(),
+                       f"{version or versions['municipal']}:{geo_versions['municipal']}", use_container_width=True,
+                       state=state_keys[state], state_name=state, metric=y[0], title=title, colorbar_title=yaxis_title)
+            return
+        show_chart('municipal_bars', index or load_municipal_index(), version or versions['municipal'],
+                   use_container_width=True,
+                   state=state_keys[state], state_name=state, y=y, title=title, yaxis_title=yaxis_title,
+                   labels=labels, colors=colors)
+
+    st.title('Financial Inclusion Analysis - Mexico, June 2024')
+
+    # With the state boundaries installed (see inclusion.geo), single-metric state
+    # comparisons can be shown as choropleths instead of 32 bars
+    map_view = geo.available('state') and st.radio('Compare states as', ['Bars', 'Map'], horizontal=True,
+                                                   key='state_view') == 'Map'
+    geo_versions = {layer: geo.layer_version(layer) for layer in geo.LAYERS}
+
+    # 1. Population Demographics
+    section('1. Population demographics')
+    show_chart('population', df, versions['state'])
+
+    # 2. Banking Infrastructure Availability
+    section('2. Banking infrastructure availability')
+
+    # Filtered views aren't in inclusion.catalog: they are built on first use
+    rollup = load_rollup_cube()
+    region_column, type_column = st.columns(2)
+    filter_region = region_column.selectbox('Region (sections 2-6)', [ALL] + rollup.regions, key='filter_region')
+    filter_type = type_column.selectbox('Population type (sections 2-6)', [ALL] + rollup.types, key='filter_type')
+    with timed('pandas'):
+        df_sections, sections_version = filtered_states(filter_region, filter_type)
+    if filter_type != ALL:
+        st.caption(f'{filter_type} municipalities only: rates per 10,000 adults of those municipalities, '
+                   'which differ from the published state figures.')
+
+    selected_metric = st.selectbox('Select infrastructure type:', 
+                                 list(infrastructure_metrics.keys()),
+                                 format_func=lambda x: infrastructure_labels[x],
+                                 key='infrastructure')
+
+    state_comparison('infrastructure', df_sections, sections_version, selected_metric,
+                     title=f'{infrastructure_labels[selected_metric]} per 10,000 Adults',
+                     colorbar_title='per 10,000 adults', metric=selected_metric)
+    municipal_drilldown([selected_metric], 'infrastructure',
+                        title=f'{infrastructure_labels[selected_metric]} per 10,000 Adults',
+                        yaxis_title='number per 10,000 adults',
+                        colors=[infrastructure_metrics[selected_metric]])
+
+    # 3. Account Ownership by Type
+    section('3. Account ownership by type')
+
+    view_type = st.radio('Select view type', ['Absolute numbers', 'Percentage'])
+
+    show_chart('accounts', df_sections, sections_version, use_container_width=True, view_type=view_type)
+    municipal_drilldown(account_columns, 'accounts',
+                        title='Account ownership by type per 10,000 adults',
+                        yaxis_title='accounts per 10,000 adults',
+                        labels=account_labels)
+
+    # 4. Credit Product Penetration
+    section('4. Credit product penetration')
+    show_chart('credit', df_sections, sections_version, use_container_width=True)
+    municipal_drilldown(credit_columns, 'credit',
+                        title='Credit product penetration per 10,000 adults',
+                        yaxis_title='credits per 10,000 adults',
+                        labels=credit_labels)
+
+    # 5. Mobile Banking Adoption
+    section('5. Mobile banking adoption')
+    state_comparison('mobile', df_sections, sections_version, 'Mobile_Banking_Penetration',
+                     title='Mobile banking adoption by state', colorbar_title='contracts per adult')
+    municipal_drilldown(['Mobile_Banking_Penetration'], 'mobile',
+                        title='Mobile banking adoption',
+                        yaxis_title='mobile banking contracts per adult')
+
+    # 6. Comparison of different financial institutions
+    section('6. Comparison of different financial institutions')
+
+    institution_view = st.radio('Select view', ['Individual institutions', 'Total branches'])
+
+    if institution_view == 'Individual institutions':
+        selected_institution = st.selectbox('Select institution type', 
+                                          institution_columns,
+                                          format_func=lambda x: institution_labels[x])
+        state_comparison('institution', df_sections, sections_version, selected_institution,
+                         title=f'{institution_labels[selected_institution]} per 10,000 adults',
+                         colorbar_title='branches per 10,000 adults', column=selected_institution)
+        municipal_drilldown([selected_institution], 'institutions',
+                            title=f'{institution_labels[selected_institution]} per 10,000 adults',
+                            yaxis_title='branches per 10,000 adults',
+                            colors=[institution_colors[selected_institution]])
     else:
-        df_year = df[(df[year_col] == year) & (df[quarter_col] == "4T")]
-    df_filtered = pd.concat([df_filtered, df_year], ignore_index=True)
-
-df_filtered = df_filtered.sort_values(by=year_col)
-
-# Convert year to string for categorical x-axis in bar charts
-df_filtered[year_col] = df_filtered[year_col].astype(str)
-
-# Adjust column selections (modify indices as per your actual data structure)
-infrastructure_cols = df_filtered.columns[3:11]
-infra_map = {
-    "Branches": infrastructure_cols[0],
-    "ATMs": infrastructure_cols[1],
-    "POS": infrastructure_cols[2],
-    "Places with POS": infrastructure_cols[3],
-    "Banking agents (corresponsales)": infrastructure_cols[4],
-    "Mobile banking contracts": infrastructure_cols[5],
-    "Transactions in ATMs": infrastructure_cols[6],
-    "Transactions in POS": infrastructure_cols[7]
-}
-
-captacion_types = df_filtered.columns[11:18]
-captacion_total = df_filtered.columns[18]
-captacion_map = {
-    "Ahorro": captacion_types[0],
-    "Plazo": captacion_types[1],
-    "N1": captacion_types[2],
-    "N2": captacion_types[3],
-    "N3": captacion_types[4],
-    "Tradicionales": captacion_types[5],
-    "Simplificadas": captacion_types[6],
-    "Total": captacion_total
-}
-
-credit_start_col = "Crédito\nBanca_Tarjeta de crédito"
-credit_end_col = "Crédito\nBanca_Total"
-credit_cols = df_filtered.loc[:, credit_start_col:credit_end_col].columns[:-1]
-credit_total_col = df_filtered.loc[:, credit_start_col:credit_end_col].columns[-1]
-
-credit_map = {}
-for c in credit_cols:
-    short_label = c.replace("Crédito\nBanca_", "").strip()
-    credit_map[short_label] = c
-credit_map["Total"] = credit_total_col
-
-# EACP Captación mapping
-captacion_eacp_cols = df_filtered.columns[19:23]  # Columns T to W
-captacion_eacp_map = {
-    "Ahorro EACP": captacion_eacp_cols[0],
-    "Plazo EACP": captacion_eacp_cols[1],
-    "Otras EACP": captacion_eacp_cols[2],
-    "Total EACP": captacion_eacp_cols[3]
-}
-
-# EACP Crédito mapping
-credito_eacp_cols = df_filtered.columns[31:37]  # Columns AF to AK
-credito_eacp_map = {}
-for c in credito_eacp_cols[:-1]:  # Exclude the total
-    short_label = c.replace("Crédito\nEACP_", "").strip()
-    credito_eacp_map[short_label] = c
-credito_eacp_map["Total"] = credito_eacp_cols[-1]  # Add total separately
-
-st.title("Financial Inclusion Analysis - Mexico, historical data")
-
-###################################
-# Infrastructure (Single Dropdown)
-###################################
-st.header("Infrastructure trends")
-infra_choice = st.selectbox("Select type of infrastructure:", list(infra_map.keys()), index=0)
-
-infra_col = infra_map[infra_choice]
-infra_df = df_filtered[[year_col, infra_col]].copy()
-# Single type: just show a bar chart with year on x and the value on y
-fig_infra = px.bar(infra_df, x=year_col, y=infra_col, 
-                   title=f"Infrastructure: {infra_choice}", 
-                   color_discrete_sequence=["#CCCCCC"])  # Changed to light grey
-fig_infra.update_layout(
-    barmode='group',
-    xaxis_title='year',
-    yaxis_title='number of units'
-)
-st.plotly_chart(fig_infra, use_container_width=True)
-
-###################################
-# Captación (Single Dropdown)
-###################################
-st.header("Trends for 'Captación' - Banca")
-capt_choice = st.selectbox("Select a type of 'Captación' (or total):", list(captacion_map.keys()), index=0)
-
-if capt_choice == "Total":
-    # Use total column directly (column S)
-    capt_total_df = df_filtered[[year_col, captacion_total]].copy()
-    fig_capt = px.bar(capt_total_df, x=year_col, y=captacion_total, 
-                      title="Total Captación Banca",
-                      color_discrete_sequence=["#1f77b4"])
-    fig_capt.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of accounts'
-    )
-    st.plotly_chart(fig_capt, use_container_width=True)
-    st.markdown("""
-        **Note:** The total is composed of:
-        - Ahorro (Savings)
-        - Plazo (Term deposits)
-        - Tradicionales (Traditional)
-        - Simplificadas (Simplified)
-        
-        Where N1, N2, and N3 accounts make up the Simplified accounts category.
-    """)
-else:
-    # Single type chart remains the same
-    capt_col = captacion_map[capt_choice]
-    capt_df = df_filtered[[year_col, capt_col]].copy()
-    fig_capt = px.bar(capt_df, x=year_col, y=capt_col, 
-                      title=f"Captación: {capt_choice}",
-                      color_discrete_sequence=["#1f77b4"])
-    fig_capt.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of accounts'
-    )
-    st.plotly_chart(fig_capt, use_container_width=True)
-
-###################################
-# Captación EACP (Single Dropdown)
-###################################
-st.header("Trends for 'Captación' - Entidades de Ahorro y Crédito Popular")
-capt_eacp_choice = st.selectbox("Select a type of 'Captación' (or total):", list(captacion_eacp_map.keys()), index=0)
-
-if capt_eacp_choice == "Total EACP":
-    # Use column W directly
-    capt_eacp_total_df = df_filtered[[year_col, captacion_eacp_map["Total EACP"]]].copy()
-    fig_capt_eacp = px.bar(capt_eacp_total_df, x=year_col, y=captacion_eacp_map["Total EACP"],
-                          title="Total Captación EACP",
-                          color_discrete_sequence=['#2ca02c'])
-    fig_capt_eacp.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of accounts'
-    )
-    st.plotly_chart(fig_capt_eacp, use_container_width=True)
-else:
-    # Single type remains the same
-    capt_eacp_col = captacion_eacp_map[capt_eacp_choice]
-    capt_eacp_df = df_filtered[[year_col, capt_eacp_col]].copy()
-    fig_capt_eacp = px.bar(capt_eacp_df, x=year_col, y=capt_eacp_col,
-                          title=f"Captación EACP: {capt_eacp_choice}",
-                          color_discrete_sequence=['#2ca02c'])
-    fig_capt_eacp.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of accounts'
-    )
-    st.plotly_chart(fig_capt_eacp, use_container_width=True)
-
-###################################
-# Crédito (Single Dropdown)
-###################################
-st.header("Trends for 'Crédito' - Banca")
-credit_choice = st.selectbox("Select a type of 'Crédito' (or total):", list(credit_map.keys()), index=0)
-
-if credit_choice == "Total":
-    # Use column AE directly
-    credit_total_df = df_filtered[[year_col, credit_total_col]].copy()
-    fig_credit = px.bar(credit_total_df, x=year_col, y=credit_total_col,
-                       title="Total Crédito Banca",
-                       color_discrete_sequence=["#1f77b4"])
-    fig_credit.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of credits'
-    )
-    st.plotly_chart(fig_credit, use_container_width=True)
-else:
-    # Single type remains the same
-    credit_col = credit_map[credit_choice]
-    credit_df = df_filtered[[year_col, credit_col]].copy()
-    fig_credit = px.bar(credit_df, x=year_col, y=credit_col,
-                       title=f"Crédito: {credit_choice}",
-                       color_discrete_sequence=["#1f77b4"])
-    fig_credit.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of credits'
-    )
-    st.plotly_chart(fig_credit, use_container_width=True)
-
-###################################
-# Crédito EACP (Single Dropdown)
-###################################
-st.header("Trends for 'Crédito' - Entidades de Ahorro y Crédito Popular")
-# Modify the map to only include AF to AI and total AJ
-credito_eacp_map = {}
-for c in credito_eacp_cols[0:4]:  # Only take AF to AI
-    short_label = c.replace("Crédito\nEACP_", "").strip() + " EACP"
-    credito_eacp_map[short_label] = c
-credito_eacp_map["Total EACP"] = credito_eacp_cols[-2]  # Add AJ as total
-
-credit_eacp_choice = st.selectbox("Select a type of 'Crédito' (or total):", list(credito_eacp_map.keys()), index=0)
-
-if credit_eacp_choice == "Total EACP":
-    # Use column AJ directly
-    credit_eacp_total_col = credito_eacp_cols[-2]  # This is column AJ
-    credit_eacp_total_df = df_filtered[[year_col, credit_eacp_total_col]].copy()
-    fig_credit_eacp = px.bar(credit_eacp_total_df, x=year_col, y=credit_eacp_total_col,
-                            title="Total Crédito EACP",
-                            color_discrete_sequence=['#2ca02c'])
-    fig_credit_eacp.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of credits'
-    )
-    st.plotly_chart(fig_credit_eacp, use_container_width=True)
-else:
-    # Single type remains the same
-    credit_eacp_col = credito_eacp_map[credit_eacp_choice]
-    credit_eacp_df = df_filtered[[year_col, credit_eacp_col]].copy()
-    fig_credit_eacp = px.bar(credit_eacp_df, x=year_col, y=credit_eacp_col,
-                            title=f"Crédito: {credit_eacp_choice}",
-                            color_discrete_sequence=['#2ca02c'])
-    fig_credit_eacp.update_layout(
-        xaxis_title='year',
-        yaxis_title='number of credits'
-    )
-    st.plotly_chart(fig_credit_eacp, use_container_width=True)
-
-###################################
-# Gender Analysis - Cards
-###################################
-st.header("Gender Analysis - Debit and Credit Cards")
-
-# Filter data according to rules (4T except 2024 which is 2T)
-df_gender = pd.DataFrame()
-for year in df[year_col].unique():
-    if year == 2024:
-        df_year = df[(df[year_col] == year) & (df[quarter_col] == "2T")]
+        show_chart('institutions_total', df_sections, sections_version, use_container_width=True)
+        municipal_drilldown(institution_columns, 'institutions',
+                            title='Total financial institution branches per 10,000 adults',
+                            yaxis_title='branches per 10,000 adults',
+                            labels=institution_labels,
+                            colors=[institution_colors[col] for col in institution_columns])
+
+    # 7. Relationships between Various Indicators and Financial Inclusion
+    section('7. Relationships between various indicators and financial inclusion index')
+
+    with st.expander('Customize the index'):
+        st.write('By default the index is the average of commercial bank branches, ATMs and banking agents per 10,000 adults '
+                 'plus the account and credit totals per 10,000 adults divided by 1000.')
+        fi_normalization = st.selectbox('Normalize components', ['none', 'minmax', 'zscore'],
+                                        format_func=lambda x: {'none': 'No normalization',
+                                                               'minmax': 'Min-max (0 to 1)',
+                                                               'zscore': 'Z-score'}[x])
+        fi_weights = {group: st.slider(f'Weight: {group}', 0.0, 1.0, 1.0, 0.1, key=f'fi_weight_{group}')
+                      for group in COMPONENT_GROUPS}
+
+    if sum(fi_weights.values()) > 0:
+        fi_spec = spec_from_groups(fi_weights, fi_normalization)
     else:
-        df_year = df[(df[year_col] == year) & (df[quarter_col] == "4T")]
-    df_gender = pd.concat([df_gender, df_year], ignore_index=True)
-
-# Create DataFrames for debit and credit cards
-debit_data = pd.DataFrame({
-    'Year': df_gender[year_col],
-    'Women': df_gender.iloc[:, 46].str.replace(',', '').astype(float),
-    'Men': df_gender.iloc[:, 47].str.replace(',', '').astype(float)
-})
-
-credit_data = pd.DataFrame({
-    'Year': df_gender[year_col],
-    'Women': df_gender.iloc[:, 49].str.replace(',', '').astype(float),
-    'Men': df_gender.iloc[:, 50].str.replace(',', '').astype(float)
-})
-
-# Filter from 2018 onwards and sort
-debit_data = debit_data[debit_data['Year'] >= 2018].sort_values('Year')
-credit_data = credit_data[credit_data['Year'] >= 2018].sort_values('Year')
-
-# Calculate percentages for debit cards
-debit_data['Total'] = debit_data['Men'] + debit_data['Women']
-debit_data['Men %'] = (debit_data['Men'] / debit_data['Total'] * 100).round(1)
-debit_data['Women %'] = (debit_data['Women'] / debit_data['Total'] * 100).round(1)
-
-# Calculate percentages for credit cards
-credit_data['Total'] = credit_data['Men'] + credit_data['Women']
-credit_data['Men %'] = (credit_data['Men'] / credit_data['Total'] * 100).round(1)
-credit_data['Women %'] = (credit_data['Women'] / credit_data['Total'] * 100).round(1)
-
-# Debit Cards Analysis
-st.subheader("Debit cards by gender")
-
-# Line chart for debit cards (separate lines for men and women)
-fig_debit_line = px.line(debit_data, x='Year', y=['Women', 'Men'],
-                    title='Debit cards by gender over time',
-                    color_discrete_map={'Women': '#ff7f0e', 'Men': '#1f77b4'})
-fig_debit_line.update_layout(
-    xaxis_title='year',
-    yaxis_title='number of cards',
-    legend_title='gender'
-)
-st.plotly_chart(fig_debit_line, use_container_width=True)
-
-# Stacked bar chart for debit cards (percentages)
-fig_debit_bar = px.bar(debit_data, x='Year', y=['Women %', 'Men %'],
-                       title='Debit cards by gender over time (% distribution)',
-                       color_discrete_map={'Women %': '#ff7f0e', 'Men %': '#1f77b4'})
-fig_debit_bar.update_layout(
-    xaxis_title='year',
-    yaxis_title='percentage',
-    barmode='stack',
-    legend_title='gender',
-    yaxis_range=[0, 100]  # Force y-axis to be 0-100%
-)
-st.plotly_chart(fig_debit_bar, use_container_width=True)
-
-# Credit Cards Analysis
-st.subheader("Credit cards by gender")
-
-# Line chart for credit cards (separate lines for men and women)
-fig_credit_line = px.line(credit_data, x='Year', y=['Women', 'Men'],
-                     title='Credit cards by gender over time',
-                     color_discrete_map={'Women': '#ff7f0e', 'Men': '#1f77b4'})
-fig_credit_line.update_layout(
-    xaxis_title='year',
-    yaxis_title='number of cards',
-    legend_title='gender'
-)
-st.plotly_chart(fig_credit_line, use_container_width=True)
-
-# Stacked bar chart for credit cards (percentages)
-fig_credit_bar = px.bar(credit_data, x='Year', y=['Women %', 'Men %'],
-                        title='Credit cards by gender over time (% distribution)',
-                        color_discrete_map={'Women %': '#ff7f0e', 'Men %': '#1f77b4'})
-fig_credit_bar.update_layout(
-    xaxis_title='year',
-    yaxis_title='percentage',
-    barmode='stack',
-    legend_title='gender',
-    yaxis_range=[0, 100]  # Force y-axis to be 0-100%
-)
-st.plotly_chart(fig_credit_bar, use_container_width=True)
-# Footer
-st.markdown(
-    'Made by [Valentin Mendez](https://www.linkedin.com/in/valentemendez/) using information from the [CNBV](https://datos.gob.mx/busca/organization/2a93da6c-8c17-4671-a334-984536ac9d61?tags=inclusion)'
-)
-
-# Hide the "Made with Streamlit" footer
-hide_streamlit_style = """
+        st.warning('All weights are zero; showing the default index.')
+        fi_spec = DEFAULT_SPEC
+
+    # The index, and every chart that shows it, is versioned by the data and the spec
+    with timed('pandas'):
+        df['FI_Index'] = state_index_engine().evaluate(fi_spec)
+        municipal_fi = load_municipal_index().overlay({'FI_Index': municipal_index_engine().evaluate(fi_spec)})
+    fi_version = f"{versions['state']}:{fi_spec.key()}"
+    municipal_fi_version = f"{versions['municipal']}:{fi_spec.key()}"
+
+    # What-if simulator for the current index spec, shared by every session
+    @st.cache_resource
+    def whatif_simulator(spec_key, _spec):
+        return Simulator(load_data(), _spec, municipal=load_municipal_index().frame)
+
+    # Correlation and regression stats for every indicator, computed once per index spec
+    @st.cache_data
+    def indicator_correlations(spec_key, _spec):
+        engine = state_index_engine()
+        frame = engine.frame[indicators].assign(FI_Index=engine.evaluate(_spec))
+        return correlation_table(frame, indicators, ['FI_Index']).set_index('indicator')
+
+    with timed('pandas'):
+        correlations = indicator_correlations(fi_spec.key(), fi_spec)
+    correlation_summary = correlations.rename(index=indicator_labels)[
+        ['pearson_r', 'pearson_p', 'spearman_rho', 'spearman_p', 'slope']
+    ].rename(columns={
+        'pearson_r': 'Pearson r',
+        'pearson_p': 'Pearson p-value',
+        'spearman_rho': 'Spearman ρ',
+        'spearman_p': 'Spearman p-value',
+        'slope': 'Slope'
+    })
+    correlation_summary.index.name = 'Indicator'
+    st.dataframe(correlation_summary.style.format({
+        'Pearson r': '{:.2f}',
+        'Pearson p-value': '{:.2g}',
+        'Spearman ρ': '{:.2f}',
+        'Spearman p-value': '{:.2g}',
+        'Slope': '{:.4g}'
+    }))
+
+    # Only the scatter the user is looking at gets built and sent to the browser
+    scatter_view = st.radio('Scatter plots', ['One indicator at a time', 'All indicators (faceted)'])
+
+    if scatter_view == 'One indicator at a time':
+        indicator = st.selectbox('Select indicator', indicators,
+                                 format_func=lambda x: indicator_labels[x],
+                                 key='relationship_indicator')
+        show_chart('relationship', df, fi_version, indicator=indicator)
+
+        correlation = correlations.loc[indicator, 'pearson_r']
+        st.write(f"*Correlation between {indicator_labels[indicator]} and Financial Inclusion Index: {correlation:.2f}*")
+    else:
+        show_chart('relationships_faceted', df, fi_version, use_container_width=True)
+
+    drilldown_state = select_drilldown_state('relationships')
+    if drilldown_state is not None:
+        drilldown_indicator = st.selectbox('Indicator', indicators,
+                                           format_func=lambda x: indicator_labels[x],
+                                           key='drilldown_relationships_indicator')
+        show_chart('municipal_relationship', municipal_fi, municipal_fi_version,
+                   state=state_keys[drilldown_state], state_name=drilldown_state, indicator=drilldown_indicator)
+
+    # 8. Top and Bottom States in Financial Inclusion
+    section('8. Financial Inclusion Index by state')
+
+    with timed('pandas'):
+        # Filter out "Sin identificar"
+        df_filtered = df[df.index != 'Sin identificar']
+        top_3_fi, bottom_3_fi = ranking(df_filtered['FI_Index'])
+
+    st.write("Top 3 states with highest financial inclusion:")
+    st.write(top_3_fi)
+    st.write("Bottom 3 states with lowest financial inclusion:")
+    st.write(bottom_3_fi)
+
+    # Add bar chart for all states (excluding "Sin identificar")
+    state_comparison('fi_ranking', df_filtered, fi_version, 'FI_Index',
+                     title='Financial Inclusion Index by state', colorbar_title='FI Index')
+    municipal_drilldown(['FI_Index'], 'fi_index',
+                        title='Financial Inclusion Index',
+                        yaxis_title='Financial Inclusion Index',
+                        colors=['#90EE90'],
+                        index=municipal_fi,
+                        version=municipal_fi_version)
+
+    # Units a what-if can add, by the density column they raise
+    WHATIF_UNITS = {
+        'Corresponsales_10mil_adultos': 'banking agents',
+        'Cajeros_10mil_adultos': 'ATMs',
+        'Sucursales_banca_comercial_10mil_adultos': 'commercial bank branches',
+    }
+
+    with st.expander('What if: add infrastructure to a state'):
+        whatif_state = st.selectbox('State', list(state_keys), key='whatif_state')
+        whatif_type = st.selectbox('Only in municipalities of type', ['(all)'] + peer_index().types, key='whatif_type')
+        whatif_allocation = st.radio('Split between municipalities', ALLOCATIONS, horizontal=True,
+                                     format_func=lambda x: {'population': 'By adult population', 'even': 'Evenly'}[x],
+                                     key='whatif_allocation')
+        whatif_columns = st.columns(len(WHATIF_UNITS))
+        whatif_counts = {column: whatif_columns[i].number_input(f'New {label}', 0, 100000, 0, step=10,
+                                                                key=f'whatif_{column}')
+                         for i, (column, label) in enumerate(WHATIF_UNITS.items())}
+        scenario = [Addition(column, count, state_keys[whatif_state],
+                             None if whatif_type == '(all)' else whatif_type, whatif_allocation)
+                    for column, count in whatif_counts.items() if count > 0]
+        if scenario:
+            simulator = whatif_simulator(fi_spec.key(), fi_spec)
+            try:
+                with timed('pandas'):
+                    whatif = simulator.run([scenario]).states(0)
+                    allocation = pd.concat([simulator.municipal_allocation(addition).set_index('Municipio')
+                                            .rename(columns={'units': f'New {WHATIF_UNITS[addition.column]}'})
+                                            .drop(columns=[addition.column]) for addition in scenario], axis=1)
+                    allocation = allocation.loc[:, ~allocation.columns.duplicated()]
+            except ValueError:
+                st.warning(f'{whatif_state} has no municipalities of type {whatif_type}.')
+            else:
+                row = whatif.loc[whatif_state]
+                st.write(f"Financial Inclusion Index of {whatif_state}: {row['FI_Index']:.2f} → {row['FI_Index_after']:.2f} "
+                         f"(rank {row['rank']} → {row['rank_after']})")
+                moved = whatif[whatif['rank_change'] != 0]
+                if len(moved):
+                    st.write('States whose rank changes:')
+                    st.dataframe(moved[['FI_Index', 'FI_Index_after', 'rank', 'rank_after', 'rank_change']]
+                                 .sort_values('rank_after'))
+                else:
+                    st.write('No state changes rank.')
+                st.write(f'How the new units split between the municipalities of {whatif_state}:')
+                st.dataframe(allocation)
+
+    # 9. Peer municipalities
+    section('9. Peer municipalities')
+
+    st.write('Municipalities with the most similar branch, ATM, agent, POS, account and credit densities '
+             '(distance in standard deviations over the per-10,000-adults indicators).')
+    peer_state = st.selectbox('State', list(state_keys), key='peer_state')
+    state_municipalities = load_municipal_index().slice(state_keys[peer_state], columns=['Clave_Municipio', 'Municipio'])
+    municipality_names = dict(zip(state_municipalities['Clave_Municipio'], state_municipalities['Municipio']))
+    peer_of = st.selectbox('Municipality', sorted(municipality_names, key=municipality_names.get),
+                           format_func=municipality_names.get, key='peer_municipality')
+    peer_count_col, peer_type_col = st.columns(2)
+    peer_count = peer_count_col.slider('Number of peers', 5, 25, 10, key='peer_count')
+    peer_type = peer_type_col.selectbox('Population type', ['(any)'] + peer_index().types, key='peer_type')
+
+    with timed('pandas'):
+        peers = peer_index().query(peer_of, peer_count, None if peer_type == '(any)' else peer_type)
+        state_names = {clave: name for name, clave in state_keys.items()}
+        peer_table = peers.assign(State=peers['Clave_Estado'].map(state_names)).set_index('Municipio')[
+            ['State', TYPE_COL, 'distance'] + indicators
+        ].rename(columns={TYPE_COL: 'Population type', 'distance': 'Distance', **indicator_labels})
+    st.dataframe(peer_table.style.format({'Distance': '{:.2f}', **{indicator_labels[col]: '{:.1f}' for col in indicators}}))
+
+    # Footer
+    st.markdown(
+        'Made by [Valentin Mendez](https://www.linkedin.com/in/valentemendez/) using information from the [CNBV](https://datos.gob.mx/busca/organization/2a93da6c-8c17-4671-a334-984536ac9d61?tags=inclusion)'
+    )
+
+    # Hide the "Made with Streamlit" footer
+    hide_streamlit_style = """
 <style>
 footer {visibility: hidden;}
 </style>
 """
 
-st.markdown(hide_streamlit_style, unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+
+# After the body, so interrupted and failed reruns are recorded too
+if debug:
+    debug_panel(profile.rerun)
+    st.json({'warmup': warmup.status()})
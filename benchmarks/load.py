@@ -0,0 +1,397 @@
+"""Load test: N concurrent dashboard sessions against a local Streamlit server.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.load                                  # starts app.py on a free port
+    python -m benchmarks.load --sessions 1 4 16 32 --duration 30 --json load.json
+    python -m benchmarks.load --port 8501 --pid 1234           # an already running server
+    python -m benchmarks.load --scripts my_scripts.json --think 2
+
+Each session is a WebSocket client speaking Streamlit's browser protocol: it
+loads a page, then replays an interaction script (pick a metric, drill into a
+state, switch pages, ...), timing every rerun from the moment the widget
+change is sent to the server's script_finished message. The sessions of a
+level run concurrently for --duration seconds, looping over their script;
+the levels run one after the other, so the report shows how latency grows
+with concurrency:
+
+    sessions  reruns  errors  p50/p95/p99 ms  reruns/s  server CPU %  RSS MB  (peak)  client CPU %
+
+CPU and RSS come from /proc for the server process and its children
+(--pid for one not started here); the client's own CPU is listed since it
+shares the machine. Nothing leaves localhost.
+
+A script is a list of steps, each a page ('' for the main page,
+'Historical_data') and the widgets to set, by label (the whole label, else a
+substring; '#n' picks the n-th widget with that label) and value: an option index (or 'random')
+for selectboxes and radios, true/false for checkboxes, a number for sliders::
+
+    {"name": "drilldown", "steps": [
+        {"page": ""},
+        {"page": "", "widgets": {"Drill down into a state's municipalities#0": "random"}}]}
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = [
+    {'name': 'state overview', 'steps': [
+        {'page': ''},
+        {'page': '', 'widgets': {'Select infrastructure type': 'random'}},
+        {'page': '', 'widgets': {'Region (sections 2-6)': 'random', 'Population type (sections 2-6)': 'random'}},
+        {'page': '', 'widgets': {'Select view type': 1}},
+        {'page': '', 'widgets': {'Select view': 1}},
+        {'page': '', 'widgets': {'Select indicator': 'random'}},
+        {'page': '', 'widgets': {'Normalize components': 'random'}},
+    ]},
+    {'name': 'drill-down', 'steps': [
+        {'page': ''},
+        {'page': '', 'widgets': {"Drill down into a state's municipalities#0": 'random'}},
+        {'page': '', 'widgets': {"Drill down into a state's municipalities#0": 'random'}},
+        {'page': '', 'widgets': {"Drill down into a state's municipalities#4": 'random'}},
+        {'page': '', 'widgets': {'State#1': 'random'}},
+    ]},
+    {'name': 'historical', 'steps': [
+        {'page': 'Historical_data'},
+        {'page': 'Historical_data', 'widgets': {'Select type of infrastructure': 'random'}},
+        {'page': 'Historical_data', 'widgets': {"'Captación' (or total)#0": 'random'}},
+        {'page': 'Historical_data', 'widgets': {"'Crédito' (or total)#0": 'random'}},
+        {'page': ''},
+    ]},
+]
+
+# Widget protos whose value is an option index
+_INDEXED = ('selectbox', 'radio')
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    # Nearest rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+###################################
+# /proc sampling
+###################################
+
+_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            kids = [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+    return kids + [k for kid in kids for k in _children(kid)]
+
+
+def process_sample(pid):
+    """CPU seconds, RSS and peak RSS (bytes) of `pid` and its children."""
+    cpu = rss = peak = 0
+    for p in [pid] + _children(pid):
+        try:
+            with open(f'/proc/{p}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{p}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            continue  # exited meanwhile
+        cpu += (int(fields[11]) + int(fields[12])) / _TICKS
+        rss += int(status.get('VmRSS', '0 kB').split()[0]) * 1024
+        peak += int(status.get('VmHWM', '0 kB').split()[0]) * 1024
+    return {'cpu_s': cpu, 'rss': rss, 'peak_rss': peak}
+
+
+###################################
+# Sessions
+###################################
+
+class Session:
+    """One browser tab: a WebSocket connection and the widgets of its last rerun."""
+
+    def __init__(self, url, rng):
+        self.url = url
+        self.rng = rng
+        self.page = None
+        self.widgets = []  # (label, element type, proto) in page order
+        self.states = {}  # widget id -> WidgetState of the values set on this page
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+
+        self.ws = await websocket_connect(self.url, max_message_size=256 * 1024 * 1024)
+
+    def close(self):
+        self.ws.close()
+
+    def _widget(self, spec):
+        label, _, nth = spec.partition('#')
+        matches = [w for w in self.widgets if w[0] == label] or [w for w in self.widgets if label in w[0]]
+        if not matches:
+            raise KeyError(f'no widget labelled {label!r} on page {self.page!r}')
+        return matches[int(nth or 0)]
+
+    def _set(self, spec, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        _, kind, proto = self._widget(spec)
+        state = WidgetState(id=proto.id)
+        if kind in _INDEXED:
+            state.int_value = self.rng.randrange(len(proto.options)) if value == 'random' else int(value)
+        elif kind == 'checkbox':
+            state.bool_value = bool(value)
+        elif kind == 'slider':
+            state.double_array_value.data[:] = [float(value)]
+        elif kind == 'number_input':
+            state.double_value = float(value)
+        else:
+            state.string_value = str(value)
+        self.states[proto.id] = state
+
+    async def rerun(self, page, widgets=None):
+        """Run `page` with `widgets` set; returns (seconds, bytes received, errors)."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        if page != self.page:
+            self.states = {}
+        for spec, value in (widgets or {}).items():
+            self._set(spec, value)
+        message = BackMsg()
+        message.rerun_script.page_name = page
+        current = {w[2].id for w in self.widgets} if page == self.page else set()
+        message.rerun_script.widget_states.widgets.extend(s for wid, s in self.states.items() if wid in current)
+
+        start = time.perf_counter()
+        await self.ws.write_message(message.SerializeToString(), binary=True)
+        received = errors = 0
+        found = []
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise ConnectionError('server closed the connection')
+            received += len(raw)
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type == 'exception':
+                    errors += 1
+                proto = getattr(element, element_type)
+                if getattr(proto, 'id', '') and hasattr(proto, 'label'):
+                    found.append((proto.label, element_type, proto))
+            elif kind == 'script_finished':
+                if forward.script_finished != ForwardMsg.FINISHED_SUCCESSFULLY:
+                    errors += 1
+                break
+        self.page, self.widgets = page, found
+        return time.perf_counter() - start, received, errors
+
+
+async def run_session(url, script, deadline, think, results, rng):
+    """Loop over `script` until `deadline` (one pass when it's None)."""
+    session = Session(url, rng)
+    await session.connect()
+    try:
+        while True:
+            for step in script['steps']:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                try:
+                    seconds, received, errors = await session.rerun(step.get('page', ''), step.get('widgets'))
+                except KeyError as e:
+                    results['errors'] += 1
+                    results['messages'].append(f"{script['name']}: {e.args[0]}")
+                    continue
+                except ConnectionError as e:
+                    results['errors'] += 1
+                    results['messages'].append(f"{script['name']}: {e}")
+                    return
+                results['latencies'].append(seconds)
+                results['bytes'] += received
+                results['errors'] += errors
+                if think:
+                    await asyncio.sleep(rng.expovariate(1 / think))
+            if deadline is None:
+                return
+    finally:
+        session.close()
+
+
+async def run_level(url, scripts, sessions, duration, think, seed):
+    results = {'latencies': [], 'bytes': 0, 'errors': 0, 'messages': []}
+    deadline = time.perf_counter() + duration if duration is not None else None
+    await asyncio.gather(*(run_session(url, scripts[i % len(scripts)], deadline, think, results,
+                                       random.Random(seed + i))
+                           for i in range(sessions)))
+    return results
+
+
+def measure_level(url, pids, scripts, sessions, duration, think, seed=0):
+    """Run one concurrency level; returns its report row."""
+    before = {pid: process_sample(pid) for pid in pids}
+    client_before = time.process_time()
+    start = time.perf_counter()
+    results = asyncio.run(run_level(url, scripts, sessions, duration, think, seed))
+    elapsed = time.perf_counter() - start
+    latencies = [s * 1000 for s in results['latencies']]
+    row = {
+        'sessions': sessions,
+        'reruns': len(latencies),
+        'errors': results['errors'],
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': statistics.fmean(latencies) if latencies else None,
+        'reruns_per_s': len(latencies) / elapsed,
+        'bytes_per_s': results['bytes'] / elapsed,
+        'client_cpu_pct': (time.process_time() - client_before) / elapsed * 100,
+        'workers': [],
+    }
+    for pid in pids:
+        after = process_sample(pid)
+        row['workers'].append({'pid': pid, 'cpu_pct': (after['cpu_s'] - before[pid]['cpu_s']) / elapsed * 100,
+                               'rss': after['rss'], 'peak_rss': after['peak_rss']})
+    if results['messages']:
+        row['messages'] = sorted(set(results['messages']))
+    return row
+
+
+###################################
+# Server
+###################################
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(port, timeout=60, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'server exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f'server on port {port} not healthy after {timeout} s')
+
+
+def start_server(app, port, ready_file):
+    """Start `app` and wait until it's healthy; its figure-cache warm-up
+    (inclusion.warmup) signals completion through `ready_file`."""
+    command = [sys.executable, '-m', 'streamlit', 'run', app, '--server.headless', 'true',
+               '--server.port', str(port), '--server.fileWatcherType', 'none',
+               '--browser.gatherUsageStats', 'false']
+    env = dict(os.environ, FIMX_READY_FILE=ready_file)
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        wait_healthy(port, process=process)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+def wait_ready(ready_file, timeout=300):
+    """Wait for the warm-up to finish, so it doesn't compete with the first level."""
+    deadline = time.time() + timeout
+    while not os.path.exists(ready_file) and time.time() < deadline:
+        time.sleep(0.2)
+
+
+def print_row(row):
+    workers = row['workers']
+    cpu = sum(w['cpu_pct'] for w in workers)
+    rss = sum(w['rss'] for w in workers) / 1e6
+    peak = sum(w['peak_rss'] for w in workers) / 1e6
+    fmt = lambda v: '-' if v is None else f'{v:.0f}'
+    print(f"{row['sessions']:>8}  {row['reruns']:>6}  {row['errors']:>6}  "
+          f"{fmt(row['p50_ms']):>5}/{fmt(row['p95_ms'])}/{fmt(row['p99_ms']):<5}  {row['reruns_per_s']:>8.1f}  "
+          f"{cpu:>12.0f}  {rss:>6.0f}  {peak:>6.0f}  {row['client_cpu_pct']:>12.0f}")
+    for message in row.get('messages', []):
+        print(f'          {message}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='concurrency levels to ramp through (default 1 2 4 8)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per level (default 20)')
+    parser.add_argument('--think', type=float, default=0,
+                        help='mean pause between a session\'s reruns, in seconds (default 0: back to back)')
+    parser.add_argument('--scripts', help='JSON list of interaction scripts (default: the built-in mix)')
+    parser.add_argument('--app', default='app.py', help='script to serve when starting a server')
+    parser.add_argument('--port', type=int, help='use the server already listening on this port')
+    parser.add_argument('--pid', type=int, nargs='*', default=[],
+                        help='server process(es) to sample CPU and RSS of, with --port')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH', help='write the report as JSON')
+    args = parser.parse_args(argv)
+
+    scripts = SCRIPTS
+    if args.scripts:
+        with open(args.scripts, encoding='utf-8') as f:
+            scripts = json.load(f)
+
+    process = ready_file = None
+    if args.port:
+        port, pids = args.port, args.pid
+        wait_healthy(port)
+    else:
+        port = free_port()
+        ready_file = os.path.join(tempfile.gettempdir(), f'fimx-load-{port}.ready')
+        process = start_server(args.app, port, ready_file)
+        pids = [process.pid]
+    url = f'ws://127.0.0.1:{port}/_stcore/stream'
+    try:
+        # One untimed pass over every script so the first level doesn't measure the server's start-up
+        measure_level(url, [], scripts, len(scripts), None, 0, args.seed)
+        if ready_file:
+            wait_ready(ready_file)
+        print(f"{'sessions':>8}  {'reruns':>6}  {'errors':>6}  {'p50/p95/p99 ms':<15}  {'reruns/s':>8}  "
+              f"{'server CPU %':>12}  {'RSS MB':>6}  {'(peak)':>6}  {'client CPU %':>12}")
+        rows = []
+        for sessions in args.sessions:
+            rows.append(measure_level(url, pids, scripts, sessions, args.duration, args.think, args.seed))
+            print_row(rows[-1])
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+            if os.path.exists(ready_file):
+                os.remove(ready_file)
+
+    if args.json:
+        report = {'port': port, 'duration_s': args.duration, 'think_s': args.think, 'cpus': os.cpu_count(),
+                  'scripts': [s['name'] for s in scripts], 'levels': rows}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'wrote {args.json}')
+    return 1 if any(row['errors'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""Benchmarks for the data loads, derived metrics and figure builds.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.run                          # shipped datasets
+    python -m benchmarks.run --scales 10 100          # plus synthetic 10x/100x municipal/consolidated data
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --tolerance 0.25
+    python -m benchmarks.run -k figure                # only cases whose name contains 'figure'
+
+Every case reports the median and minimum wall time over --rounds runs
+(after one warm-up run); figure cases also report the size of fig.to_json().
+--compare exits with status 1 when a case's median is more than --tolerance
+slower than the baseline (and by more than --noise seconds) or a payload grew
+by more than --tolerance, so it can gate a deploy. Baselines are only
+comparable on the same hardware, so record one per machine.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from inclusion import cube, figures, forecast
+from inclusion.consolidate import collapse_duplicates
+from inclusion.data import DATASETS, apply_schema, load_dataset, read_csv
+from inclusion.drilldown import MUNICIPAL_ALIASES, MUNICIPAL_COLUMNS, MunicipalIndex, load_municipal
+from inclusion.historical import card_gender_shares, load_historical, year_col, year_end_snapshots
+from inclusion.index_engine import DEFAULT_SPEC, IndexEngine, fi_index
+from inclusion.metrics import (account_columns, add_derived_metrics, indicators, institution_columns,
+                               mobile_banking_penetration)
+from inclusion.peers import PeerIndex
+from inclusion.schema import HeaderSchema, header_schema
+from inclusion.state import STATE_COLUMNS, load_state, state_metrics
+from inclusion.whatif import Addition, Simulator
+
+# State with the most municipalities (Oaxaca), the worst case for a drill-down
+DRILLDOWN_STATE = 20
+DRILLDOWN_METRICS = ['FI_Index', 'Cajeros_10mil_adultos'] + account_columns
+
+
+def measure(fn, rounds):
+    fn()  # warm-up: imports, caches, page faults
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'rounds': rounds}
+
+
+class Suite:
+    def __init__(self, rounds, keyword=None):
+        self.rounds = rounds
+        self.keyword = keyword
+        self.results = {}
+
+    def wanted(self, name):
+        return self.keyword is None or self.keyword in name
+
+    def case(self, name, fn, rounds=None):
+        if not self.wanted(name):
+            return
+        self.results[name] = measure(fn, rounds or self.rounds)
+        print(f"{name:<55} {self.results[name]['median_s'] * 1000:10.2f} ms")
+
+    def figure(self, name, build):
+        """Time a figure build and its JSON serialization, and record the payload size."""
+        if not self.wanted(name):
+            return
+        self.case(f'{name}.build', build)
+        fig = build()
+        self.case(f'{name}.to_json', fig.to_json)
+        self.results[f'{name}.to_json']['bytes'] = len(fig.to_json())
+
+
+###################################
+# Cases on the shipped data
+###################################
+
+def load_cases(suite, build_dir):
+    for name in DATASETS:
+        suite.case(f'load.{name}.csv', lambda name=name: read_csv(name))
+        suite.case(f'load.{name}.parquet', lambda name=name: load_dataset(name, build_dir=build_dir))
+    suite.case('load.state.columns.csv', lambda: read_csv('state', STATE_COLUMNS))
+    suite.case('load.state.columns.parquet', lambda: load_dataset('state', STATE_COLUMNS, build_dir=build_dir))
+    suite.case('load.municipal.columns.parquet',
+               lambda: load_dataset('municipal', MUNICIPAL_COLUMNS, build_dir=build_dir))
+    # What the pages call, through the default build directory
+    suite.case('app.load_state', load_state)
+    suite.case('app.load_municipal', load_municipal)
+    suite.case('app.load_historical', load_historical)
+
+
+def historical_cases(suite):
+    df = load_historical()
+    year_end = year_end_snapshots(df)
+    suite.case('historical.year_end', lambda: year_end_snapshots(df))
+    suite.case('historical.header_schema', lambda: HeaderSchema(df.columns))
+    suite.case('historical.gender', lambda: (card_gender_shares(year_end, 'debit'),
+                                             card_gender_shares(year_end, 'credit')))
+    suite.case('historical.forecast', lambda: forecast.fit(df))
+
+
+def metric_cases(suite):
+    state = load_state()
+    municipal = load_municipal()
+    suite.case('metrics.derived.state', lambda: add_derived_metrics(state))
+    suite.case('metrics.state_metrics', lambda: state_metrics(state))
+    suite.case('fi_index.state', lambda: fi_index(state))
+    suite.case('fi_index.municipal', lambda: fi_index(municipal))
+    engine = IndexEngine(municipal)
+    suite.case('fi_index.municipal.memoized', lambda: engine.evaluate(DEFAULT_SPEC))
+    suite.case('index.municipal', lambda: MunicipalIndex(municipal, DRILLDOWN_METRICS))
+    suite.case('peers.build', lambda: PeerIndex(municipal))
+    peers = PeerIndex(municipal)
+    suite.case('peers.query', lambda: peers.query(9015, k=10))
+    suite.case('peers.query.type', lambda: peers.query(9015, k=10, population_type='Urbano'))
+    simulator = Simulator(state)
+    rng = np.random.default_rng(0)
+    sweep = [[Addition('Corresponsales_10mil_adultos', float(rng.integers(1, 500)), int(rng.choice(simulator.keys))),
+              Addition('Cajeros_10mil_adultos', float(rng.integers(1, 200)), int(rng.choice(simulator.keys)))]
+             for _ in range(10000)]
+    suite.case('whatif.10k', lambda: simulator.run(sweep))
+    rollup = cube.Cube(cube.build())
+    suite.case('cube.build', cube.build)
+    suite.case('cube.rate', lambda: rollup.rate('Corresponsales_10mil_adultos', 'Sur', 'Rural'))
+    suite.case('cube.table.state', lambda: rollup.table('state', 'Rural'))
+
+
+def figure_cases(suite):
+    df = state_metrics()
+    ranked = df[df.index != 'Sin identificar']
+    index = MunicipalIndex(load_municipal(), DRILLDOWN_METRICS)
+    year_end = year_end_snapshots(load_historical())
+    trend = year_end.assign(**{year_col: year_end[year_col].astype(str)})
+    branches = header_schema(trend.columns).column('Infraestructura', 'Banca, Socap y Sofipo', 'Sucursales')
+    debit = card_gender_shares(year_end, 'debit')
+
+    suite.figure('figure.population', lambda: figures.population(df))
+    suite.figure('figure.infrastructure', lambda: figures.infrastructure(df, 'Cajeros_10mil_adultos'))
+    for view_type in ('Absolute numbers', 'Percentage'):
+        suite.figure(f'figure.accounts.{view_type.split()[0].lower()}',
+                     lambda view_type=view_type: figures.accounts(df, view_type))
+    suite.figure('figure.credit', lambda: figures.credit(df))
+    suite.figure('figure.mobile', lambda: figures.mobile(df))
+    suite.figure('figure.institution', lambda: figures.institution(df, institution_columns[0]))
+    suite.figure('figure.institutions_total', lambda: figures.institutions_total(df))
+    suite.figure('figure.relationship', lambda: figures.relationship(df, indicators[0]))
+    suite.figure('figure.relationships_faceted', lambda: figures.relationships_faceted(df))
+    suite.figure('figure.fi_ranking', lambda: figures.fi_ranking(ranked))
+    suite.figure('figure.municipal_bars', lambda: figures.municipal_bars(
+        index, DRILLDOWN_STATE, 'Oaxaca', account_columns, 'Accounts', 'accounts per 10,000 adults'))
+    suite.figure('figure.municipal_relationship', lambda: figures.municipal_relationship(
+        index, DRILLDOWN_STATE, 'Oaxaca', indicators[0]))
+    suite.figure('figure.trend_bar', lambda: figures.trend_bar(
+        trend, branches, 'Branches', '#CCCCCC', 'number of units'))
+    suite.figure('figure.gender_lines', lambda: figures.gender_lines(debit, 'Debit cards'))
+    suite.figure('figure.gender_split', lambda: figures.gender_split(debit, 'Debit cards'))
+
+
+###################################
+# Synthetic scaled data
+###################################
+
+def scaled(df, factor, key_cols, seed=0):
+    """`factor` jittered copies of `df`, with the key columns made unique.
+
+    Numeric columns are multiplied by a random factor in [0.9, 1.1] per copy,
+    so sorts and aggregates don't degenerate on repeated values.
+    """
+    rng = np.random.default_rng(seed)
+    copies = []
+    for k in range(factor):
+        copy = df.copy()
+        if k:
+            for col in df.columns:
+                if col in key_cols:
+                    copy[col] = copy[col] + k * 100000
+                elif pd.api.types.is_float_dtype(copy[col]):
+                    copy[col] = copy[col] * rng.uniform(0.9, 1.1, len(copy))
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def scaled_cases(suite, factor, workdir):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    prefix = f'scaled.x{factor}'
+    for name, keys in (('municipal', {'Clave_Municipio'}), ('consolidated', {'index', 'Clave_Municipio'})):
+        raw = read_csv(name, typed=False)
+        big = scaled(raw, factor, keys)
+        csv = os.path.join(workdir, f'{name}.x{factor}.csv')
+        big.to_csv(csv, index=False)
+        thousands = DATASETS[name].get('thousands')
+        typed = apply_schema(name, big)
+        parquet = os.path.join(workdir, f'{name}.x{factor}.parquet')
+        pq.write_table(pa.Table.from_pandas(typed, preserve_index=False), parquet, compression='zstd')
+
+        suite.case(f'{prefix}.load.{name}.csv',
+                   lambda: apply_schema(name, pd.read_csv(csv, thousands=thousands)), rounds=3)
+        suite.case(f'{prefix}.load.{name}.parquet',
+                   lambda: pq.read_table(parquet, memory_map=True).to_pandas(), rounds=3)
+        if DATASETS[name].get('collapse'):
+            suite.case(f'{prefix}.collapse.{name}', lambda: collapse_duplicates(typed), rounds=3)
+
+    municipal = pq.read_table(os.path.join(workdir, f'municipal.x{factor}.parquet'),
+                              columns=MUNICIPAL_COLUMNS).to_pandas().rename(columns=MUNICIPAL_ALIASES)
+    municipal['Mobile_Banking_Penetration'] = mobile_banking_penetration(municipal)
+    municipal['FI_Index'] = fi_index(municipal)
+    suite.case(f'{prefix}.fi_index.municipal', lambda: fi_index(municipal), rounds=3)
+    suite.case(f'{prefix}.index.municipal', lambda: MunicipalIndex(municipal, DRILLDOWN_METRICS), rounds=3)
+    peers = PeerIndex(municipal)
+    suite.case(f'{prefix}.peers.query', lambda: peers.query(municipal['Clave_Municipio'].iloc[0], k=10))
+    index = MunicipalIndex(municipal, DRILLDOWN_METRICS)
+    suite.figure(f'{prefix}.figure.municipal_bars', lambda: figures.municipal_bars(
+        index, DRILLDOWN_STATE, 'Oaxaca', account_columns, 'Accounts', 'accounts per 10,000 adults'))
+
+
+###################################
+# Baselines
+###################################
+
+def compare(results, baseline, tolerance, noise, wanted=lambda name: True):
+    """Print the cases that moved and return the number of regressions."""
+    regressions = 0
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"  new       {name}")
+            continue
+        ratio = result['median_s'] / base['median_s'] if base['median_s'] else float('inf')
+        slower = ratio > 1 + tolerance and result['median_s'] - base['median_s'] > noise
+        grew = 'bytes' in base and result.get('bytes', 0) > base['bytes'] * (1 + tolerance)
+        if slower or grew:
+            regressions += 1
+            detail = f"{ratio:.2f}x time" + (f", {base['bytes']:,} -> {result['bytes']:,} bytes" if grew else '')
+            print(f"  REGRESSED {name}: {detail}")
+        elif ratio < 1 - tolerance and base['median_s'] - result['median_s'] > noise:
+            print(f"  improved  {name}: {ratio:.2f}x time")
+    for name in sorted(baseline.keys() - results.keys()):
+        if wanted(name):
+            print(f"  missing   {name}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--scales', type=int, nargs='*', default=[],
+                        help='synthetic scale factors for the municipal/consolidated data, e.g. 10 100')
+    parser.add_argument('-k', dest='keyword', help='only run cases whose name contains this')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown (default 0.25)')
+    parser.add_argument('--noise', type=float, default=0.002,
+                        help='ignore slowdowns smaller than this many seconds (default 0.002)')
+    args = parser.parse_args(argv)
+
+    suite = Suite(args.rounds, args.keyword)
+    # Shared frames of the benchmark runs go to the scratch directory, and the
+    # scratch build leaves those of running dashboards alone
+    with tempfile.TemporaryDirectory() as workdir, \
+            mock.patch.dict(os.environ, {'FIMX_SHARED_DIR': os.path.join(workdir, 'shared')}):
+        from inclusion.ingest import build
+        with contextlib.redirect_stdout(io.StringIO()):
+            build(build_dir=workdir, drop_shared=False)
+        load_cases(suite, workdir)
+        historical_cases(suite)
+        metric_cases(suite)
+        figure_cases(suite)
+        for factor in args.scales:
+            scaled_cases(suite, factor, workdir)
+
+    report = {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'cases': suite.results,
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {len(suite.results)} cases to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['cases']
+        print(f"Compared with {args.compare}:")
+        regressions = compare(suite.results, baseline, args.tolerance, args.noise, suite.wanted)
+        if regressions:
+            print(f"{regressions} regression(s)")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Data and computation layer behind the Financial Inclusion MX dashboards."""
@@ -0,0 +1,348 @@
+"""Headless JSON/Arrow API over the metrics behind the dashboards.
+
+Usage::
+
+    python -m inclusion.api --port 8000
+
+`app` is a plain ASGI application (no web framework needed): the command
+above serves it with uvicorn when that is installed and with a small
+threaded stdlib server otherwise. Any other ASGI server works too, e.g.
+``uvicorn inclusion.api:app --workers 4``.
+
+Routes (GET or HEAD):
+
+    /health
+    /v1/states                 state metrics and FI_Index; ?columns=a,b
+    /v1/states/ranking         top/bottom states; ?metric=FI_Index&n=3
+    /v1/historical/gender      card holders by gender; ?card=debit|credit&since=2018
+
+/v1/states and /v1/states/ranking take the index parameters of the dashboard:
+?normalization=none|minmax|zscore and one ?weight=<group>:<weight> per
+component group to change (groups left out weigh 1).
+
+Responses are JSON, or an Arrow IPC stream with ?format=arrow or
+``Accept: application/vnd.apache.arrow.stream``. Every response carries a
+strong ETag (hash of the source version and the body) and is kept in memory
+per request, so repeated and conditional requests (If-None-Match -> 304) cost
+a dict lookup plus the source check: every request compares source_version()
+with the one the data was loaded at, and an ingest run or an appended
+quarterly release reloads the data and drops the cached responses.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+import pandas as pd
+
+from inclusion.data import fingerprint
+from inclusion.historical import (CARD_BREAKDOWNS, card_gender_shares, load_historical, store_version,
+                                  year_end_snapshots)
+from inclusion.index_engine import COMPONENT_GROUPS, NORMALIZATIONS, IndexEngine, spec_from_groups
+from inclusion.metrics import add_derived_metrics
+from inclusion.shared import dataset_key
+from inclusion.state import load_state, ranking
+
+JSON_MEDIA_TYPE = 'application/json'
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Response:
+    __slots__ = ('status', 'body', 'content_type', 'etag')
+
+    def __init__(self, body, content_type, status=200, version=''):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        digest = hashlib.sha1(version.encode('utf-8'))
+        digest.update(body)
+        self.etag = '"' + digest.hexdigest()[:20] + '"'
+
+
+def source_version():
+    """Stamp of the files the API reads: the state and historical CSVs, their
+    columnar builds and the quarterly store's version. A few stat calls."""
+    return dataset_key('state') + dataset_key('historical', [store_version()])
+
+
+def _json_body(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _frame_body(df, fmt):
+    if fmt == 'arrow':
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_MEDIA_TYPE
+    return df.to_json(orient='records', force_ascii=False).encode('utf-8'), JSON_MEDIA_TYPE
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+class MetricsAPI:
+    """ASGI application serving state and historical metrics from memory."""
+
+    def __init__(self, cache_size=1024):
+        self.cache_size = cache_size
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        self._data = None
+        self._data_version = None
+        self._data_lock = threading.Lock()
+        self.routes = {
+            '/health': self.health,
+            '/v1/states': self.states,
+            '/v1/states/ranking': self.state_ranking,
+            '/v1/historical/gender': self.gender,
+        }
+
+    # Data, loaded on first use and again whenever the sources change
+
+    def data(self, version=None):
+        version = version or source_version()
+        with self._data_lock:
+            if self._data is None or self._data_version != version:
+                state = add_derived_metrics(load_state())
+                # The source file ends with an empty row the dashboard plots as a gap
+                state = state[state.index.notna()]
+                historical = load_historical()
+                self._data = {
+                    'state': state,
+                    'engine': IndexEngine(state),
+                    'year_end': year_end_snapshots(historical),
+                    'versions': {'state': fingerprint(state), 'historical': fingerprint(historical)},
+                }
+                self._data_version = version
+                with self._lock:
+                    self._responses.clear()
+            return self._data
+
+    def _index_spec(self, params):
+        normalization = params.get('normalization', ['none'])[-1]
+        if normalization not in NORMALIZATIONS or normalization == 'per_capita':
+            raise HTTPError(400, 'normalization must be one of none, minmax, zscore')
+        weights = dict.fromkeys(COMPONENT_GROUPS, 1.0)
+        for item in params.get('weight', []):
+            group, _, value = item.rpartition(':')
+            if group not in weights:
+                raise HTTPError(400, f"unknown component group {group!r}; one of {', '.join(COMPONENT_GROUPS)}")
+            try:
+                weights[group] = float(value)
+            except ValueError:
+                raise HTTPError(400, f"weight for {group!r} is not a number: {value!r}") from None
+            if not (math.isfinite(weights[group]) and weights[group] >= 0):
+                raise HTTPError(400, f"weight for {group!r} must be a finite number >= 0, got {value!r}")
+        if sum(weights.values()) <= 0:
+            raise HTTPError(400, 'at least one weight must be positive')
+        return spec_from_groups(weights, normalization)
+
+    def _state_frame(self, params):
+        data = self.data()
+        spec = self._index_spec(params)
+        return data['state'].assign(FI_Index=data['engine'].evaluate(spec))
+
+    @staticmethod
+    def _int_param(params, name, default):
+        value = params.get(name, [str(default)])[-1]
+        try:
+            return int(value)
+        except ValueError:
+            raise HTTPError(400, f"{name} must be an integer, got {value!r}") from None
+
+    # Routes: each returns a DataFrame (JSON or Arrow) or a dict (JSON only)
+
+    def health(self, params):
+        return {'status': 'ok', 'versions': self.data()['versions']}
+
+    def states(self, params):
+        df = self._state_frame(params)
+        if 'columns' in params:
+            columns = [c for c in params['columns'][-1].split(',') if c]
+            unknown = [c for c in columns if c not in df.columns]
+            if unknown:
+                raise HTTPError(400, f"unknown column(s): {', '.join(unknown)}")
+            df = df[columns]
+        return df.reset_index()
+
+    def state_ranking(self, params):
+        df = self._state_frame(params)
+        metric = params.get('metric', ['FI_Index'])[-1]
+        if metric not in df.columns or not pd.api.types.is_numeric_dtype(df[metric]):
+            raise HTTPError(400, f"unknown numeric column {metric!r}")
+        top, bottom = ranking(df[metric], self._int_param(params, 'n', 3))
+        return pd.concat([
+            pd.DataFrame({'group': 'top', 'Estado': top.index, 'value': top.to_numpy()}),
+            pd.DataFrame({'group': 'bottom', 'Estado': bottom.index, 'value': bottom.to_numpy()}),
+        ], ignore_index=True)
+
+    def gender(self, params):
+        card = params.get('card', ['debit'])[-1]
+        if card not in CARD_BREAKDOWNS:
+            raise HTTPError(400, f"card must be one of {', '.join(CARD_BREAKDOWNS)}")
+        return card_gender_shares(self.data()['year_end'], card, since=self._int_param(params, 'since', 2018))
+
+    # Request handling
+
+    def _build(self, path, params, fmt, version):
+        route = self.routes.get(path)
+        if route is None:
+            raise HTTPError(404, f"no route {path}")
+        result = route(params)
+        if isinstance(result, pd.DataFrame):
+            body, content_type = _frame_body(result, fmt)
+        elif fmt == 'arrow':
+            raise HTTPError(406, f"{path} is only available as JSON")
+        else:
+            body, content_type = _json_body(result), JSON_MEDIA_TYPE
+        return Response(body, content_type, version=version)
+
+    def respond(self, path, query, accept=''):
+        """Response for a GET of `path` with the raw `query` string."""
+        params = parse_qs(query, keep_blank_values=True)
+        fmt = params.pop('format', [None])[-1]
+        if fmt is None:
+            fmt = 'arrow' if ARROW_MEDIA_TYPE in accept else 'json'
+        if fmt not in ('json', 'arrow'):
+            raise HTTPError(400, 'format must be json or arrow')
+        version = source_version()
+        self.data(version)
+        key = (version, path, tuple(sorted((k, tuple(v)) for k, v in params.items())), fmt)
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+                return response
+        response = self._build(path, params, fmt, version)
+        with self._lock:
+            self._responses[key] = response
+            while len(self._responses) > self.cache_size:
+                self._responses.popitem(last=False)
+        return response
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        method = scope['method']
+        try:
+            if method not in ('GET', 'HEAD'):
+                raise HTTPError(405, f"method {method} not allowed")
+            response = self.respond(scope['path'], scope.get('query_string', b'').decode('latin-1'),
+                                    headers.get('accept', ''))
+        except HTTPError as e:
+            response = Response(_json_body({'error': str(e)}), JSON_MEDIA_TYPE, e.status)
+
+        status, body = response.status, response.body
+        out = [(b'content-type', response.content_type.encode('latin-1'))]
+        if status == 200:
+            out += [(b'etag', response.etag.encode('latin-1')), (b'cache-control', b'no-cache')]
+            if _etag_matches(headers.get('if-none-match'), response.etag):
+                status, body = 304, b''
+        if status != 304:
+            out.append((b'content-length', str(len(body)).encode('latin-1')))
+        if method == 'HEAD':
+            body = b''
+        await send({'type': 'http.response.start', 'status': status, 'headers': out})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = MetricsAPI()
+
+
+def serve_stdlib(asgi_app, host='127.0.0.1', port=8000):
+    """Serve an ASGI app with the standard library (one thread per request).
+
+    A fallback for machines without uvicorn; it handles plain GET/HEAD
+    requests without bodies, which is all MetricsAPI needs.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self):
+            url = urlsplit(self.path)
+            scope = {
+                'type': 'http', 'method': self.command, 'path': url.path,
+                'query_string': url.query.encode('latin-1'),
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in self.headers.items()],
+            }
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            asyncio.run(asgi_app(scope, receive, send))
+            start, body = messages[0], messages[1]['body']
+            self.send_response(start['status'])
+            for k, v in start['headers']:
+                self.send_header(k.decode('latin-1'), v.decode('latin-1'))
+            if start['status'] == 304:
+                self.send_header('content-length', '0')
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_HEAD = _handle
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+    app.data()  # load before accepting requests
+    try:
+        import uvicorn
+    except ImportError:
+        serve_stdlib(app, args.host, args.port)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""Every chart the dashboards can show, as figure specs.
+
+The pages build their charts from widget values; this module enumerates the
+same (chart, data version, params) triples for every value of every widget,
+so tools that work outside a Streamlit run (the cache warm-up, the static
+export) produce figures under exactly the keys the pages look up. The
+historical page takes its label maps and trend titles from here; the state
+page's calls are mirrored in state_figures(), so keep the two in step.
+
+A Figure names its source by key into the dict load_sources() returns, which
+keeps the list cheap to build and to send to worker processes.
+"""
+from dataclasses import dataclass, field
+
+from inclusion import forecast, geo
+from inclusion.data import fingerprint
+from inclusion.drilldown import MunicipalIndex, load_municipal
+from inclusion.figcache import ChartSpec
+from inclusion.figures import (account_labels, credit_labels, indicator_labels, infrastructure_labels,
+                               infrastructure_metrics, institution_colors, institution_labels)
+from inclusion.historical import card_gender_shares, load_historical, load_year_end, trend_frame, trends_version
+from inclusion.index_engine import DEFAULT_SPEC, fi_index
+from inclusion.metrics import account_columns, add_derived_metrics, credit_columns, indicators, institution_columns
+from inclusion.schema import GENDER_METRICS, header_schema
+from inclusion.state import load_state
+
+PAGES = ('state', 'historical')
+
+# Metrics that can be drilled down into municipalities, each with a precomputed per-state order
+DRILLDOWN_METRICS = sorted(set(
+    ['Sucursales_banca_comercial_10mil_adultos', 'Cajeros_10mil_adultos', 'Corresponsales_10mil_adultos',
+     'TPV_10mil_adultos', 'Mobile_Banking_Penetration', 'FI_Index']
+    + account_columns + credit_columns + institution_columns
+))
+
+ACCOUNT_VIEWS = ['Absolute numbers', 'Percentage']
+INSTITUTION_VIEWS = ['Individual institutions', 'Total branches']
+
+
+@dataclass
+class Figure:
+    page: str
+    section: str
+    option: str  # the widget values that show the figure ('' when it's always shown)
+    chart: str
+    source: str  # key into load_sources()
+    version: str
+    params: dict = field(default_factory=dict)
+    use_container_width: bool = False
+
+    def spec(self):
+        return ChartSpec.make(self.chart, self.version, **self.params)
+
+
+###################################
+# Historical page
+###################################
+
+infra_metrics = {
+    "Branches": "Sucursales",
+    "ATMs": "Cajeros automáticos",
+    "POS": "TPV",
+    "Places with POS": "Establecimientos con TPV",
+    "Banking agents (corresponsales)": "Corresponsales",
+    "Mobile banking contracts": "Cuentas ligadas a celular",
+    "Transactions in ATMs": "Transacciones en cajeros",
+    "Transactions in POS": "Transacciones en TPV"
+}
+
+# Trend sections of the historical page: header, the option that shows the
+# total, the chart title for the total and for any other option, color and axis
+HISTORICAL_TRENDS = {
+    'infrastructure': ("Infrastructure trends", None, None, "Infrastructure: {}", "#CCCCCC",
+                       'number of units'),
+    'captacion': ("Trends for 'Captación' - Banca", "Total", "Total Captación Banca", "Captación: {}", "#1f77b4",
+                  'number of accounts'),
+    'captacion_eacp': ("Trends for 'Captación' - Entidades de Ahorro y Crédito Popular", "Total EACP",
+                       "Total Captación EACP", "Captación EACP: {}", '#2ca02c', 'number of accounts'),
+    'credit': ("Trends for 'Crédito' - Banca", "Total", "Total Crédito Banca", "Crédito: {}", "#1f77b4",
+               'number of credits'),
+    'credito_eacp': ("Trends for 'Crédito' - Entidades de Ahorro y Crédito Popular", "Total EACP",
+                     "Total Crédito EACP", "Crédito: {}", '#2ca02c', 'number of credits'),
+}
+
+CARD_TITLES = {'debit': 'Debit cards by gender over time', 'credit': 'Credit cards by gender over time'}
+
+
+def historical_maps(columns):
+    """{trend section: {option label: column}} for the historical page.
+
+    Columns are looked up by name in the parsed two-level header, so
+    quarterly files with shifted or extra columns still resolve.
+    """
+    schema = header_schema(columns)
+    captacion_eacp_group = schema.group("Captación", "EACP", exclude=GENDER_METRICS)
+    # The four EACP credit types plus the total (the total without commercial credit is left out)
+    credito_eacp_group = schema.group("Crédito", "EACP", exclude=GENDER_METRICS + ("Total", "Total sin comercial"))
+    credito_eacp_map = {f"{metric} EACP": col for metric, col in credito_eacp_group.items()}
+    credito_eacp_map["Total EACP"] = schema.column("Crédito", "EACP", "Total")
+    return {
+        'infrastructure': {label: schema.column("Infraestructura", "Banca, Socap y Sofipo", metric)
+                           for label, metric in infra_metrics.items()},
+        'captacion': dict(schema.group("Captación", "Banca", exclude=GENDER_METRICS)),
+        'captacion_eacp': {
+            "Ahorro EACP": captacion_eacp_group["Ahorro"],
+            "Plazo EACP": captacion_eacp_group["Plazo"],
+            "Otras EACP": captacion_eacp_group["Vista"],
+            "Total EACP": captacion_eacp_group["Total"]
+        },
+        'credit': dict(schema.group("Crédito", "Banca", exclude=GENDER_METRICS)),
+        'credito_eacp': credito_eacp_map,
+    }
+
+
+def trend_params(section, choice, maps):
+    """trend_bar parameters for `choice` in one of HISTORICAL_TRENDS."""
+    _, total, total_title, title, color, yaxis_title = HISTORICAL_TRENDS[section]
+    return {
+        'column': maps[section][choice],
+        'title': total_title if choice == total else title.format(choice),
+        'color': color,
+        'yaxis_title': yaxis_title,
+    }
+
+
+def historical_figures(sources):
+    version = sources['historical_version']
+    maps = sources['historical_maps']
+    for section, (header, *_) in HISTORICAL_TRENDS.items():
+        for choice in maps[section]:
+            yield Figure('historical', header, choice, 'trend_bar', 'historical_trends', sources['trends_version'],
+                         trend_params(section, choice, maps), use_container_width=True)
+    for card, title in CARD_TITLES.items():
+        for chart, suffix in (('gender_lines', ''), ('gender_split', ' (% distribution)')):
+            yield Figure('historical', "Gender Analysis - Debit and Credit Cards", '', chart, f'gender_{card}',
+                         version, {'title': title + suffix}, use_container_width=True)
+
+
+###################################
+# State page
+###################################
+
+def _option(*parts):
+    return ' / '.join(part for part in parts if part)
+
+
+def _map(figure, metric, title, colorbar_title, layer_version):
+    return Figure(figure.page, figure.section, _option('Map', figure.option), 'state_map', figure.source,
+                  f'{figure.version}:{layer_version}',
+                  {'metric': metric, 'title': title, 'colorbar_title': colorbar_title}, use_container_width=True)
+
+
+def _drilldowns(sources, section, option, y, title, yaxis_title, labels=None, colors=None,
+                index='municipal_index', version='municipal'):
+    version = sources['versions'][version]
+    for name, key in sources['state_keys'].items():
+        params = {'state': key, 'state_name': name}
+        yield Figure('state', section, _option(option, name), 'municipal_bars', index, version,
+                     {**params, 'y': y, 'title': title, 'yaxis_title': yaxis_title,
+                      'labels': labels, 'colors': colors}, use_container_width=True)
+        if sources['maps'] and len(y) == 1 and geo.available('municipal'):
+            yield Figure('state', section, _option('Map', option, name), 'municipal_map', index,
+                         f"{version}:{geo.layer_version('municipal')}",
+                         {**params, 'metric': y[0], 'title': title, 'colorbar_title': yaxis_title},
+                         use_container_width=True)
+
+
+def state_figures(sources, drilldowns=False):
+    """Figures of the state page (app.py) with the default index weights;
+    with drilldowns=True also every state's municipal drill-down."""
+    v = sources['versions']['state']
+    fi_v = sources['versions']['fi']
+    maps = sources['maps']
+    state_geo = geo.layer_version('state')
+
+    def state(section, option, chart, version=v, source='state', use_container_width=False, **params):
+        return Figure('state', section, option, chart, source, version, params, use_container_width)
+
+    def drill(section, option, *args, **kwargs):
+        return _drilldowns(sources, section, option, *args, **kwargs) if drilldowns else ()
+
+    section = '1. Population demographics'
+    yield state(section, '', 'population')
+
+    section = '2. Banking infrastructure availability'
+    for metric, color in infrastructure_metrics.items():
+        label = infrastructure_labels[metric]
+        bars = state(section, label, 'infrastructure', metric=metric)
+        yield bars
+        if maps:
+            yield _map(bars, metric, f'{label} per 10,000 Adults', 'per 10,000 adults', state_geo)
+        yield from drill(section, label, [metric], f'{label} per 10,000 Adults', 'number per 10,000 adults',
+                         colors=[color])
+
+    section = '3. Account ownership by type'
+    for view_type in ACCOUNT_VIEWS:
+        yield state(section, view_type, 'accounts', use_container_width=True, view_type=view_type)
+    yield from drill(section, '', account_columns, 'Account ownership by type per 10,000 adults',
+                     'accounts per 10,000 adults', labels=account_labels)
+
+    section = '4. Credit product penetration'
+    yield state(section, '', 'credit', use_container_width=True)
+    yield from drill(section, '', credit_columns, 'Credit product penetration per 10,000 adults',
+                     'credits per 10,000 adults', labels=credit_labels)
+
+    section = '5. Mobile banking adoption'
+    bars = state(section, '', 'mobile')
+    yield bars
+    if maps:
+        yield _map(bars, 'Mobile_Banking_Penetration', 'Mobile banking adoption by state', 'contracts per adult',
+                   state_geo)
+    yield from drill(section, '', ['Mobile_Banking_Penetration'], 'Mobile banking adoption',
+                     'mobile banking contracts per adult')
+
+    section = '6. Comparison of different financial institutions'
+    for column in institution_columns:
+        label = institution_labels[column]
+        option = _option(INSTITUTION_VIEWS[0], label)
+        bars = state(section, option, 'institution', column=column)
+        yield bars
+        if maps:
+            yield _map(bars, column, f'{label} per 10,000 adults', 'branches per 10,000 adults', state_geo)
+        yield from drill(section, option, [column], f'{label} per 10,000 adults', 'branches per 10,000 adults',
+                         colors=[institution_colors[column]])
+    yield state(section, INSTITUTION_VIEWS[1], 'institutions_total', use_container_width=True)
+    yield from drill(section, INSTITUTION_VIEWS[1], institution_columns,
+                     'Total financial institution branches per 10,000 adults', 'branches per 10,000 adults',
+                     labels=institution_labels, colors=[institution_colors[col] for col in institution_columns])
+
+    section = '7. Relationships between various indicators and financial inclusion index'
+    for indicator in indicators:
+        yield state(section, indicator_labels[indicator], 'relationship', fi_v, indicator=indicator)
+    yield state(section, 'All indicators (faceted)', 'relationships_faceted', fi_v, use_container_width=True)
+    if drilldowns:
+        for name, key in sources['state_keys'].items():
+            for indicator in indicators:
+                yield state(section, _option(indicator_labels[indicator], name), 'municipal_relationship',
+                            sources['versions']['municipal_fi'], 'municipal_fi',
+                            state=key, state_name=name, indicator=indicator)
+
+    section = '8. Financial Inclusion Index by state'
+    bars = state(section, '', 'fi_ranking', fi_v, 'state_ranked')
+    yield bars
+    if maps:
+        yield _map(bars, 'FI_Index', 'Financial Inclusion Index by state', 'FI Index', state_geo)
+    yield from drill(section, '', ['FI_Index'], 'Financial Inclusion Index', 'Financial Inclusion Index',
+                     colors=['#90EE90'], index='municipal_fi', version='municipal_fi')
+
+
+###################################
+# Sources
+###################################
+
+def load_sources(pages=PAGES):
+    """The frames the figures of `pages` are built from, keyed as in
+    Figure.source, plus their data versions."""
+    sources = {}
+    if 'state' in pages:
+        state = load_state()
+        df = add_derived_metrics(state)
+        df['FI_Index'] = fi_index(state)
+        index = MunicipalIndex(load_municipal(), sort_metrics=DRILLDOWN_METRICS)
+        versions = {'state': fingerprint(state), 'municipal': fingerprint(index.frame)}
+        versions['fi'] = f"{versions['state']}:{DEFAULT_SPEC.key()}"
+        versions['municipal_fi'] = f"{versions['municipal']}:{DEFAULT_SPEC.key()}"
+        sources.update({
+            'state': df,
+            'state_ranked': df[df.index != 'Sin identificar'],
+            'municipal_index': index,
+            'municipal_fi': index.overlay({'FI_Index': fi_index(index.frame)}),
+            'versions': versions,
+            'state_keys': {name: int(clave) for name, clave in df['Clave_Estado'].dropna().items()},
+            'maps': geo.available('state'),
+        })
+    if 'historical' in pages:
+        year_end = load_year_end()
+        historical = load_historical()
+        projections = forecast.fit(historical)
+        sources.update({
+            'historical_trends': trend_frame(year_end, projections),
+            'historical_maps': historical_maps(year_end.columns),
+            'historical_version': fingerprint(historical),
+            'trends_version': trends_version(fingerprint(historical), projections),
+            **{f'gender_{card}': card_gender_shares(year_end, card) for card in CARD_TITLES},
+        })
+    return sources
+
+
+def figures(sources, pages=PAGES, drilldowns=False):
+    """Every Figure of `pages`."""
+    result = []
+    if 'state' in pages:
+        result.extend(state_figures(sources, drilldowns))
+    if 'historical' in pages:
+        result.extend(historical_figures(sources))
+    return result
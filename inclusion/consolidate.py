@@ -0,0 +1,86 @@
+"""Collapse the duplicate columns that repeated merges left in the wide CSVs.
+
+The consolidated file carries up to six copies of the same column under merge
+suffixes (Region_x_x, Region_y_x, Region_x, ...), and the state file repeats
+the demographic block once per source table (Poblacion_accessState,
+Poblacion_eacpUsageState, ...). collapse_duplicates() keeps one column per
+distinct (base name, content) pair and returns a lineage map from each kept
+column to the original columns it stands for.
+"""
+import hashlib
+import re
+
+import pandas as pd
+
+# Merge suffixes: pandas' _x/_y (possibly stacked) and the '.1' that read_csv
+# appends to repeated headers, plus the per-source suffixes of the state file
+MERGE_SUFFIX = re.compile(
+    r'(?:_x|_y|_accessState|_eacpUsageState|_bankUsageNational|_eacpUsageNational'
+    r'|_demographicAccessNational)+$'
+)
+REPEAT_SUFFIX = re.compile(r'\.\d+$')
+
+
+def base_name(column):
+    """Column name without merge suffixes ('Region_x_x' -> 'Region')."""
+    name = REPEAT_SUFFIX.sub('', column)
+    name = MERGE_SUFFIX.sub('', name)
+    # 'Cuentas_ahorro_10mil_adultos_ Banca' is the same column as '..._Banca'
+    return re.sub(r'\s+', '', name)
+
+
+def content_hash(series):
+    digest = hashlib.sha1(str(series.dtype).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def collapse_duplicates(df):
+    """Return (frame, lineage) with duplicate columns collapsed.
+
+    Columns are duplicates when they share a base name and hold identical
+    values (same dtype, NaN in the same places). Each group keeps one column,
+    named after the bare base name when that is one of its members or when no
+    other group or original column claims it, and after its first member
+    otherwise. Columns with the same values but unrelated names are left alone:
+    that is more likely a data error upstream than a merge artifact.
+
+    lineage maps every kept column to the original columns it replaces, in
+    file order.
+    """
+    groups = {}
+    for col in df.columns:
+        groups.setdefault((base_name(col), content_hash(df[col])), []).append(col)
+
+    # Guard against hash collisions: split a group on any value mismatch
+    members = []
+    for cols in groups.values():
+        while cols:
+            first = df[cols[0]]
+            same = [c for c in cols if df[c].equals(first)]
+            members.append(same)
+            cols = [c for c in cols if c not in same]
+    members.sort(key=lambda cols: df.columns.get_loc(cols[0]))
+
+    claims = {}
+    for cols in members:
+        claims.setdefault(base_name(cols[0]), []).append(cols)
+    originals = set(df.columns)
+
+    lineage = {}
+    for cols in members:
+        base = base_name(cols[0])
+        if base in cols:
+            name = base
+        elif len(cols) > 1 and len(claims[base]) == 1 and base not in originals:
+            name = base
+        else:
+            name = cols[0]
+        lineage[name] = cols
+    frame = pd.DataFrame({name: df[cols[0]] for name, cols in lineage.items()}, index=df.index)
+    return frame, lineage
+
+
+def aliases(lineage):
+    """{original column: kept column} for every collapsed original."""
+    return {col: name for name, cols in lineage.items() for col in cols if col != name}
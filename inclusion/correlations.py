@@ -0,0 +1,104 @@
+"""Correlation and regression statistics for indicator x index pairs.
+
+correlation_table() computes every pair in one vectorized pass: Pearson and
+Spearman coefficients with two-sided p-values, plus the least-squares slope
+and intercept of the target on the indicator.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def _betacf(a, b, x, max_iter=200, eps=3e-14):
+    # Continued fraction for the incomplete beta function (modified Lentz)
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1, a - 1
+    c, d = 1.0, 1 - qab * x / qap
+    d = 1 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1 + aa * d
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = 1 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1 + aa * d
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = 1 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < eps:
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    """Regularized incomplete beta function I_x(a, b)."""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1 - front * _betacf(b, a, 1 - x) / b
+
+
+def correlation_pvalue(r, n):
+    """Two-sided p-value of correlation coefficients `r` over `n` observations
+    (Student's t with n - 2 degrees of freedom)."""
+    r = np.asarray(r, dtype=float)
+    dof = n - 2
+    if dof <= 0:
+        return np.full(r.shape, np.nan)
+    t2 = r ** 2 / np.clip(1 - r ** 2, 1e-300, None) * dof
+    return np.vectorize(lambda t2: _betainc(dof / 2, 0.5, dof / (dof + t2)) if np.isfinite(t2) else np.nan,
+                        otypes=[float])(t2)
+
+
+def _pearson(x, y):
+    # Correlations of every column of x with every column of y, as one matrix product
+    xc = x - x.mean(axis=0)
+    yc = y - y.mean(axis=0)
+    sx = np.sqrt((xc ** 2).sum(axis=0))
+    sy = np.sqrt((yc ** 2).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (xc.T @ yc) / np.outer(sx, sy)
+
+
+def correlation_table(frame, indicators, targets):
+    """One row per (indicator, target) pair.
+
+    Only rows where all the involved columns are present are used, so every
+    pair is computed over the same n observations.
+    """
+    data = frame[list(indicators) + list(targets)].astype(float).dropna()
+    n = len(data)
+    x = data[list(indicators)].to_numpy()
+    y = data[list(targets)].to_numpy()
+
+    pearson = _pearson(x, y)
+    ranks = data.rank(method='average').to_numpy()
+    spearman = _pearson(ranks[:, :len(indicators)], ranks[:, len(indicators):])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = pearson * np.outer(1 / x.std(axis=0), y.std(axis=0))
+    intercept = y.mean(axis=0)[None, :] - slope * x.mean(axis=0)[:, None]
+
+    pairs = pd.MultiIndex.from_product([indicators, targets], names=['indicator', 'target'])
+    return pd.DataFrame({
+        'n': n,
+        'pearson_r': pearson.ravel(),
+        'pearson_p': correlation_pvalue(pearson.ravel(), n),
+        'spearman_rho': spearman.ravel(),
+        'spearman_p': correlation_pvalue(spearman.ravel(), n),
+        'slope': slope.ravel(),
+        'intercept': intercept.ravel(),
+        'r_squared': pearson.ravel() ** 2,
+    }, index=pairs).reset_index()
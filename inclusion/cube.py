@@ -0,0 +1,225 @@
+"""Rollup cube of the municipal dataset: region × state × population type.
+
+Every *_10mil_adultos rate and every absolute count of the municipal frame is
+summed once into cells of (state, population type); each state belongs to one
+region, so region totals are sums of their states. Rates are stored as
+population-weighted sums, i.e. per cell
+
+    weighted = sum(rate * adults)   weight = sum(adults where the rate is known)
+
+so the rate of any slice is sum(weighted) / sum(weight): the adults-weighted
+mean of its municipalities, which is what the rate of the pooled population
+would be. Averaging the cell rates instead would weigh a village like a city.
+
+``python -m inclusion.ingest`` writes the cube to build/cube.npz next to the
+Parquet files; load_cube() reads it (or builds it from the municipal dataset
+when it's missing or stale). Cube adds the "all" margins on both axes when it
+is loaded, so every (region or state, population type) slice afterwards is
+an array lookup.
+
+Municipal rates are not the published state-level ones (the CNBV computes
+those from state totals, see validate.ROLLUP_RULES), so the dashboard keeps
+using the state frame unless a population type is picked.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from inclusion.data import BUILD_DIR, load_dataset, source_stamp, source_unchanged
+from inclusion.drilldown import MUNICIPAL_ALIASES
+
+CUBE_FILE = 'cube.npz'
+# Bump when the layout of the arrays below changes, so existing files count as stale
+CUBE_VERSION = 2
+
+ALL = 'All'
+REGION_COL = 'Region_accessMunicipal'
+STATE_COL = 'Estado_accessMunicipal'
+TYPE_COL = 'Tipo_de_poblacion_accessMunicipal'
+# Municipalities without a state (Clave_Estado 99) are left out, as in the state frame
+UNKNOWN_STATE = 'Sin identificar'
+
+# Adults each family of rates is expressed per: the municipal file merges three
+# CNBV tables, each with its own population columns
+RATE_WEIGHTS = (
+    ('_EACP', 'Poblacion_adulta_eacpUsageMunicipal'),
+    ('_Banca', 'Poblacion_adulta'),
+    ('', 'Poblacion_adulta_accessMunicipal'),
+)
+
+
+def rate_weight(column):
+    return next(weight for suffix, weight in RATE_WEIGHTS if column.endswith(suffix))
+
+
+def cube_columns(df):
+    """(rates, counts) of the municipal frame: the *_10mil_adultos columns and
+    the other numeric ones but the keys."""
+    numeric = [col for col in df.select_dtypes('number').columns
+               if not col.startswith(('Clave_', 'Unnamed'))]
+    rates = [col for col in numeric if '_10mil_adultos' in col]
+    return rates, [col for col in numeric if col not in rates]
+
+
+def _codes(series):
+    labels = sorted(series.dropna().unique())
+    return pd.Categorical(series, categories=labels).codes, labels
+
+
+def build(df=None):
+    """The cube's arrays, as written to CUBE_FILE, from the municipal frame."""
+    if df is None:
+        df = load_dataset('municipal')
+    df = df[df[STATE_COL].astype(str) != UNKNOWN_STATE]
+    rates, counts = cube_columns(df)
+    state, states = _codes(df[STATE_COL].astype(str))
+    kind, types = _codes(df[TYPE_COL].astype(str))
+    region, regions = _codes(df[REGION_COL].astype(str))
+    region_of = np.zeros(len(states), dtype=np.int16)
+    region_of[state] = region
+
+    values = df[rates].to_numpy(dtype=np.float64)
+    adults = df[[rate_weight(col) for col in rates]].to_numpy(dtype=np.float64)
+    known = ~np.isnan(values) & ~np.isnan(adults)
+    shape = (len(states), len(types))
+    weighted = np.zeros(shape + (len(rates),))
+    weight = np.zeros(shape + (len(rates),))
+    totals = np.zeros(shape + (len(counts),))
+    municipalities = np.zeros(shape, dtype=np.int32)
+    # Unbuffered sums, so repeated (state, type) cells accumulate
+    np.add.at(weighted, (state, kind), np.where(known, values * adults, 0.0))
+    np.add.at(weight, (state, kind), np.where(known, adults, 0.0))
+    np.add.at(totals, (state, kind), np.nan_to_num(df[counts].to_numpy(dtype=np.float64)))
+    np.add.at(municipalities, (state, kind), 1)
+    return {
+        'version': np.array(CUBE_VERSION),
+        **{key: np.array(value) for key, value in source_stamp('municipal').items()},
+        'states': np.array(states), 'regions': np.array(regions), 'types': np.array(types),
+        'region_of': region_of,
+        'rates': np.array([MUNICIPAL_ALIASES.get(col, col) for col in rates]),
+        'counts': np.array(counts),
+        'weighted': weighted, 'weight': weight, 'totals': totals, 'municipalities': municipalities,
+    }
+
+
+def cube_path(build_dir=None):
+    return os.path.join(build_dir or BUILD_DIR, CUBE_FILE)
+
+
+def write(build_dir=BUILD_DIR, df=None):
+    """Build the cube and write it to build_dir; returns the Cube."""
+    arrays = build(df)
+    path = cube_path(build_dir)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return Cube(arrays)
+
+
+def load_cube(build_dir=None):
+    """The cube written at ingest, or one built from the municipal dataset
+    when the file is missing or the CSV changed since (data.source_unchanged)."""
+    path = cube_path(build_dir)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            arrays = dict(data)
+        if int(arrays['version']) == CUBE_VERSION and source_unchanged('municipal', {
+                key: arrays[key].item() for key in ('source_bytes', 'source_mtime_ns', 'source_sha256')}):
+            return Cube(arrays)
+    return Cube(build())
+
+
+class Cube:
+    """Rates and totals per (state or region, population type), ALL included.
+
+    Rows of the state level are the states, those of the region level the
+    regions followed by ALL; columns of both are the population types
+    followed by ALL.
+    """
+
+    def __init__(self, arrays):
+        self.states = [str(s) for s in arrays['states']]
+        self.regions = [str(r) for r in arrays['regions']]
+        self.types = [str(t) for t in arrays['types']]
+        self.rates = [str(c) for c in arrays['rates']]
+        self.counts = [str(c) for c in arrays['counts']]
+        self.region_of = arrays['region_of'].astype(np.intp)
+        self._rate_index = {col: i for i, col in enumerate(self.rates)}
+        self._count_index = {col: i for i, col in enumerate(self.counts)}
+
+        digest = hashlib.sha1()
+        for name in ('weighted', 'weight', 'totals', 'region_of'):
+            digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+        self.version = digest.hexdigest()[:16]
+
+        # Margins: an ALL column of population types, then region rows plus an ALL row
+        by_state = {name: self._with_all_types(arrays[name])
+                    for name in ('weighted', 'weight', 'totals', 'municipalities')}
+        members = np.zeros((len(self.regions) + 1, len(self.states)), dtype=np.int64)
+        members[self.region_of, np.arange(len(self.states))] = 1
+        members[-1] = 1
+        self._levels = {
+            'state': by_state,
+            'region': {name: np.tensordot(members, values, axes=1) for name, values in by_state.items()},
+        }
+
+    @staticmethod
+    def _with_all_types(values):
+        return np.concatenate([values, values.sum(axis=1, keepdims=True)], axis=1)
+
+    def _type(self, population_type):
+        return len(self.types) if population_type in (None, ALL) else self.types.index(population_type)
+
+    def _row(self, level, name):
+        if level == 'state':
+            return self.states.index(name)
+        return len(self.regions) if name in (None, ALL) else self.regions.index(name)
+
+    def rate(self, metric, region=None, population_type=None, state=None):
+        """Adults-weighted rate of `metric` over one state, one region or the
+        whole country (region ALL), optionally for one population type."""
+        level, name = ('state', state) if state is not None else ('region', region)
+        cells = self._levels[level]
+        row, col, m = self._row(level, name), self._type(population_type), self._rate_index[metric]
+        weight = cells['weight'][row, col, m]
+        return cells['weighted'][row, col, m] / weight if weight else np.nan
+
+    def total(self, count, region=None, population_type=None, state=None):
+        level, name = ('state', state) if state is not None else ('region', region)
+        return self._levels[level]['totals'][self._row(level, name), self._type(population_type),
+                                             self._count_index[count]]
+
+    def table(self, level='state', population_type=None, region=None, rates=None, counts=None):
+        """One row per state (of `region`, if given) or per region (plus ALL)
+        for one population type: the rates, the totals and the number of
+        municipalities. Rows without municipalities of that type are left out."""
+        cells = self._levels[level]
+        col = self._type(population_type)
+        if level == 'state':
+            rows = np.arange(len(self.states))
+            if region not in (None, ALL):
+                rows = rows[self.region_of == self.regions.index(region)]
+            index = pd.Index([self.states[i] for i in rows], name='Estado')
+        else:
+            rows = np.arange(len(self.regions) + 1)
+            index = pd.Index(self.regions + [ALL], name='Region')
+        rates = self.rates if rates is None else list(rates)
+        counts = self.counts if counts is None else list(counts)
+        r = [self._rate_index[c] for c in rates]
+        weight = cells['weight'][rows, col][:, r]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(weight > 0, cells['weighted'][rows, col][:, r] / weight, np.nan)
+        frame = pd.concat([
+            pd.DataFrame(values, index=index, columns=rates),
+            pd.DataFrame(cells['totals'][rows, col][:, [self._count_index[c] for c in counts]],
+                         index=index, columns=counts),
+        ], axis=1)
+        frame['Municipios'] = cells['municipalities'][rows, col]
+        return frame[frame['Municipios'] > 0]
+
+    def states_of(self, region):
+        if region in (None, ALL):
+            return list(self.states)
+        return [self.states[i] for i in np.flatnonzero(self.region_of == self.regions.index(region))]
@@ -0,0 +1,218 @@
+"""Dataset registry and loaders.
+
+Every CSV the dashboards read is registered in DATASETS. Running
+``python -m inclusion.ingest`` converts them to Parquet files under build/;
+load_dataset() reads those (memory-mapped, only the requested columns) and
+falls back to parsing the CSV when they haven't been built.
+
+Each registry entry also describes how to type the raw text: thousands
+separators, decimal commas and categorical columns. Both paths apply it, so
+the dashboards always get numeric, compact frames (int32 and float32 where
+those hold every value exactly, and categoricals) and never convert strings
+per render.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.environ.get('FIMX_BUILD_DIR', os.path.join(ROOT_DIR, 'build'))
+MANIFEST_FILE = 'manifest.json'
+
+# Bump when the typing or layout below changes, so existing columnar builds
+# count as stale
+SCHEMA_VERSION = 4
+
+# csv: source file in the repo root
+# thousands: thousands separator used in the numeric columns
+# decimal_comma: prefixes of columns whose values may use a decimal comma
+# categorical: prefixes of text columns stored as categoricals
+# collapse: drop duplicated merge-artifact columns (see inclusion.consolidate);
+#           the originals stay loadable by name through the manifest's aliases
+DATASETS = {
+    'state': {
+        'csv': 'State-Level_Consolidated_Dataset.csv',
+        'decimal_comma': ('%',),
+        # 'Estado' itself becomes the index of the state frame, so it stays text
+        'categorical': ('Region', 'Estado_', 'Entidad_Federativa'),
+        'collapse': True,
+    },
+    'municipal': {
+        'csv': 'Municipal-Level_Consolidated_Dataset.csv',
+        'categorical': ('Region', 'Estado', 'Tipo_de_poblacion'),
+    },
+    'consolidated': {
+        'csv': 'Consolidated_Financial_Dataset.csv',
+        'categorical': ('Region', 'Estado', 'Tipo_de_poblacion', 'Entidad_Federativa'),
+        'collapse': True,
+    },
+    'historical': {
+        'csv': 'Base_de_Datos_de_Inclusion_Financiera_202406 - Hoja 1.csv',
+        'thousands': ',',
+    },
+}
+
+def csv_path(name):
+    return os.path.join(ROOT_DIR, DATASETS[name]['csv'])
+
+
+def parquet_path(name, build_dir=None):
+    return os.path.join(build_dir or BUILD_DIR, f'{name}.parquet')
+
+
+def read_manifest(build_dir=None):
+    path = os.path.join(build_dir or BUILD_DIR, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _compact(series):
+    """Downcast a numeric column to int32/float32 where that loses nothing."""
+    values = series.to_numpy()
+    if pd.api.types.is_integer_dtype(series):
+        info = np.iinfo(np.int32)
+        if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return series.astype(np.int32)
+        return series
+    if pd.api.types.is_float_dtype(series):
+        # Only when every value survives the round trip: ratios with more than
+        # ~7 significant digits and whole numbers above 2**24 stay float64
+        compact = values.astype(np.float32)
+        if np.array_equal(compact.astype(values.dtype), values, equal_nan=True):
+            return series.astype(np.float32)
+        return series
+    return series
+
+
+def apply_schema(name, df):
+    """Type a freshly parsed frame according to its DATASETS entry."""
+    spec = DATASETS[name]
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object and col.startswith(spec.get('decimal_comma', ())):
+            series = series.str.replace(',', '.').astype(float)
+        if series.dtype == object and col.startswith(spec.get('categorical', ())):
+            series = series.astype('category')
+        columns[col] = _compact(series)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def read_csv(name, columns=None, typed=True, path=None):
+    """Parse the raw CSV for a dataset, optionally keeping only `columns`.
+
+    With typed=False the CSV is parsed as-is, without the registry's typing.
+    `path` reads another file in the same format (e.g. a new release) instead
+    of the registered one.
+    """
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = lambda c: c.strip() in wanted
+    thousands = DATASETS[name].get('thousands') if typed else None
+    df = pd.read_csv(path or csv_path(name), usecols=usecols, thousands=thousands)
+    df.columns = df.columns.str.strip()
+    if columns is not None:
+        df = df[list(columns)]
+    return apply_schema(name, df) if typed else df
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# (path, size, mtime) -> sha256 of the source CSVs hashed so far in this process
+_source_hashes = {}
+
+
+def _source_sha256(path, stat):
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _source_hashes:
+        _source_hashes[key] = sha256_file(path)
+    return _source_hashes[key]
+
+
+def source_stamp(name):
+    """Size, modification time and sha256 of the CSV of `name`, recorded by
+    whatever is built from it (see source_unchanged())."""
+    source = csv_path(name)
+    stat = os.stat(source)
+    return {'source_bytes': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns,
+            'source_sha256': _source_sha256(source, stat)}
+
+
+def source_unchanged(name, stamp):
+    """Whether the CSV of `name` is still the one source_stamp() described.
+
+    A different size settles it, the same size and modification time vouch
+    for it, anything else is hashed.
+    """
+    source = csv_path(name)
+    stat = os.stat(source)
+    if stat.st_size != stamp.get('source_bytes'):
+        return False
+    return stat.st_mtime_ns == stamp.get('source_mtime_ns') or _source_sha256(source, stat) == stamp.get('source_sha256')
+
+
+def _columnar_entry(name, build_dir=None):
+    """Manifest entry of the built Parquet file for `name`, or None if
+    missing or stale."""
+    entry = read_manifest(build_dir).get('datasets', {}).get(name)
+    path = parquet_path(name, build_dir)
+    if entry is None or not os.path.exists(path) or entry.get('schema_version') != SCHEMA_VERSION:
+        return None
+    # The CSV changed since the last ingest
+    if not source_unchanged(name, entry):
+        return None
+    return entry
+
+
+def load_dataset(name, columns=None, build_dir=None):
+    """Load a registered dataset as a DataFrame.
+
+    Reads the columnar build when it exists and is up to date, otherwise
+    parses the CSV. Passing `columns` restricts the read to those columns;
+    for collapsed datasets they may be any of the original CSV names.
+    Without `columns`, collapsed datasets come back with duplicates removed.
+    """
+    entry = _columnar_entry(name, build_dir)
+    if entry is not None:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            pq = None
+        if pq is not None:
+            path = parquet_path(name, build_dir)
+            if columns is None:
+                return pq.read_table(path, memory_map=True).to_pandas()
+            aliases = entry.get('aliases', {})
+            stored = [aliases.get(c, c) for c in columns]
+            df = pq.read_table(path, columns=list(dict.fromkeys(stored)), memory_map=True).to_pandas()
+            return df[stored].set_axis(list(columns), axis=1)
+    df = read_csv(name, columns)
+    if columns is None and DATASETS[name].get('collapse'):
+        from inclusion.consolidate import collapse_duplicates
+        df, _ = collapse_duplicates(df)
+    return df
+
+
+def fingerprint(df):
+    """Content hash of a DataFrame (values, index and column names), used as
+    its version in cache keys."""
+    digest = hashlib.sha1()
+    digest.update('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,118 @@
+"""State -> municipality drill-down over the municipal dataset.
+
+MunicipalIndex is built once per process: it groups the municipal rows by
+Clave_Estado and precomputes, for every metric, the order of each state's
+municipalities. A drill-down is then a slice of at most k rows instead of a
+mask and sort over the whole frame.
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+from inclusion import metrics
+from inclusion.data import load_dataset
+from inclusion.index_engine import fi_index
+from inclusion.shared import shared_frame
+
+# Municipal column names that differ from their state-level counterparts
+MUNICIPAL_ALIASES = {
+    'Cuentas_transaccionales_tradicionales_10mil_adultos_Banca':
+        'Cuentas_cuentas_transaccionales_tradicionales_10mil_adultos_Banca',
+}
+
+MUNICIPAL_COLUMNS = [
+    'Clave_Municipio', 'Clave_Estado', 'Municipio', 'Poblacion', 'Poblacion_adulta',
+    'Tipo_de_poblacion_accessMunicipal',
+    'Sucursales_banca_desarrollo_10mil_adultos', 'Sucursales_cooperativas_10mil_adultos',
+    'Sucursales_microfinancieras_10mil_adultos', 'TPV_10mil_adultos', 'Contratos_celular_10mil_adultos',
+] + metrics.infrastructure_columns + metrics.credit_columns + [
+    'Cuentas_Nivel1_10mil_adultos_Banca', 'Cuentas_Nivel2_10mil_adultos_Banca',
+    'Cuentas_Nivel3_10mil_adultos_Banca', 'Cuentas_transaccionales_tradicionales_10mil_adultos_Banca',
+]
+
+
+def load_municipal(columns=MUNICIPAL_COLUMNS):
+    """Municipal frame with state-level column names and the derived metrics.
+
+    The dataset columns are the read-only ones of the shared store; the
+    derived metrics are added to a shallow copy.
+    """
+    df = shared_frame('municipal', lambda: load_dataset('municipal', columns=columns).rename(columns=MUNICIPAL_ALIASES),
+                      columns)
+    df = df.copy(deep=False)
+    df['Mobile_Banking_Penetration'] = metrics.mobile_banking_penetration(df)
+    df['FI_Index'] = fi_index(df)
+    return df
+
+
+class MunicipalIndex:
+    """Row offsets of each state's municipalities, plus per-metric sort orders."""
+
+    def __init__(self, frame, sort_metrics, state_col='Clave_Estado'):
+        # reset_index copies every column, so skip it when the index is already 0..n-1
+        if not frame.index.equals(pd.RangeIndex(len(frame))):
+            frame = frame.reset_index(drop=True)
+        self.frame = frame
+        keys = self.frame[state_col].to_numpy()
+
+        # One stable sort by state gives contiguous runs; remember where each run starts
+        by_state = np.argsort(keys, kind='stable')
+        states, starts = np.unique(keys[by_state], return_index=True)
+        ends = np.append(starts[1:], len(keys))
+        self._bounds = {state: (start, end) for state, start, end in zip(states.tolist(), starts, ends)}
+        self._rows = by_state
+
+        # lexsort by (state, -value) orders every state's rows by the metric in one pass.
+        # The runs line up with _bounds because the state is the primary key.
+        self._values = {}
+        self._orders = {}
+        for metric in sort_metrics:
+            values = self.frame[metric].to_numpy(dtype=float)
+            self._orders[metric] = np.lexsort((-values, keys))
+
+    def overlay(self, values):
+        """A view of this index where the columns in `values` (full-length
+        Series, e.g. an index evaluated with custom weights) replace the
+        stored ones. The row offsets and sort orders are shared."""
+        view = copy.copy(self)
+        view._values = {**self._values, **values}
+        return view
+
+    @property
+    def states(self):
+        return list(self._bounds)
+
+    def rows(self, state, sort_by=None, ascending=False):
+        """Positional row offsets of a state's municipalities (empty if unknown)."""
+        if state not in self._bounds:
+            return np.empty(0, dtype=np.intp)
+        start, end = self._bounds[state]
+        if sort_by is None:
+            return self._rows[start:end]
+        rows = self._orders[sort_by][start:end]
+        return rows[::-1] if ascending else rows
+
+    def slice(self, state, sort_by=None, ascending=False, columns=None, values=None):
+        """The municipalities of `state` as a DataFrame, optionally sorted by a
+        precomputed metric (descending by default) and restricted to `columns`.
+
+        `values` maps column names to full-length Series that replace the
+        stored column, e.g. an index evaluated with custom weights. Sorting by
+        one of them only sorts the state's k rows.
+        """
+        values = {**self._values, **(values or {})}
+        if sort_by in values:
+            rows = self.rows(state)
+            order = np.argsort(-values[sort_by].to_numpy(dtype=float)[rows], kind='stable')
+            rows = rows[order[::-1] if ascending else order]
+        else:
+            rows = self.rows(state, sort_by, ascending)
+        if columns is None:
+            view = self.frame.iloc[rows]
+        else:
+            view = self.frame.iloc[rows, self.frame.columns.get_indexer(columns)]
+        overridden = [name for name in values if name in view.columns]
+        if overridden:
+            view = view.assign(**{name: values[name].to_numpy()[rows] for name in overridden})
+        return view
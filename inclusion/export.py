@@ -0,0 +1,279 @@
+"""Static export: every figure of the dashboards as a bundle any web server or CDN can serve.
+
+Usage::
+
+    python -m inclusion.export                        # build/static
+    python -m inclusion.export --output site --workers 8 --drilldowns
+
+The figures are the ones inclusion.catalog lists for every widget value,
+rendered in a process pool (through the figure cache, so a warm
+FIMX_FIGURE_CACHE_DIR is reused) and written as
+
+    index.html                      the only file that isn't content-addressed
+    shell.<hash>.js                 renders a page's sections, one select per section
+    plotly-<version>.<hash>.min.js
+    manifest.<hash>.json            pages > sections > figures and their files
+    figures/<hash>.json             one per distinct figure, without its template
+    templates/<hash>.json           the Plotly templates the figures share
+
+Every name but index.html carries a hash of its content, so they can be served
+with a long immutable Cache-Control and only index.html needs revalidating.
+Files of earlier exports are left in place for clients still holding an older
+index.html; --clean removes those the new manifest doesn't reference.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from inclusion import catalog
+from inclusion.data import BUILD_DIR
+from inclusion.figcache import default_cache
+from inclusion.figures import CHARTS
+
+STATIC_DIR = os.path.join(BUILD_DIR, 'static')
+# Navigation label and title of each page
+PAGE_TITLES = {
+    'state': ('June 2024', 'Financial Inclusion Analysis - Mexico, June 2024'),
+    'historical': ('Historical data', 'Financial Inclusion Analysis - Mexico, historical data'),
+}
+
+
+def content_name(data, prefix='', suffix='.json'):
+    return f'{prefix}{hashlib.sha256(data).hexdigest()[:16]}{suffix}'
+
+
+def write_file(root, name, data):
+    """Write `data` to root/name unless it's already there (names are content hashes)."""
+    path = os.path.join(root, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return name
+
+
+def compact(fig_json):
+    """Split a figure's JSON into the figure without its layout template and
+    the template, which is the same for every figure and most of its bytes."""
+    fig = json.loads(fig_json)
+    template = fig.get('layout', {}).pop('template', None)
+    encode = lambda value: json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return encode(fig), (encode(template) if template is not None else None)
+
+
+def render(figure, sources, root):
+    """Write one Figure's files under `root`; returns (figure file, template file)."""
+    fig_json = default_cache().get_or_build(
+        figure.spec(), lambda: CHARTS[figure.chart](sources[figure.source], **figure.params))
+    fig, template = compact(fig_json)
+    template_name = write_file(root, content_name(template, 'templates/'), template) if template else None
+    return write_file(root, content_name(fig, 'figures/'), fig), template_name
+
+
+# Sources of an export worker process, loaded once by the initializer
+_worker_sources = None
+
+
+def _init_worker(pages):
+    global _worker_sources
+    _worker_sources = catalog.load_sources(pages)
+
+
+def _render_in_worker(figure, root):
+    return render(figure, _worker_sources, root)
+
+
+def render_all(figures, sources, pages, root, workers=None):
+    """render() every figure, in a process pool unless workers=1."""
+    if workers == 1:
+        return [render(figure, sources, root) for figure in figures]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pages,)) as pool:
+        return list(pool.map(_render_in_worker, figures, [root] * len(figures), chunksize=8))
+
+
+def manifest(figures, files, sources, pages):
+    """Pages > sections > figures (option, file, template, wide), in page order."""
+    result = {'pages': [], 'versions': {}}
+    if 'state' in pages:
+        result['versions'].update(sources['versions'])
+    if 'historical' in pages:
+        result['versions']['historical'] = sources['historical_version']
+    for page in pages:
+        sections = {}
+        for figure, (file, template) in zip(figures, files):
+            if figure.page == page:
+                sections.setdefault(figure.section, []).append(
+                    {'option': figure.option, 'file': file, 'template': template,
+                     'wide': figure.use_container_width})
+        label, title = PAGE_TITLES[page]
+        result['pages'].append({'id': page, 'label': label, 'title': title,
+                                'sections': [{'title': section, 'figures': entries}
+                                             for section, entries in sections.items()]})
+    return result
+
+
+def plotly_js():
+    import plotly
+
+    path = os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
+    with open(path, 'rb') as f:
+        return plotly.__version__, f.read()
+
+
+def export(root=STATIC_DIR, pages=catalog.PAGES, drilldowns=False, workers=None, clean=False):
+    """Write the bundle under `root`; returns a summary dict."""
+    start = time.perf_counter()
+    pages = tuple(pages)
+    sources = catalog.load_sources(pages)
+    figures = list(catalog.figures(sources, pages, drilldowns))
+    files = render_all(figures, sources, pages, root, workers)
+
+    manifest_data = json.dumps(manifest(figures, files, sources, pages), separators=(',', ':'),
+                               ensure_ascii=False).encode('utf-8')
+    version, plotly_data = plotly_js()
+    names = {
+        'manifest': write_file(root, content_name(manifest_data, 'manifest.'), manifest_data),
+        'shell': write_file(root, content_name(SHELL_JS.encode('utf-8'), 'shell.', '.js'), SHELL_JS.encode('utf-8')),
+        'plotly': write_file(root, content_name(plotly_data, f'plotly-{version}.', '.min.js'), plotly_data),
+    }
+    index = INDEX_HTML.format(**names).encode('utf-8')
+    with open(os.path.join(root, 'index.html'), 'wb') as f:
+        f.write(index)
+
+    referenced = {'index.html', *names.values()} | {name for pair in files for name in pair if name}
+    removed = remove_unreferenced(root, referenced) if clean else 0
+    distinct = {file for file, _ in files}
+    return {
+        'figures': len(figures),
+        'files': len(distinct),
+        'bytes': sum(os.path.getsize(os.path.join(root, name)) for name in distinct),
+        'removed': removed,
+        'manifest': names['manifest'],
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def remove_unreferenced(root, referenced):
+    removed = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, '/')
+            if name not in referenced:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+INDEX_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Financial Inclusion MX</title>
+<link rel="icon" href="data:image/svg+xml,<svg xmlns=%22http://www.w3.org/2000/svg%22 viewBox=%220 0 100 100%22><text y=%22.9em%22 font-size=%2290%22>💸</text></svg>">
+<style>
+body {{ font-family: "Source Sans Pro", sans-serif; max-width: 760px; margin: 0 auto; padding: 1rem; color: #31333f; }}
+nav a {{ margin-right: 1rem; cursor: pointer; }}
+nav a.active {{ font-weight: bold; }}
+select {{ font-size: 1rem; margin: .25rem 0 .5rem; max-width: 100%; }}
+.figure {{ min-height: 450px; }}
+</style>
+</head>
+<body>
+<nav id="pages"></nav>
+<main id="content"></main>
+<script src="{plotly}"></script>
+<script src="{shell}" data-manifest="{manifest}"></script>
+</body>
+</html>
+"""
+
+SHELL_JS = """(function () {
+  var manifestUrl = document.currentScript.getAttribute('data-manifest');
+  var cache = {};
+  function fetchJson(url) {
+    if (!cache[url]) cache[url] = fetch(url).then(function (r) { return r.json(); });
+    return cache[url];
+  }
+  function el(tag, text) {
+    var node = document.createElement(tag);
+    if (text) node.textContent = text;
+    return node;
+  }
+  function plot(div, entry) {
+    var parts = [fetchJson(entry.file)];
+    if (entry.template) parts.push(fetchJson(entry.template));
+    Promise.all(parts).then(function (loaded) {
+      var fig = loaded[0], layout = Object.assign({}, fig.layout);
+      if (loaded[1]) layout.template = loaded[1];
+      if (entry.wide) layout.autosize = true;
+      Plotly.react(div, fig.data, layout, {displaylogo: false, responsive: entry.wide});
+    });
+  }
+  function showSection(root, section) {
+    root.appendChild(el('h2', section.title));
+    var always = section.figures.filter(function (f) { return !f.option; });
+    var options = [];
+    section.figures.forEach(function (f) { if (f.option && options.indexOf(f.option) < 0) options.push(f.option); });
+    var area = el('div');
+    function draw(option) {
+      area.innerHTML = '';
+      section.figures.forEach(function (f) {
+        if (f.option === option) { var div = el('div'); div.className = 'figure'; area.appendChild(div); plot(div, f); }
+      });
+    }
+    always.forEach(function (f) { var div = el('div'); div.className = 'figure'; root.appendChild(div); plot(div, f); });
+    if (options.length) {
+      var select = el('select');
+      options.forEach(function (o) { select.appendChild(el('option', o)); });
+      select.onchange = function () { draw(select.value); };
+      root.appendChild(select);
+      root.appendChild(area);
+      draw(options[0]);
+    }
+  }
+  fetchJson(manifestUrl).then(function (manifest) {
+    var nav = document.getElementById('pages'), content = document.getElementById('content');
+    function showPage(page) {
+      content.innerHTML = '';
+      content.appendChild(el('h1', page.title));
+      page.sections.forEach(function (section) { showSection(content, section); });
+      Array.prototype.forEach.call(nav.children, function (a) { a.className = a.dataset.page === page.id ? 'active' : ''; });
+      history.replaceState(null, '', '#' + page.id);
+    }
+    manifest.pages.forEach(function (page) {
+      var a = el('a', page.label);
+      a.dataset.page = page.id;
+      a.onclick = function () { showPage(page); };
+      nav.appendChild(a);
+    });
+    var wanted = location.hash.slice(1);
+    showPage(manifest.pages.filter(function (p) { return p.id === wanted; })[0] || manifest.pages[0]);
+  });
+})();
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=STATIC_DIR, help='bundle directory')
+    parser.add_argument('--pages', nargs='+', choices=catalog.PAGES, default=list(catalog.PAGES))
+    parser.add_argument('--drilldowns', action='store_true', help="also every state's municipal drill-downs")
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--clean', action='store_true', help='remove files the new manifest does not reference')
+    args = parser.parse_args(argv)
+
+    summary = export(args.output, args.pages, args.drilldowns, args.workers, args.clean)
+    print(f"{summary['figures']} figures, {summary['files']} files, {summary['bytes'] / 1e6:.1f} MB, "
+          f"{summary['removed']} stale files removed, {summary['seconds']:.1f} s")
+    print(f"wrote {os.path.join(args.output, 'index.html')} ({summary['manifest']})")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+"""Cache of serialized Plotly figures.
+
+A ChartSpec names a builder from inclusion.figures, the version of the data
+it reads and the widget values it depends on. FigureCache keeps the figure
+JSON for each spec in a bounded LRU (and optionally on disk), so repeated
+interactions, from any session, skip pandas and Plotly entirely.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from inclusion.profiling import record, timed
+
+
+@dataclass(frozen=True)
+class ChartSpec:
+    chart: str
+    version: str
+    params: str  # canonical JSON of the builder's keyword arguments
+
+    @classmethod
+    def make(cls, chart, version, **params):
+        return cls(chart, version, json.dumps(params, sort_keys=True, default=str))
+
+    def key(self):
+        payload = f'{self.chart}\x1f{self.version}\x1f{self.params}'
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class FigureCache:
+    """Thread-safe LRU of figure JSON keyed by ChartSpec.key()."""
+
+    def __init__(self, maxsize=256, disk_dir=None):
+        self.maxsize = maxsize
+        self.disk_dir = disk_dir
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return self._figures[key]
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            with open(self._disk_path(key), encoding='utf-8') as f:
+                fig_json = f.read()
+            with self._lock:
+                self.disk_hits += 1
+            self._store(key, fig_json)
+            return fig_json
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, fig_json):
+        with self._lock:
+            self._figures[key] = fig_json
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+                self.evictions += 1
+
+    def put(self, key, fig_json):
+        self._store(key, fig_json)
+        if self.disk_dir:
+            # Write then rename so concurrent readers never see a partial file
+            tmp_path = f'{self._disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(fig_json)
+            os.replace(tmp_path, self._disk_path(key))
+
+    def get_or_build(self, spec, build):
+        """Figure JSON for `spec`, calling `build()` (which returns a Plotly
+        figure) only on a miss."""
+        key = spec.key()
+        fig_json = self.get(key)
+        if fig_json is None:
+            with timed('plotly_build'):
+                fig = build()
+            with timed('plotly_serialize'):
+                fig_json = fig.to_json()
+            self.put(key, fig_json)
+        return fig_json
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._figures),
+                'maxsize': self.maxsize,
+                'bytes': sum(len(fig_json) for fig_json in self._figures.values()),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """Process-wide cache, sized by FIMX_FIGURE_CACHE_SIZE and persisted to
+    FIMX_FIGURE_CACHE_DIR when that is set."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = FigureCache(
+                maxsize=int(os.environ.get('FIMX_FIGURE_CACHE_SIZE', 256)),
+                disk_dir=os.environ.get('FIMX_FIGURE_CACHE_DIR') or None,
+            )
+        return _default_cache
+
+
+def cached_figure(chart, source, version, cache=None, **params):
+    """Figure JSON for builder `chart` applied to `source` with `params`."""
+    from inclusion.figures import CHARTS
+
+    spec = ChartSpec.make(chart, version, **params)
+    return (cache or default_cache()).get_or_build(spec, lambda: CHARTS[chart](source, **params))
+
+
+# Streamlit releases whose PlotlyChart message plotly_chart_json() fills in
+# directly; any other version goes through the public st.plotly_chart
+DIRECT_PLOTLY_VERSIONS = ('1.22.',)
+
+
+def _direct_plotly_chart(st, fig_json, use_container_width):
+    # Private API: the message st.plotly_chart itself builds in these versions
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+
+    proto = PlotlyChartProto()
+    proto.use_container_width = use_container_width
+    proto.figure.spec = fig_json
+    proto.figure.config = json.dumps({'showLink': False, 'linkText': False})
+    proto.theme = 'streamlit'
+    return st._main._enqueue('plotly_chart', proto)
+
+
+def plotly_chart_json(fig_json, use_container_width=False):
+    """st.plotly_chart for an already serialized figure.
+
+    st.plotly_chart re-serializes the figure on every call; on the Streamlit
+    versions in DIRECT_PLOTLY_VERSIONS this fills in the same message with
+    the cached JSON instead. Elsewhere, or if that message has changed, the
+    figure is rehydrated with plotly.io.from_json and passed to the public
+    st.plotly_chart.
+    """
+    import streamlit as st
+
+    record('payload_bytes', len(fig_json))
+    record('charts', 1)
+    if st.__version__.startswith(DIRECT_PLOTLY_VERSIONS):
+        try:
+            return _direct_plotly_chart(st, fig_json, use_container_width)
+        except (ImportError, AttributeError, TypeError, ValueError):
+            pass
+    import plotly.io as pio
+
+    return st.plotly_chart(pio.from_json(fig_json), use_container_width=use_container_width)
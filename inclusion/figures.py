@@ -0,0 +1,427 @@
+"""Plotly figure builders for every chart in the dashboards.
+
+Each builder takes its source data plus the widget values that shape the
+chart, and nothing else, so a figure is fully determined by (data version,
+chart name, params). That is what lets the figure cache, the warm-up and
+the static export build charts outside of a Streamlit run.
+"""
+import plotly.express as px
+
+from inclusion import geo
+from inclusion.historical import quarter_col, year_col
+from inclusion.metrics import account_columns, credit_columns, indicators, institution_columns
+
+# Friendly names and colors
+infrastructure_labels = {
+    'Sucursales_banca_comercial_10mil_adultos': 'Commercial bank branches',
+    'Cajeros_10mil_adultos': 'ATMs',
+    'Corresponsales_10mil_adultos': 'Banking agents (corresponsales)'
+}
+
+infrastructure_metrics = {
+    'Sucursales_banca_comercial_10mil_adultos': '#1f77b4',
+    'Cajeros_10mil_adultos': '#2ca02c',
+    'Corresponsales_10mil_adultos': '#d62728'
+}
+
+account_labels = {
+    'Cuentas_Nivel1_10mil_adultos_Banca': 'Cuentas nivel 1',
+    'Cuentas_Nivel2_10mil_adultos_Banca': 'Cuentas nivel 2',
+    'Cuentas_Nivel3_10mil_adultos_Banca': 'Cuentas nivel 3',
+    'Cuentas_cuentas_transaccionales_tradicionales_10mil_adultos_Banca': 'Cuentas transaccionales tradicionales'
+}
+
+credit_labels = {
+    'Creditos_hipotecarios_10mil_adultos_Banca': 'Mortgage (Hipotecarios)',
+    'Creditos_personales_10mil_adultos_Banca': 'Personal (Personales)',
+    'Creditos_nomina_10mil_adultos_Banca': 'Salary (Nómina)',
+    'Creditos_automotrices_10mil_adultos_Banca': 'Automotive (Automotriz)',
+    'Creditos_ABCD_10mil_adultos_Banca': 'ABCD'
+}
+
+institution_colors = {
+    'Sucursales_banca_comercial_10mil_adultos': '#1f77b4',
+    'Sucursales_banca_desarrollo_10mil_adultos': '#ff7f0e',
+    'Sucursales_cooperativas_10mil_adultos': '#2ca02c',
+    'Sucursales_microfinancieras_10mil_adultos': '#d62728'
+}
+
+institution_labels = {
+    'Sucursales_banca_comercial_10mil_adultos': 'Commercial banks',
+    'Sucursales_banca_desarrollo_10mil_adultos': 'Development banks',
+    'Sucursales_cooperativas_10mil_adultos': 'Cooperatives',
+    'Sucursales_microfinancieras_10mil_adultos': 'Microfinance institutions',
+    'variable': 'Institution type'
+}
+
+indicator_labels = {
+    'TPV_10mil_adultos': 'POS',
+    'Sucursales_banca_comercial_10mil_adultos': 'Commercial bank branches', 
+    'Cajeros_10mil_adultos': 'ATMs',
+    'Corresponsales_10mil_adultos': 'Banking agents',
+    'Contratos_celular_10mil_adultos': 'Mobile banking contracts'
+}
+
+# Legend on the right of the stacked bar charts
+side_legend = dict(
+    orientation="v",
+    yanchor="top",
+    y=1,
+    xanchor="left",
+    x=1.02,
+    font=dict(size=10)
+)
+
+
+###################################
+# State-level dashboard
+###################################
+
+def population(df):
+    return px.scatter(df, x='Poblacion', y='Adult_Population_Percentage', 
+                      size='Superficie_km2', hover_name=df.index, 
+                      labels={'Poblacion': 'total population', 
+                              'Adult_Population_Percentage': 'adult population as (%)', 
+                              'Superficie_km2': 'Area (km²)'},
+                      title='Population demographics by state; size represents area')
+
+
+def infrastructure(df, metric):
+    fig = px.bar(df.sort_values(metric, ascending=False), 
+                 y=metric, 
+                 title=f'{infrastructure_labels[metric]} per 10,000 Adults',
+                 color_discrete_sequence=[infrastructure_metrics[metric]])
+    fig.update_layout(
+        xaxis_title='state', 
+        yaxis_title='number per 10,000 adults', 
+        height=600,
+        xaxis_tickangle=-45
+    )
+    return fig
+
+
+def accounts(df, view_type):
+    if view_type == 'Absolute numbers':
+        account_data_abs = df[account_columns]
+        account_data_renamed = account_data_abs.rename(columns=account_labels)
+        fig = px.bar(
+            account_data_renamed.sort_values(list(account_labels.values())[0], ascending=False),
+            y=list(account_labels.values()),
+            title='Account ownership by type per 10,000 adults'
+        )
+        fig.update_layout(
+            xaxis_title='state', 
+            yaxis_title='accounts per 10,000 adults', 
+            barmode='stack', 
+            height=700
+        )
+    else:
+        account_data_percentage = df[account_columns].div(df[account_columns].sum(axis=1), axis=0) * 100
+        account_data_renamed = account_data_percentage.rename(columns=account_labels)
+        fig = px.bar(
+            account_data_renamed.sort_values(list(account_labels.values())[0], ascending=False),
+            y=list(account_labels.values()),
+            title='Account Ownership by Type (Percentage)'
+        )
+        fig.update_layout(
+            xaxis_title='State', 
+            yaxis_title='Percentage', 
+            barmode='stack', 
+            height=700
+        )
+
+    fig.update_layout(
+        legend=side_legend,
+        margin=dict(l=50, r=300, t=80, b=200),
+        xaxis_tickangle=-45,
+        height=700
+    )
+    return fig
+
+
+def credit(df):
+    credit_data_renamed = df[credit_columns].rename(columns=credit_labels)
+    fig = px.bar(
+        credit_data_renamed.sort_values('Mortgage (Hipotecarios)', ascending=False), 
+        y=list(credit_labels.values()),
+        title='Credit product penetration per 10,000 adults'
+    )
+    fig.update_layout(
+        xaxis_title='state', 
+        yaxis_title='credits per 10,000 adults', 
+        barmode='stack', 
+        height=700,
+        legend=side_legend,
+        margin=dict(l=50, r=300, t=80, b=200),
+        xaxis_tickangle=-45
+    )
+    return fig
+
+
+def mobile(df):
+    fig = px.bar(
+        df.sort_values('Mobile_Banking_Penetration', ascending=False), 
+        y='Mobile_Banking_Penetration', 
+        title='Mobile banking adoption by state'
+    )
+    fig.update_layout(
+        xaxis_title='state', 
+        yaxis_title='mobile banking contracts per adult', 
+        height=600,
+        xaxis_tickangle=-45
+    )
+    return fig
+
+
+def institution(df, column):
+    fig = px.bar(df.sort_values(column, ascending=False), 
+                 y=column,
+                 title=f'{institution_labels[column]} per 10,000 adults',
+                 color_discrete_sequence=[institution_colors[column]],
+                 labels={
+                     column: institution_labels[column],
+                     "variable": ""  # This removes the "Institution type" label
+                 })
+    fig.update_layout(
+        xaxis_title='state', 
+        yaxis_title='branches per 10,000 adults', 
+        height=700,
+        width=1200,
+        showlegend=False,  # This hides the legend for individual view
+        margin=dict(l=50, r=300, t=80, b=200),
+        xaxis_tickangle=-45
+    )
+    return fig
+
+
+def institutions_total(df):
+    # Create a new DataFrame with renamed columns for plotting
+    plot_data = df[institution_columns].copy()
+    plot_data.columns = [institution_labels[col] for col in institution_columns]
+
+    fig = px.bar(plot_data.sort_values('Commercial banks', ascending=False), 
+                 y=list(institution_labels.values())[:4],  # Only take the first 4 values (excluding 'variable')
+                 title='Total financial institution branches per 10,000 adults',
+                 color_discrete_map={
+                     'Commercial banks': '#1f77b4',
+                     'Development banks': '#ff7f0e',
+                     'Cooperatives': '#2ca02c',
+                     'Microfinance institutions': '#d62728'
+                 })
+    fig.update_layout(
+        xaxis_title='state', 
+        yaxis_title='branches per 10,000 adults', 
+        barmode='stack', 
+        height=700,
+        legend=side_legend,
+        margin=dict(l=50, r=300, t=80, b=200),
+        xaxis_tickangle=-45
+    )
+    return fig
+
+
+def relationship(df, indicator):
+    return px.scatter(
+        df, 
+        x=indicator, 
+        y='FI_Index', 
+        size='Poblacion', 
+        hover_name=df.index, 
+        labels={
+            indicator: f'{indicator_labels[indicator]} per 10,000 adults', 
+            'FI_Index': 'Financial Inclusion Index',
+            'Poblacion': 'Population'
+        },
+        title=f'Relationship between {indicator_labels[indicator]} and Financial Inclusion Index; size = population'
+    )
+
+
+def relationships_faceted(df):
+    long_data = df.reset_index().melt(
+        id_vars=['Estado', 'FI_Index', 'Poblacion'],
+        value_vars=indicators,
+        var_name='Indicator',
+        value_name='per 10,000 adults'
+    )
+    long_data['Indicator'] = long_data['Indicator'].map(indicator_labels)
+    fig = px.scatter(
+        long_data, 
+        x='per 10,000 adults', 
+        y='FI_Index', 
+        size='Poblacion', 
+        hover_name='Estado', 
+        facet_col='Indicator', 
+        facet_col_wrap=2,
+        facet_row_spacing=0.08,
+        labels={
+            'FI_Index': 'FI Index',
+            'Poblacion': 'Population'
+        },
+        title='Indicators vs Financial Inclusion Index; size = population'
+    )
+    fig.update_xaxes(matches=None, showticklabels=True)
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split('=')[-1]))
+    fig.update_layout(height=900)
+    return fig
+
+
+def fi_ranking(df):
+    fig = px.bar(df.sort_values('FI_Index', ascending=False), 
+                 y='FI_Index',
+                 title='Financial Inclusion Index by state',
+                 color_discrete_sequence=['#90EE90'])  # Light green color
+    fig.update_layout(
+        xaxis_title='State',
+        yaxis_title='Financial Inclusion Index',
+        height=600,
+        xaxis_tickangle=-45,
+        showlegend=False
+    )
+    return fig
+
+
+def state_map(df, metric, title, colorbar_title):
+    """Choropleth alternative to the per-state bars; needs geo.available('state')."""
+    geojson, _ = geo.layer_geojson('state')
+    data = df[['Clave_Estado', metric]].dropna(subset=['Clave_Estado'])
+    fig = px.choropleth(data, geojson=geojson, locations=data['Clave_Estado'].astype(int),
+                        color=metric, hover_name=data.index,
+                        color_continuous_scale='Viridis',
+                        labels={metric: colorbar_title, 'locations': 'Clave_Estado'},
+                        title=title)
+    fig.update_geos(fitbounds='locations', visible=False)
+    fig.update_layout(height=600, margin=dict(l=0, r=0, t=60, b=0))
+    return fig
+
+
+###################################
+# Municipal drill-downs
+###################################
+
+def municipal_bars(index, state, state_name, y, title, yaxis_title, labels=None, colors=None):
+    """Bars for the municipalities of one state, from a MunicipalIndex."""
+    view = index.slice(state, sort_by=y[0], columns=['Municipio'] + list(y))
+    if labels:
+        view = view.rename(columns=labels)
+        y = [labels[col] for col in y]
+    fig = px.bar(view, x='Municipio', y=list(y),
+                 title=f'{title} - {state_name} municipalities',
+                 color_discrete_sequence=colors)
+    fig.update_layout(
+        xaxis_title='municipality', 
+        yaxis_title=yaxis_title, 
+        barmode='stack', 
+        height=600,
+        xaxis_tickangle=-45,
+        legend_title=''
+    )
+    return fig
+
+
+def municipal_map(index, state, state_name, metric, title, colorbar_title):
+    """Choropleth of one state's municipalities; needs geo.available('municipal')."""
+    geojson, _ = geo.layer_geojson('municipal', state=state)
+    view = index.slice(state, columns=['Clave_Municipio', 'Municipio', metric])
+    fig = px.choropleth(view, geojson=geojson, locations=view['Clave_Municipio'].astype(int),
+                        color=metric, hover_name='Municipio',
+                        color_continuous_scale='Viridis',
+                        labels={metric: colorbar_title, 'locations': 'Clave_Municipio'},
+                        title=f'{title} - {state_name} municipalities')
+    fig.update_geos(fitbounds='locations', visible=False)
+    fig.update_layout(height=600, margin=dict(l=0, r=0, t=60, b=0))
+    return fig
+
+
+def municipal_relationship(index, state, state_name, indicator):
+    municipalities = index.slice(state, columns=['Municipio', indicator, 'FI_Index', 'Poblacion'])
+    return px.scatter(
+        municipalities, 
+        x=indicator, 
+        y='FI_Index', 
+        size='Poblacion', 
+        hover_name='Municipio', 
+        labels={
+            indicator: f'{indicator_labels[indicator]} per 10,000 adults', 
+            'FI_Index': 'Financial Inclusion Index',
+            'Poblacion': 'Population'
+        },
+        title=f'{indicator_labels[indicator]} and Financial Inclusion Index - {state_name} municipalities'
+    )
+
+
+###################################
+# Historical dashboard
+###################################
+
+def trend_bar(df, column, title, color, yaxis_title):
+    # Rows flagged 'forecast' (see historical.trend_frame) are projected
+    # year-end values, drawn over the bars' years with their interval
+    projected = df['forecast'] if 'forecast' in df.columns else None
+    actual = df if projected is None else df[~projected]
+    fig = px.bar(actual[[year_col, column]], x=year_col, y=column,
+                 title=title,
+                 color_discrete_sequence=[color])
+    if projected is not None and projected.any() and df.loc[projected, column].notna().any():
+        forecast = df[projected]
+        fig.add_scatter(x=forecast[year_col], y=forecast[column], mode='markers', name='forecast',
+                        text=forecast[year_col] + ' ' + forecast[quarter_col],
+                        hovertemplate='%{text}: %{y}<extra>forecast</extra>',
+                        marker={'color': color, 'symbol': 'diamond', 'size': 9},
+                        error_y={'type': 'data', 'symmetric': False,
+                                 'array': forecast[f'{column} upper'] - forecast[column],
+                                 'arrayminus': forecast[column] - forecast[f'{column} lower']})
+    fig.update_layout(
+        barmode='group',
+        xaxis_title='year',
+        yaxis_title=yaxis_title
+    )
+    return fig
+
+
+def gender_lines(data, title):
+    # Separate lines for men and women
+    fig = px.line(data, x='Year', y=['Women', 'Men'],
+                  title=title,
+                  color_discrete_map={'Women': '#ff7f0e', 'Men': '#1f77b4'})
+    fig.update_layout(
+        xaxis_title='year',
+        yaxis_title='number of cards',
+        legend_title='gender'
+    )
+    return fig
+
+
+def gender_split(data, title):
+    # Stacked bars of the percentage split
+    fig = px.bar(data, x='Year', y=['Women %', 'Men %'],
+                 title=title,
+                 color_discrete_map={'Women %': '#ff7f0e', 'Men %': '#1f77b4'})
+    fig.update_layout(
+        xaxis_title='year',
+        yaxis_title='percentage',
+        barmode='stack',
+        legend_title='gender',
+        yaxis_range=[0, 100]  # Force y-axis to be 0-100%
+    )
+    return fig
+
+
+CHARTS = {
+    'population': population,
+    'infrastructure': infrastructure,
+    'accounts': accounts,
+    'credit': credit,
+    'mobile': mobile,
+    'institution': institution,
+    'institutions_total': institutions_total,
+    'relationship': relationship,
+    'relationships_faceted': relationships_faceted,
+    'fi_ranking': fi_ranking,
+    'state_map': state_map,
+    'municipal_bars': municipal_bars,
+    'municipal_map': municipal_map,
+    'municipal_relationship': municipal_relationship,
+    'trend_bar': trend_bar,
+    'gender_lines': gender_lines,
+    'gender_split': gender_split,
+}
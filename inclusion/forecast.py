@@ -0,0 +1,111 @@
+"""Projections of every quarterly CNBV series, fitted all at once.
+
+Each series gets a linear trend with quarterly seasonality,
+
+    y[t] = a + b * t + s[quarter(t)] + e[t]
+
+fitted by least squares over its last `window` quarters. The design matrix X
+(intercept, trend and three quarter dummies) is the same for every column, so
+the fit is one batch of small normal-equation systems: with W the (quarters,
+columns) mask of observed values, X'WX and X'Wy are computed for all columns
+with einsum and solved together, so columns with gaps or shorter histories
+are fitted on the quarters they have, without a per-column loop.
+
+The prediction intervals are the usual OLS ones under normal errors,
+mean ± z * sigma * sqrt(1 + x0' (X'WX)^-1 x0). Columns with fewer than
+MIN_OBSERVATIONS quarters in the window get no forecast (NaN).
+"""
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from inclusion.periods import QUARTERS, period_number, quarter_col, year_col
+
+HORIZON = 4
+WINDOW = 20  # quarters the models are fitted on (five years)
+LEVEL = 0.95
+MIN_OBSERVATIONS = 8
+
+_QUARTER_LABELS = {number - 1: label for label, number in QUARTERS.items()}
+
+
+def design(periods):
+    """(len(periods), 5) design matrix: intercept, trend, Q2-Q4 dummies."""
+    periods = np.asarray(periods)
+    quarter = periods % 4
+    return np.column_stack([np.ones(len(periods)), periods.astype(float)]
+                           + [(quarter == q).astype(float) for q in (1, 2, 3)])
+
+
+def metric_columns(df):
+    """The numeric series of the quarterly frame (everything but the period columns)."""
+    return [col for col in df.select_dtypes('number').columns if col != year_col]
+
+
+class Forecast:
+    """Projections of `columns` for the `horizon` quarters after the last one
+    of the series: mean, lower and upper as (horizon, columns) arrays."""
+
+    def __init__(self, columns, periods, mean, lower, upper, level, window):
+        self.columns = list(columns)
+        self.periods = periods
+        self.mean = mean
+        self.lower = lower
+        self.upper = upper
+        self.level = level
+        self.window = window
+
+    def key(self):
+        """Settings part of a figure-cache version; the data version is the rest."""
+        return f'forecast-{len(self.periods)}q-{self.window}w-{self.level:g}'
+
+    def table(self):
+        """One row per projected quarter: year, quarter and, per column, the
+        projection and its '<column> lower' / '<column> upper' bounds."""
+        frame = pd.DataFrame({year_col: self.periods // 4,
+                              quarter_col: [_QUARTER_LABELS[p % 4] for p in self.periods]})
+        values = {}
+        for i, col in enumerate(self.columns):
+            values[col] = self.mean[:, i]
+            values[f'{col} lower'] = self.lower[:, i]
+            values[f'{col} upper'] = self.upper[:, i]
+        return pd.concat([frame, pd.DataFrame(values)], axis=1)
+
+
+def fit(df, columns=None, horizon=HORIZON, window=WINDOW, level=LEVEL):
+    """Forecast of `columns` (default: metric_columns()) of the quarterly frame `df`."""
+    columns = metric_columns(df) if columns is None else list(columns)
+    periods = period_number(df).to_numpy()
+    order = np.argsort(periods, kind='stable')
+    periods = periods[order]
+    values = df[columns].to_numpy(dtype=float)[order]
+
+    last = periods[-1]
+    fitted = periods > last - window
+    periods, values = periods[fitted], values[fitted]
+    # Trend measured from the last quarter keeps X'WX well conditioned
+    X = design(periods - last)
+    observed = ~np.isnan(values)
+    W = observed.astype(float)
+    y = np.where(observed, values, 0.0)
+
+    XtWX = np.einsum('tk,ti,tj->kij', W, X, X)  # (columns, 5, 5)
+    XtWy = np.einsum('tk,ti,tk->ki', W, X, y)  # (columns, 5)
+    counts = observed.sum(axis=0)
+    usable = counts >= MIN_OBSERVATIONS
+    # pinv also copes with columns missing a quarter of the year (singular X'WX)
+    inverse = np.linalg.pinv(np.where(usable[:, None, None], XtWX, np.eye(X.shape[1])))
+    beta = np.einsum('kij,kj->ki', inverse, XtWy)
+
+    residuals = np.where(observed, y - X @ beta.T, 0.0)
+    dof = np.maximum(counts - np.linalg.matrix_rank(XtWX), 1)
+    sigma = np.sqrt((residuals ** 2).sum(axis=0) / dof)
+
+    future = last + np.arange(1, horizon + 1)
+    X0 = design(future - last)  # (horizon, 5)
+    mean = X0 @ beta.T  # (horizon, columns)
+    leverage = np.einsum('hi,kij,hj->hk', X0, inverse, X0)
+    half_width = NormalDist().inv_cdf(0.5 + level / 2) * sigma * np.sqrt(1 + leverage)
+    mean[:, ~usable] = np.nan
+    return Forecast(columns, future, mean, mean - half_width, mean + half_width, level, window)
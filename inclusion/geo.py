@@ -0,0 +1,361 @@
+"""State and municipal geometries for the choropleth maps.
+
+The boundaries aren't part of the repository (the INEGI Marco Geoestadístico
+is several hundred MB); put GeoJSON exports in FIMX_GEO_DIR (default geo/):
+
+    estados.geojson     one feature per state, property CVE_ENT
+    municipios.geojson  one feature per municipality, property CVEGEO
+
+Without them the dashboards keep their bar charts (see available()).
+
+Neighbouring polygons share their borders, so the features are first turned
+into a topology: coordinates quantized to an integer grid, rings cut at the
+points where neighbours meet, and every border stored once as an arc. Each arc
+point gets a Douglas-Peucker importance (the largest tolerance that still
+keeps it), computed once; simplifying to any tolerance is then a mask, and
+since shared borders are simplified once, neighbours stay gap-free at every
+zoom level. The topology is saved under build/geo/ keyed by the source file,
+so only the first process on a host pays for building it, and every process
+keeps the decoded GeoJSON per (layer, tolerance, state) in memory. Both are
+keyed on the size and mtime of the GeoJSON (layer_version()), so a replaced
+file is picked up by running processes.
+
+layer_geojson() picks the finest of TOLERANCES whose payload fits in
+MAX_GEOMETRY_BYTES, which bounds what a map adds to the figure sent to the
+browser.
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from inclusion.data import BUILD_DIR, ROOT_DIR
+
+GEO_DIR = os.environ.get('FIMX_GEO_DIR', os.path.join(ROOT_DIR, 'geo'))
+
+# file: GeoJSON file in GEO_DIR
+# key: feature property holding the id the datasets join on
+#      (Clave_Estado for states, Clave_Municipio, i.e. CVEGEO, for municipalities)
+LAYERS = {
+    'state': {'file': 'estados.geojson', 'key': 'CVE_ENT'},
+    'municipal': {'file': 'municipios.geojson', 'key': 'CVEGEO'},
+}
+
+# Simplification tolerances in degrees, coarsest first
+TOLERANCES = {'country': 0.02, 'region': 0.005, 'detail': 0.001}
+MAX_GEOMETRY_BYTES = int(os.environ.get('FIMX_GEO_MAX_BYTES', 600_000))
+
+# Grid cells per axis of the quantized coordinates
+QUANTIZATION = 100_000
+# Rough size of one "[-99.12345,19.12345]," pair in the GeoJSON
+BYTES_PER_POINT = 22
+# Bump when the saved topology format changes
+TOPOLOGY_VERSION = 1
+
+
+def geojson_path(layer):
+    return os.path.join(GEO_DIR, LAYERS[layer]['file'])
+
+
+def available(layer):
+    """Whether the boundaries of `layer` ('state' or 'municipal') are installed."""
+    return os.path.exists(geojson_path(layer))
+
+
+def layer_version(layer):
+    """Short hash of the installed geometry file, for figure cache keys."""
+    try:
+        stat = os.stat(geojson_path(layer))
+    except OSError:
+        return 'none'
+    payload = json.dumps([layer, stat.st_size, stat.st_mtime_ns, QUANTIZATION, TOPOLOGY_VERSION])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+###################################
+# Topology
+###################################
+
+def _polygons(geometry):
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def _junctions(rings):
+    """Grid ids of the points where rings stop running alongside each other:
+    a point reached from different neighbours in different rings."""
+    points, lows, highs = [], [], []
+    for ring in rings:
+        ids = ring[:-1]
+        prev, nxt = np.roll(ids, 1), np.roll(ids, -1)
+        points.append(ids)
+        lows.append(np.minimum(prev, nxt))
+        highs.append(np.maximum(prev, nxt))
+    triples = np.unique(np.column_stack([np.concatenate(points), np.concatenate(lows), np.concatenate(highs)]),
+                        axis=0)
+    ids, counts = np.unique(triples[:, 0], return_counts=True)
+    return ids[counts > 1]
+
+
+def _importance(points, closed):
+    """Douglas-Peucker importance of every point of an arc (grid units).
+
+    A point survives simplification to tolerance t when its importance is
+    above t. Endpoints are always kept, and so is the most important interior
+    point (two for closed rings), so no ring collapses below a triangle.
+    """
+    n = len(points)
+    importance = np.zeros(n)
+    importance[0] = importance[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    xy = points.astype(float)
+    while stack:
+        start, end, ceiling = stack.pop()
+        if end - start < 2:
+            continue
+        inner = xy[start + 1:end]
+        a, b = xy[start], xy[end]
+        ab = b - a
+        length = np.hypot(*ab)
+        if length == 0:
+            distances = np.hypot(*(inner - a).T)
+        else:
+            distances = np.abs(ab[0] * (inner[:, 1] - a[1]) - ab[1] * (inner[:, 0] - a[0])) / length
+        k = int(np.argmax(distances))
+        # A point can't outlive the split that exposed it
+        value = min(distances[k], ceiling)
+        importance[start + 1 + k] = value
+        stack.append((start, start + 1 + k, value))
+        stack.append((start + 1 + k, end, value))
+    keep = 2 if closed else 1
+    interior = importance[1:-1]
+    if len(interior):
+        interior[np.argsort(-interior)[:keep]] = np.inf
+    return importance
+
+
+class Topology:
+    """Features of one layer as shared, quantized arcs.
+
+    coords: (n, 2) int32 grid coordinates of every arc, concatenated
+    offsets: start of each arc in coords (plus the end)
+    importance: float32 Douglas-Peucker importance of each point (grid units)
+    geometries: [{'id': int, 'polygons': [[ring, ...], ...]}] where a ring is a
+        list of arc references, ~i meaning arc i reversed
+    origin, scale: coordinate = origin + grid * scale
+    """
+
+    def __init__(self, coords, offsets, importance, geometries, origin, scale):
+        self.coords = coords
+        self.offsets = offsets
+        self.importance = importance
+        self.geometries = geometries
+        self.origin = np.asarray(origin, dtype=float)
+        self.scale = float(scale)
+        self._by_id = {geometry['id']: geometry for geometry in geometries}
+
+    @classmethod
+    def from_features(cls, features, key, quantization=QUANTIZATION):
+        rings_by_feature = []
+        all_coords = []
+        for feature in features:
+            polygons = [[np.asarray(ring, dtype=float)[:, :2] for ring in polygon]
+                        for polygon in _polygons(feature.get('geometry'))]
+            rings_by_feature.append((int(feature['properties'][key]), polygons))
+            all_coords.extend(ring for polygon in polygons for ring in polygon)
+        stacked = np.concatenate(all_coords)
+        origin = stacked.min(axis=0)
+        scale = float((stacked.max(axis=0) - origin).max()) / (quantization - 1) or 1.0
+
+        # Quantize, drop repeated points and close every ring
+        width = quantization + 1
+        flat = []
+        for _, polygons in rings_by_feature:
+            for polygon in polygons:
+                for i, ring in enumerate(polygon):
+                    grid = np.round((ring - origin) / scale).astype(np.int64)
+                    grid = grid[np.r_[True, np.any(np.diff(grid, axis=0) != 0, axis=1)]]
+                    if len(grid) and np.any(grid[0] != grid[-1]):
+                        grid = np.vstack([grid, grid[:1]])
+                    polygon[i] = grid
+                    if len(grid) >= 4:
+                        flat.append(grid[:, 0] * width + grid[:, 1])
+        junctions = _junctions(flat) if flat else np.empty(0, dtype=np.int64)
+
+        arcs, arc_index = [], {}
+
+        def reference(ids):
+            forward = ids.tobytes()
+            if forward in arc_index:
+                return arc_index[forward]
+            backward = ids[::-1].tobytes()
+            if backward in arc_index:
+                return ~arc_index[backward]
+            arc_index[forward] = len(arcs)
+            arcs.append(ids)
+            return len(arcs) - 1
+
+        geometries = []
+        for feature_id, polygons in rings_by_feature:
+            encoded = []
+            for polygon in polygons:
+                rings = []
+                for i, grid in enumerate(polygon):
+                    if len(grid) < 4:
+                        if i == 0:
+                            # The exterior collapsed, so the polygon goes with it
+                            break
+                        continue
+                    ids = grid[:-1, 0] * width + grid[:-1, 1]
+                    cuts = np.flatnonzero(np.isin(ids, junctions))
+                    if len(cuts) == 0:
+                        # An island or enclave: one closed arc, rotated to a
+                        # canonical start so a ring shared by two features matches
+                        ids = np.roll(ids, -int(np.argmin(ids)))
+                        rings.append([reference(np.append(ids, ids[0]))])
+                        continue
+                    ids = np.roll(ids, -int(cuts[0]))
+                    cuts = cuts - cuts[0]
+                    ids = np.append(ids, ids[0])
+                    bounds = np.append(cuts, len(ids) - 1)
+                    rings.append([reference(ids[start:end + 1]) for start, end in zip(bounds[:-1], bounds[1:])])
+                if rings:
+                    encoded.append(rings)
+            geometries.append({'id': feature_id, 'polygons': encoded})
+
+        lengths = np.array([len(arc) for arc in arcs], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        ids = np.concatenate(arcs) if arcs else np.empty(0, dtype=np.int64)
+        coords = np.column_stack([ids // width, ids % width]).astype(np.int32)
+        importance = np.concatenate([
+            _importance(coords[start:end], closed=bool(np.all(coords[start] == coords[end - 1])))
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]).astype(np.float32) if arcs else np.empty(0, dtype=np.float32)
+        return cls(coords, offsets, importance, geometries, origin, scale)
+
+    # Persistence
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+        np.savez(tmp_path, coords=self.coords, offsets=self.offsets, importance=self.importance,
+                 origin=self.origin, scale=np.array(self.scale),
+                 geometries=np.array(json.dumps(self.geometries)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['coords'], data['offsets'], data['importance'],
+                       json.loads(str(data['geometries'])), data['origin'], float(data['scale']))
+
+    # Simplification
+
+    def _kept(self, tolerance):
+        return self.importance > tolerance / self.scale
+
+    def point_count(self, tolerance, ids=None):
+        """Points the GeoJSON of `ids` (all features by default) has at `tolerance`."""
+        kept = np.add.reduceat(self._kept(tolerance).astype(np.int64), self.offsets[:-1]) if len(self.coords) else []
+        total = 0
+        for geometry in self._select(ids):
+            for polygon in geometry['polygons']:
+                for ring in polygon:
+                    total += sum(int(kept[ref if ref >= 0 else ~ref]) - 1 for ref in ring) + 1
+        return total
+
+    def _select(self, ids):
+        if ids is None:
+            return self.geometries
+        return [self._by_id[i] for i in ids if i in self._by_id]
+
+    def to_geojson(self, tolerance, ids=None, precision=5):
+        """FeatureCollection of `ids` (all by default) simplified to `tolerance`
+        degrees, with each feature's join key as its 'id'.
+
+        Exterior rings are clockwise and holes counter-clockwise, the winding
+        the browser's d3-geo projection expects.
+        """
+        kept = self._kept(tolerance)
+        arcs = {}
+
+        def arc(ref):
+            index = ref if ref >= 0 else ~ref
+            if index not in arcs:
+                start, end = self.offsets[index], self.offsets[index + 1]
+                arcs[index] = self.coords[start:end][kept[start:end]]
+            return arcs[index] if ref >= 0 else arcs[index][::-1]
+
+        features = []
+        for geometry in self._select(ids):
+            polygons = []
+            for polygon in geometry['polygons']:
+                rings = []
+                for i, ring in enumerate(polygon):
+                    parts = [arc(ref) for ref in ring]
+                    grid = np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+                    xy = self.origin + grid * self.scale
+                    area = np.sum(xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1])
+                    if (area > 0) == (i == 0):
+                        xy = xy[::-1]
+                    rings.append(np.round(xy, precision).tolist())
+                polygons.append(rings)
+            features.append({
+                'type': 'Feature',
+                'id': geometry['id'],
+                'properties': {},
+                'geometry': {'type': 'MultiPolygon', 'coordinates': polygons},
+            })
+        return {'type': 'FeatureCollection', 'features': features}
+
+
+###################################
+# Per-process caches
+###################################
+
+_build_lock = threading.Lock()
+
+
+def load_topology(layer):
+    """Topology of `layer`, built from the GeoJSON on first use and saved
+    under build/geo/ for the other processes."""
+    return _load_topology(layer, layer_version(layer))
+
+
+@lru_cache(maxsize=2 * len(LAYERS))
+def _load_topology(layer, version):
+    path = os.path.join(BUILD_DIR, 'geo', f'{layer}-{version}.npz')
+    with _build_lock:
+        if os.path.exists(path):
+            return Topology.load(path)
+        with open(geojson_path(layer), encoding='utf-8') as f:
+            features = json.load(f)['features']
+        topology = Topology.from_features(features, LAYERS[layer]['key'])
+        topology.save(path)
+        return topology
+
+
+def layer_geojson(layer, state=None, max_bytes=MAX_GEOMETRY_BYTES):
+    """(GeoJSON, tolerance) of `layer`, restricted to one state's features
+    when `state` (a Clave_Estado) is given, at the finest tolerance in
+    TOLERANCES that fits `max_bytes` (the coarsest if none does)."""
+    return _layer_geojson(layer, layer_version(layer), state, max_bytes)
+
+
+@lru_cache(maxsize=64)
+def _layer_geojson(layer, version, state, max_bytes):
+    topology = _load_topology(layer, version)
+    ids = None
+    if state is not None:
+        ids = [geometry['id'] for geometry in topology.geometries if geometry['id'] // 1000 == state]
+    levels = sorted(TOLERANCES.values())
+    tolerance = next((t for t in levels if topology.point_count(t, ids) * BYTES_PER_POINT <= max_bytes), levels[-1])
+    return topology.to_geojson(tolerance, ids), tolerance
@@ -0,0 +1,104 @@
+"""Data layer for the historical CNBV dashboard.
+
+The source is the quarterly CNBV sheet (one row per quarter, 2010 4T onwards).
+"""
+import pandas as pd
+
+from inclusion.data import load_dataset
+from inclusion.periods import quarter_col, year_col, year_end
+from inclusion.schema import header_schema
+from inclusion.shared import shared_frame
+
+# Card gender breakdowns: name -> (category, entity) in the historical header
+CARD_BREAKDOWNS = {
+    'debit': ('Tarjetas de débito', 'Banca'),
+    'credit': ('Tarjetas de crédito', 'Banca'),
+}
+
+
+def _quarterly_store():
+    from inclusion.quarterly import QuarterlyStore
+
+    store = QuarterlyStore()
+    return store if store.exists() else None
+
+
+def store_version():
+    """Version of the quarterly store (None without one); it changes with
+    every appended release."""
+    store = _quarterly_store()
+    return None if store is None else store.version
+
+
+def load_historical():
+    """The quarterly sheet, read-only from the shared store.
+
+    Once the quarterly store has been built (python -m inclusion.quarterly
+    rebuild) the series comes from there, appended releases included.
+    """
+    store = _quarterly_store()
+    if store is not None:
+        return shared_frame('historical', store.read, ('quarterly',), version=store.version)
+    return shared_frame('historical', lambda: load_dataset('historical'))
+
+
+def year_end_snapshots(df):
+    """One row per year: the 4T quarter, or the latest one for the current
+    year (2T for 2024)."""
+    return year_end(df, '4T').reset_index(drop=True)
+
+
+def load_year_end():
+    """year_end_snapshots() of the whole series; the quarterly store keeps it
+    precomputed, otherwise it's derived from load_historical()."""
+    store = _quarterly_store()
+    if store is not None:
+        return store.aggregate('year_end')
+    return year_end_snapshots(load_historical())
+
+
+def trend_frame(year_end_df, forecast=None):
+    """Year-end snapshots for the trend charts, with the year as a string
+    (categorical x axis), followed by the projections of `forecast` (a
+    forecast.Forecast) flagged in a 'forecast' column.
+
+    The projections are reduced to year-end snapshots the same way as the
+    bars (4T, or the year's latest projected quarter), so every point on the
+    axis is one year; Periodo_Trimestre says which quarter it is.
+    """
+    frame = year_end_df.copy()
+    frame[year_col] = frame[year_col].astype(str)
+    if forecast is None:
+        return frame
+    projected = year_end(forecast.table(), '4T').reset_index(drop=True)
+    projected[year_col] = projected[year_col].astype(str)
+    frame['forecast'] = False
+    projected['forecast'] = True
+    return pd.concat([frame, projected], ignore_index=True)
+
+
+def trends_version(data_version, forecast):
+    """Figure-cache version of the trend charts over trend_frame()."""
+    return f'{data_version}:{forecast.key()}:year-end'
+
+
+def card_shares(df, women_col, men_col, since=2018):
+    """Women/men counts and percentage split per year, from `since` onwards."""
+    data = pd.DataFrame({
+        'Year': df[year_col],
+        'Women': df[women_col].astype(float),
+        'Men': df[men_col].astype(float)
+    })
+
+    # Filter from `since` onwards and sort
+    data = data[data['Year'] >= since].sort_values('Year')
+
+    data['Total'] = data['Men'] + data['Women']
+    data['Men %'] = (data['Men'] / data['Total'] * 100).round(1)
+    data['Women %'] = (data['Women'] / data['Total'] * 100).round(1)
+    return data
+
+
+def card_gender_shares(df, card, since=2018):
+    """card_shares() for one of CARD_BREAKDOWNS ('debit' or 'credit')."""
+    return card_shares(df, *header_schema(df.columns).gender_pair(*CARD_BREAKDOWNS[card]), since=since)
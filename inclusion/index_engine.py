@@ -0,0 +1,147 @@
+"""Configurable Financial Inclusion Index.
+
+An IndexSpec declares the component columns, their weights and how the
+components are normalized before weighting. IndexEngine evaluates specs
+against one frame as a single matrix-vector product and memoizes the
+results by spec hash, so trying a new weighting only costs the product.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pandas as pd
+
+from inclusion.metrics import account_columns, credit_columns
+
+NORMALIZATIONS = ('none', 'minmax', 'zscore', 'per_capita')
+
+# Component groups the dashboard exposes, with the scale each column gets when
+# the components are left in their raw units (accounts and credits per 10,000
+# adults are in the thousands, so they are divided by 1000)
+COMPONENT_GROUPS = {
+    'Commercial bank branches': (['Sucursales_banca_comercial_10mil_adultos'], 1),
+    'ATMs': (['Cajeros_10mil_adultos'], 1),
+    'Banking agents': (['Corresponsales_10mil_adultos'], 1),
+    'Accounts': (account_columns, 1 / 1000),
+    'Credits': (credit_columns, 1 / 1000),
+}
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """Weighted sum of normalized component columns.
+
+    normalization is one of NORMALIZATIONS: 'minmax' rescales each component
+    to [0, 1], 'zscore' standardizes it, and 'per_capita' divides it by the
+    `population` column (times 10,000), which is meant for absolute counts.
+    """
+    components: tuple
+    normalization: str = 'none'
+    population: str = 'Poblacion_adulta'
+
+    def __post_init__(self):
+        if self.normalization not in NORMALIZATIONS:
+            raise ValueError(f'Unknown normalization {self.normalization!r}; expected one of {NORMALIZATIONS}')
+
+    @property
+    def columns(self):
+        return [column for column, _ in self.components]
+
+    @property
+    def weights(self):
+        return np.array([weight for _, weight in self.components], dtype=float)
+
+    def key(self):
+        payload = json.dumps(asdict(self), sort_keys=True, default=list)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def spec_from_groups(group_weights, normalization='none'):
+    """Build a spec from weights per COMPONENT_GROUPS entry; the weights are
+    normalized to sum to one."""
+    total = sum(group_weights.values())
+    if total <= 0:
+        raise ValueError('At least one component group needs a positive weight')
+    components = []
+    for group, weight in group_weights.items():
+        columns, scale = COMPONENT_GROUPS[group]
+        if normalization in ('minmax', 'zscore'):
+            # Normalized columns are comparable, so a group is the mean of its columns
+            scale = 1 / len(columns)
+        components.extend((column, weight * scale / total) for column in columns)
+    return IndexSpec(tuple(components), normalization)
+
+
+# The original index: mean of the three infrastructure densities and the
+# account and credit totals divided by 1000
+DEFAULT_SPEC = spec_from_groups({group: 1 for group in COMPONENT_GROUPS})
+
+
+def normalize(matrix, method, population=None):
+    """Normalize the columns of a (rows x components) matrix, or of each
+    matrix in a (batch x rows x components) stack."""
+    if method == 'none':
+        return matrix
+    if method == 'minmax':
+        low = np.nanmin(matrix, axis=-2, keepdims=True)
+        span = np.nanmax(matrix, axis=-2, keepdims=True) - low
+        return (matrix - low) / np.where(span == 0, 1, span)
+    if method == 'zscore':
+        std = np.nanstd(matrix, axis=-2, keepdims=True)
+        return (matrix - np.nanmean(matrix, axis=-2, keepdims=True)) / np.where(std == 0, 1, std)
+    if method == 'per_capita':
+        return matrix / population[:, None] * 10000
+    raise ValueError(f'Unknown normalization {method!r}')
+
+
+def combine(components, weights):
+    """Weighted sum over the last axis of normalized `components`.
+
+    Missing components count as 0, as in the original formula's account and
+    credit sums (pandas sums skip NaN), so a gap in one column doesn't blank
+    the index; rows missing every component stay NaN.
+    """
+    missing = np.isnan(components)
+    values = np.where(missing, 0.0, components) @ weights
+    return np.where(missing.all(axis=-1), np.nan, values)
+
+
+class IndexEngine:
+    """Evaluates index specs over one frame, memoizing results by spec hash."""
+
+    def __init__(self, frame, maxsize=128):
+        self.frame = frame
+        self.maxsize = maxsize
+        self._columns = {}
+        self._results = OrderedDict()
+
+    def _column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self.frame[name].to_numpy(dtype=float)
+        return self._columns[name]
+
+    def matrix(self, columns):
+        return np.column_stack([self._column(name) for name in columns])
+
+    def evaluate(self, spec=DEFAULT_SPEC):
+        """The index for every row of the frame, as a Series on its index."""
+        key = spec.key()
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+
+        population = self._column(spec.population) if spec.normalization == 'per_capita' else None
+        values = combine(normalize(self.matrix(spec.columns), spec.normalization, population), spec.weights)
+        result = pd.Series(values, index=self.frame.index, name='FI_Index')
+
+        self._results[key] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+        return result
+
+
+def fi_index(frame, spec=DEFAULT_SPEC):
+    """One-off evaluation of `spec` over `frame` (no memoization)."""
+    return IndexEngine(frame, maxsize=0).evaluate(spec)
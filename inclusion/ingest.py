@@ -0,0 +1,128 @@
+"""Offline ingest: convert every registered CSV to a compressed Parquet file.
+
+Usage::
+
+    python -m inclusion.ingest                 # all datasets
+    python -m inclusion.ingest state municipal # just these
+
+The CSVs are first checked against the consistency rules of
+inclusion.validate (report in build/validation.json); a dataset failing an
+error-level rule stops the ingest before anything is written.
+
+Writes build/<name>.parquet plus build/manifest.json describing the schema,
+row count and source file of each one, and build/cube.npz, the rollup cube
+of the municipal dataset (see inclusion.cube). Datasets registered with
+'collapse' are written without their duplicated merge-artifact columns; the
+manifest keeps the lineage of every kept column and the aliases the loader
+uses to resolve original column names.
+"""
+import argparse
+import datetime
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from inclusion import cube
+from inclusion.consolidate import aliases, collapse_duplicates
+from inclusion.shared import clear as clear_shared
+from inclusion.validate import ValidationError, failures, validate, write_report
+from inclusion.data import (BUILD_DIR, DATASETS, MANIFEST_FILE, SCHEMA_VERSION, memory_bytes,
+                            parquet_path, read_csv, read_manifest, source_stamp)
+
+VALIDATION_FILE = 'validation.json'
+
+
+def build_dataset(name, build_dir=BUILD_DIR, compression='zstd'):
+    """Convert one dataset and return its manifest entry."""
+    df = read_csv(name)
+    raw_memory = memory_bytes(read_csv(name, typed=False))
+    lineage = None
+    source_columns = len(df.columns)
+    if DATASETS[name].get('collapse'):
+        df, lineage = collapse_duplicates(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    path = parquet_path(name, build_dir)
+    pq.write_table(table, path, compression=compression)
+
+    entry = {
+        'file': os.path.basename(path),
+        'source': DATASETS[name]['csv'],
+        **source_stamp(name),
+        'bytes': os.path.getsize(path),
+        'rows': table.num_rows,
+        'compression': compression,
+        'schema_version': SCHEMA_VERSION,
+        'memory_bytes_raw': raw_memory,
+        'memory_bytes': memory_bytes(df),
+        'columns': [{'name': field.name, 'type': str(field.type)} for field in table.schema],
+    }
+    if lineage is not None:
+        entry['lineage'] = {name: cols for name, cols in lineage.items() if cols != [name]}
+        entry['aliases'] = aliases(lineage)
+        entry['source_columns'] = source_columns
+    return entry
+
+
+def build(names=None, build_dir=BUILD_DIR, compression='zstd', drop_shared=True):
+    """Validate and convert `names` (default: all). Nothing is written when a
+    dataset fails an error-level rule (ValidationError); the report is kept
+    as build/validation.json either way.
+
+    drop_shared=False leaves the shared-memory copies alone, for builds into
+    a scratch directory that running dashboards don't read."""
+    names = names or list(DATASETS)
+    os.makedirs(build_dir, exist_ok=True)
+    report = validate(names)
+    write_report(report, os.path.join(build_dir, VALIDATION_FILE))
+    if not report['ok']:
+        raise ValidationError(report)
+    for line in failures(report, 'warning'):
+        print(f'warning: {line}')
+
+    manifest = read_manifest(build_dir) or {'datasets': {}}
+    for name in names:
+        entry = build_dataset(name, build_dir, compression)
+        manifest['datasets'][name] = entry
+        # Running dashboards pick the new build up under a new key; drop the old copies
+        if drop_shared:
+            clear_shared(name)
+        collapsed = f" (from {entry['source_columns']})" if 'source_columns' in entry else ''
+        print(f"{name}: {entry['rows']} rows, {len(entry['columns'])} columns{collapsed}, "
+              f"{entry['source_bytes']:,} -> {entry['bytes']:,} bytes on disk, "
+              f"{entry['memory_bytes_raw']:,} -> {entry['memory_bytes']:,} bytes in memory")
+    if 'municipal' in names:
+        rollup = cube.write(build_dir)
+        print(f"cube: {len(rollup.states)} states x {len(rollup.types)} population types, "
+              f"{len(rollup.rates)} rates, {len(rollup.counts)} counts")
+    manifest['generated'] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    path = os.path.join(build_dir, MANIFEST_FILE)
+    # Readers check the manifest on every load, so never let them see it half-written
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='dataset',
+                        help=f"datasets to convert (default: all of {', '.join(DATASETS)})")
+    parser.add_argument('--build-dir', default=BUILD_DIR)
+    parser.add_argument('--compression', default='zstd', help='Parquet codec (zstd, snappy, gzip, none)')
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(DATASETS)
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(sorted(unknown))}")
+    try:
+        build(args.names, args.build_dir, args.compression)
+    except ValidationError as e:
+        print(f"{e}\nnothing written; see {os.path.join(args.build_dir, VALIDATION_FILE)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,65 @@
+"""Metric definitions shared by the dashboards and the batch tools.
+
+Column names follow the state-level dataset; the municipal frame is renamed
+to match when it's loaded (see inclusion.drilldown).
+"""
+
+infrastructure_columns = [
+    'Sucursales_banca_comercial_10mil_adultos',
+    'Cajeros_10mil_adultos',
+    'Corresponsales_10mil_adultos'
+]
+
+account_columns = [
+    'Cuentas_Nivel1_10mil_adultos_Banca', 
+    'Cuentas_Nivel2_10mil_adultos_Banca', 
+    'Cuentas_Nivel3_10mil_adultos_Banca', 
+    'Cuentas_cuentas_transaccionales_tradicionales_10mil_adultos_Banca'
+]
+
+credit_columns = [
+    'Creditos_hipotecarios_10mil_adultos_Banca', 
+    'Creditos_personales_10mil_adultos_Banca', 
+    'Creditos_nomina_10mil_adultos_Banca', 
+    'Creditos_automotrices_10mil_adultos_Banca', 
+    'Creditos_ABCD_10mil_adultos_Banca'
+]
+
+institution_columns = [
+    'Sucursales_banca_comercial_10mil_adultos', 
+    'Sucursales_banca_desarrollo_10mil_adultos', 
+    'Sucursales_cooperativas_10mil_adultos', 
+    'Sucursales_microfinancieras_10mil_adultos'
+]
+
+indicators = [
+    'TPV_10mil_adultos', 
+    'Sucursales_banca_comercial_10mil_adultos', 
+    'Cajeros_10mil_adultos', 
+    'Corresponsales_10mil_adultos', 
+    'Contratos_celular_10mil_adultos'
+]
+
+
+def mobile_banking_penetration(frame):
+    """Mobile banking contracts per adult."""
+    return frame['Contratos_celular_10mil_adultos'] / 10000
+
+
+def add_derived_metrics(df):
+    """Copy of a state- or municipal-level frame with the columns the
+    dashboard derives: adult population share, mobile banking penetration and
+    total branches, with missing area and population filled by the median.
+
+    The copy is shallow: the source columns are shared with `df` (which may be
+    a read-only frame from inclusion.shared) and only the derived or filled
+    columns are new, so `df` itself is left untouched."""
+    df = df.copy(deep=False)
+    df['Adult_Population_Percentage'] = df['Poblacion_adulta'] / df['Poblacion'] * 100
+    if 'Superficie_km2' in df.columns:
+        df['Superficie_km2'] = df['Superficie_km2'].fillna(df['Superficie_km2'].median())
+    df['Poblacion'] = df['Poblacion'].fillna(df['Poblacion'].median())
+    df['Mobile_Banking_Penetration'] = mobile_banking_penetration(df)
+    # Column by column: df[columns].sum(axis=1) would consolidate, i.e. copy, the frame
+    df['Total_Branches'] = sum(df[col].fillna(0) for col in institution_columns)
+    return df
@@ -0,0 +1,91 @@
+"""Peer municipalities: nearest neighbours over the per-10,000-adults indicators.
+
+PeerIndex z-scores the *_10mil_adultos columns of the municipal frame into one
+float32 matrix (missing values become the column mean, i.e. 0) and indexes it
+once, overall and per population type (Tipo_de_poblacion), so a peer query is
+a tree lookup instead of a distance computation over the whole frame per
+click. The trees come from scipy.spatial.cKDTree when scipy is installed;
+otherwise the queries fall back to one vectorized distance computation
+against the (at most a few thousand) rows of the matrix.
+"""
+import numpy as np
+import pandas as pd
+
+from inclusion.drilldown import MUNICIPAL_ALIASES, MUNICIPAL_COLUMNS
+
+# The indicator columns of the municipal frame, under their state-level names
+PEER_FEATURES = [MUNICIPAL_ALIASES.get(col, col) for col in MUNICIPAL_COLUMNS if '_10mil_adultos' in col]
+TYPE_COL = 'Tipo_de_poblacion_accessMunicipal'
+
+
+def standardize(frame, columns):
+    """float32 z-scores of `columns`, with missing values at the mean (0)."""
+    matrix = frame[columns].to_numpy(dtype=np.float64)
+    std = np.nanstd(matrix, axis=0)
+    matrix = (matrix - np.nanmean(matrix, axis=0)) / np.where(std == 0, 1, std)
+    return np.nan_to_num(matrix, nan=0.0).astype(np.float32)
+
+
+class _Neighbours:
+    """k-NN over a subset of the matrix rows."""
+
+    def __init__(self, points, rows):
+        self.rows = rows
+        self.points = points
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            self._tree = None
+            self._norms = np.einsum('ij,ij->i', points, points)
+        else:
+            self._tree = cKDTree(points)
+
+    def query(self, vector, k):
+        k = min(k, len(self.rows))
+        if k == 0:
+            return np.empty(0, dtype=np.float32), self.rows[:0]
+        if self._tree is not None:
+            distances, positions = self._tree.query(vector, k=k)
+            return np.atleast_1d(distances), self.rows[np.atleast_1d(positions)]
+        squared = self._norms - 2 * (self.points @ vector) + vector @ vector
+        positions = np.argpartition(squared, k - 1)[:k]
+        positions = positions[np.argsort(squared[positions], kind='stable')]
+        return np.sqrt(np.maximum(squared[positions], 0)), self.rows[positions]
+
+
+class PeerIndex:
+    """Nearest municipalities to a given one, by Clave_Municipio."""
+
+    def __init__(self, frame, features=PEER_FEATURES, type_col=TYPE_COL, key_col='Clave_Municipio'):
+        self.frame = frame
+        self.features = list(features)
+        self.type_col = type_col
+        self.matrix = standardize(frame, self.features)
+        self._positions = pd.Index(frame[key_col].to_numpy())
+        all_rows = np.arange(len(frame))
+        self._indexes = {None: _Neighbours(self.matrix, all_rows)}
+        types = frame[type_col].astype(object).to_numpy()
+        for kind in pd.unique(types):
+            if isinstance(kind, str):
+                rows = all_rows[types == kind]
+                self._indexes[kind] = _Neighbours(self.matrix[rows], rows)
+
+    @property
+    def types(self):
+        return [kind for kind in self._indexes if kind is not None]
+
+    def position(self, key):
+        """Row of the municipality with Clave_Municipio `key` (KeyError if unknown)."""
+        return self._positions.get_loc(key)
+
+    def query(self, key, k=10, population_type=None):
+        """The `k` municipalities closest to `key`, optionally only those of
+        one population type, as the frame's rows plus a 'distance' column
+        (in standard deviations), nearest first. `key` itself is left out."""
+        row = self.position(key)
+        index = self._indexes[population_type]
+        # One extra neighbour, since the municipality itself is its own nearest
+        distances, rows = index.query(self.matrix[row], k + 1)
+        keep = rows != row
+        distances, rows = distances[keep][:k], rows[keep][:k]
+        return self.frame.iloc[rows].assign(distance=distances)
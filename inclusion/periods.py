@@ -0,0 +1,88 @@
+"""Period selection over the quarterly CNBV series.
+
+Every rule is a vectorized mask or shift over the whole frame (no per-year
+loops), keyed on the year and quarter columns:
+
+- year_end: one row per year, the given quarter (4T) or, for years that
+  don't have it yet, their latest quarter
+- latest_per_year: the latest available quarter of each year
+- rolling: trailing-window aggregate over consecutive quarters
+- yoy / qoq: change against the same quarter a year earlier / the previous quarter
+"""
+import pandas as pd
+
+year_col = "Periodo_Año"
+quarter_col = "Periodo_Trimestre"
+
+QUARTERS = {'1T': 1, '2T': 2, '3T': 3, '4T': 4}
+
+
+def quarter_number(df):
+    return df[quarter_col].map(QUARTERS)
+
+
+def period_number(df):
+    """Consecutive integer per quarter (year * 4 + quarter - 1), for ordering and shifting."""
+    return df[year_col].astype(int) * 4 + quarter_number(df) - 1
+
+
+def _in_period_order(df):
+    return df.iloc[period_number(df).to_numpy().argsort(kind='stable')]
+
+
+def latest_per_year(df):
+    """The latest available quarter of each year."""
+    quarters = quarter_number(df)
+    mask = quarters == quarters.groupby(df[year_col]).transform('max')
+    return _in_period_order(df[mask])
+
+
+def year_end(df, quarter='4T'):
+    """One row per year: `quarter` where the year has it, otherwise the year's
+    latest quarter (e.g. 4T for past years and 2T for the current one)."""
+    quarters = quarter_number(df)
+    is_target = quarters == QUARTERS[quarter]
+    year_has_target = is_target.groupby(df[year_col]).transform('any')
+    is_latest = quarters == quarters.groupby(df[year_col]).transform('max')
+    return _in_period_order(df[is_target | (~year_has_target & is_latest)])
+
+
+def _shifted(df, columns, quarters):
+    # Values of `columns` `quarters` periods earlier, matched on the period
+    # number so gaps in the series give NaN instead of the wrong quarter
+    periods = period_number(df)
+    values = df[columns].set_axis(periods, axis=0)
+    return values.reindex(periods - quarters).set_axis(df.index, axis=0)
+
+
+def change(df, columns, quarters, pct=True):
+    """Change of numeric `columns` against `quarters` periods earlier."""
+    previous = _shifted(df, columns, quarters)
+    if pct:
+        return (df[columns] / previous - 1) * 100
+    return df[columns] - previous
+
+
+def yoy(df, columns, pct=True):
+    return change(df, columns, 4, pct)
+
+
+def qoq(df, columns, pct=True):
+    return change(df, columns, 1, pct)
+
+
+def rolling(df, columns, window=4, agg='mean'):
+    """Trailing `window`-quarter aggregate of numeric `columns`, in period order."""
+    ordered = _in_period_order(df)
+    return ordered[columns].rolling(window, min_periods=window).agg(agg)
+
+
+RULES = {
+    'year_end': year_end,
+    'latest_per_year': latest_per_year,
+}
+
+
+def select_periods(df, rule='year_end', **kwargs):
+    """Rows of `df` picked by one of RULES."""
+    return RULES[rule](df, **kwargs)
@@ -0,0 +1,247 @@
+"""Per-section timing and memory profile of each dashboard rerun.
+
+A page runs its body inside ``with profiled(page) as profile:`` and calls
+profile.mark('2. Banking infrastructure availability') at the start of every
+section; the open section closes when the next one starts or when the body
+ends. The rerun is recorded however the body ends, with a status: 'ok',
+'stopped' (st.stop()), 'interrupted' (a widget changed mid-run and Streamlit
+restarted the script) or 'error'. For each section it records:
+
+    wall_s             wall time
+    pandas_s           time inside profiling.timed('pandas') blocks
+    plotly_build_s     figure construction on figure-cache misses
+    plotly_serialize_s fig.to_json() on figure-cache misses
+    payload_bytes      figure JSON sent to the browser
+    charts             number of charts sent
+    rss_delta_bytes    change in resident memory
+    peak_rss_delta_bytes  growth of the process' peak resident memory
+
+The library code reports into whichever profile is active in the current
+thread (see record() and timed()), so it needs no Streamlit import and costs
+a context-variable lookup when nothing is being profiled. Memory figures are
+per process, so with several concurrent sessions they include the others'
+allocations.
+
+Finished reruns go to:
+- an in-process registry, rendered as Prometheus text by prometheus_text();
+- the JSONL file named by FIMX_PROFILE_LOG, one line per rerun;
+- the Prometheus textfile named by FIMX_PROFILE_PROM, rewritten after each
+  rerun (for node_exporter's textfile collector).
+"""
+import contextvars
+import json
+import os
+import resource
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+STATUSES = ('ok', 'stopped', 'interrupted', 'error')
+# Control-flow exceptions Streamlit raises inside a script, by class name so
+# this module doesn't import Streamlit
+_INTERRUPTIONS = {'StopException': 'stopped', 'RerunException': 'interrupted'}
+
+METRICS = ('wall_s', 'pandas_s', 'plotly_build_s', 'plotly_serialize_s', 'payload_bytes', 'charts',
+           'rss_delta_bytes', 'peak_rss_delta_bytes')
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_current = contextvars.ContextVar('fimx_profile', default=None)
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return 0
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RerunProfile:
+    """Sections of one script run, in the order they ran."""
+
+    def __init__(self, page, context=None):
+        self.page = page
+        self.context = context or {}
+        self.sections = OrderedDict()
+        self.started = time.time()
+        self.rerun = None  # the record, once finished
+        self._open = None
+        self._token = _current.set(self)
+
+    def mark(self, name):
+        """Close the open section, if any, and start `name`."""
+        self._close()
+        self.sections[name] = dict.fromkeys(METRICS, 0)
+        self._open = (name, time.perf_counter(), _rss_bytes(), _peak_rss_bytes())
+
+    def _close(self):
+        if self._open is None:
+            return
+        name, start, rss, peak = self._open
+        section = self.sections[name]
+        section['wall_s'] += time.perf_counter() - start
+        section['rss_delta_bytes'] += _rss_bytes() - rss
+        section['peak_rss_delta_bytes'] += _peak_rss_bytes() - peak
+        self._open = None
+
+    def add(self, metric, value):
+        """Add `value` to `metric` of the open section."""
+        if self._open is not None:
+            self.sections[self._open[0]][metric] += value
+
+    def finish(self, status='ok'):
+        """Close the last section, publish the rerun and return its record."""
+        self._close()
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            _current.set(None)  # finished from another context
+        self.rerun = self.record(status)
+        REGISTRY.observe(self.rerun)
+        _write_sinks(self.rerun)
+        return self.rerun
+
+    def record(self, status='ok'):
+        return {
+            'page': self.page,
+            'status': status,
+            'started': self.started,
+            'total_s': sum(s['wall_s'] for s in self.sections.values()),
+            'context': self.context,
+            'sections': [{'section': name, **metrics} for name, metrics in self.sections.items()],
+        }
+
+
+@contextmanager
+def profiled(page, context=None):
+    """Profile the body of a page script and record the rerun when the body
+    ends, also when Streamlit stops or restarts it midway or it fails; the
+    record is then in profile.rerun."""
+    profile = RerunProfile(page, context)
+    status = 'error'
+    try:
+        yield profile
+        status = 'ok'
+    except BaseException as e:
+        status = _INTERRUPTIONS.get(type(e).__name__, 'error')
+        raise
+    finally:
+        profile.finish(status)
+
+
+def record(metric, value):
+    """Add `value` to `metric` in the active profile's open section, if any."""
+    profile = _current.get()
+    if profile is not None:
+        profile.add(metric, value)
+
+
+@contextmanager
+def timed(kind):
+    """Time a block as `kind` ('pandas', 'plotly_build', ...) of the open section."""
+    if _current.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(f'{kind}_s', time.perf_counter() - start)
+
+
+class Registry:
+    """Running totals per (page, section), for the Prometheus exposition."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._reruns = {}
+
+    def observe(self, rerun):
+        with self._lock:
+            key = (rerun['page'], rerun.get('status', 'ok'))
+            self._reruns[key] = self._reruns.get(key, 0) + 1
+            for section in rerun['sections']:
+                key = (rerun['page'], section['section'])
+                totals = self._totals.setdefault(key, {**dict.fromkeys(METRICS, 0), 'count': 0, 'wall_max_s': 0.0})
+                for metric in METRICS:
+                    totals[metric] += section[metric]
+                totals['count'] += 1
+                totals['wall_max_s'] = max(totals['wall_max_s'], section['wall_s'])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._reruns), {key: dict(totals) for key, totals in self._totals.items()}
+
+
+REGISTRY = Registry()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Exposition name, type and help for each per-section total
+PROMETHEUS_METRICS = OrderedDict([
+    ('count', ('fimx_section_runs_total', 'counter', 'Section runs.')),
+    ('wall_s', ('fimx_section_wall_seconds_total', 'counter', 'Wall time spent in the section.')),
+    ('wall_max_s', ('fimx_section_wall_max_seconds', 'gauge', 'Slowest single run of the section.')),
+    ('pandas_s', ('fimx_section_pandas_seconds_total', 'counter', 'Time in timed pandas blocks.')),
+    ('plotly_build_s', ('fimx_section_plotly_build_seconds_total', 'counter', 'Figure construction time.')),
+    ('plotly_serialize_s', ('fimx_section_plotly_serialize_seconds_total', 'counter', 'Figure serialization time.')),
+    ('payload_bytes', ('fimx_section_payload_bytes_total', 'counter', 'Figure JSON bytes sent.')),
+    ('charts', ('fimx_section_charts_total', 'counter', 'Charts sent.')),
+    ('rss_delta_bytes', ('fimx_section_rss_delta_bytes_sum', 'gauge', 'Sum of resident memory changes.')),
+    ('peak_rss_delta_bytes', ('fimx_section_peak_rss_delta_bytes_sum', 'gauge', 'Sum of peak resident memory growth.')),
+])
+
+
+def prometheus_text(registry=REGISTRY):
+    """Prometheus text exposition of the totals in `registry`."""
+    reruns, totals = registry.snapshot()
+    lines = ['# HELP fimx_reruns_total Dashboard script runs.', '# TYPE fimx_reruns_total counter']
+    lines += [f'fimx_reruns_total{{page="{_label(page)}",status="{_label(status)}"}} {count}'
+              for (page, status), count in sorted(reruns.items())]
+    for metric, (name, kind, help_text) in PROMETHEUS_METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for (page, section), values in sorted(totals.items()):
+            lines.append(f'{name}{{page="{_label(page)}",section="{_label(section)}"}} {values[metric]:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_sinks(rerun):
+    log_path = os.environ.get('FIMX_PROFILE_LOG')
+    if log_path:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(rerun, ensure_ascii=False, default=str) + '\n')
+    prom_path = os.environ.get('FIMX_PROFILE_PROM')
+    if prom_path:
+        tmp_path = f'{prom_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, prom_path)
+
+
+def widget_state(session_state):
+    """JSON-safe snapshot of the scalar widget values in a session state, so a
+    slow rerun can be traced back to the interaction that caused it."""
+    return {str(k): v for k, v in session_state.items()
+            if isinstance(v, (str, int, float, bool)) or v is None}
+
+
+def debug_panel(rerun):
+    """Streamlit expander with a finished rerun's record and the process totals."""
+    import pandas as pd
+    import streamlit as st
+
+    with st.expander('Debug: rerun profile', expanded=True):
+        frame = pd.DataFrame(rerun['sections']).set_index('section') if rerun['sections'] else pd.DataFrame()
+        st.write(f"Total {rerun['total_s'] * 1000:.1f} ms over {len(frame)} sections ({rerun['status']})")
+        st.dataframe(frame)
+        st.code(prometheus_text(), language='text')
@@ -0,0 +1,271 @@
+"""Append-only store of the quarterly CNBV series.
+
+Usage::
+
+    python -m inclusion.quarterly rebuild             # seed from the registered historical CSV
+    python -m inclusion.quarterly append new.csv ...  # add the periods that aren't stored yet
+    python -m inclusion.quarterly status
+
+Layout under build/historical/ (FIMX_BUILD_DIR applies)::
+
+    manifest.json                 columns, Arrow schema, stored periods, version
+    year=2023/20234T.parquet      one file per period, partitioned by year
+    aggregates/year_end.parquet   one row per year (see periods.year_end)
+
+A release is validated (key columns, period keys, header against the stored
+schema, the consistency rules of inclusion.validate) and only its new periods
+are written. Periods already stored are skipped when unchanged and rejected
+when their values differ, since the store is append-only. The aggregates are
+recomputed for the years that received new periods and spliced into the stored
+tables; the other years aren't read. The manifest is written last, so readers
+never see a new version before its periods and aggregates are in place.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+from inclusion.data import BUILD_DIR, read_csv
+from inclusion.periods import QUARTERS, period_number, quarter_col, year_col, year_end
+from inclusion.shared import clear as clear_shared
+from inclusion.validate import check_dataset
+
+period_key_col = 'Periodo_Clave\nPeriodo'
+KEY_COLUMNS = (period_key_col, year_col, quarter_col)
+STORE_DIR = os.path.join(BUILD_DIR, 'historical')
+
+
+def read_release(path):
+    """A quarterly release CSV, typed like the registered historical file."""
+    return read_csv('historical', path=path)
+
+
+def validate_release(df, columns=None):
+    """Problems that keep `df` out of the store ([] when it's fine).
+
+    `columns` are the stored column names; the release must have exactly
+    those, in any order.
+    """
+    problems = [f"missing key column {col!r}" for col in KEY_COLUMNS if col not in df.columns]
+    if problems:
+        return problems
+    if columns is not None:
+        missing = [c for c in columns if c not in df.columns]
+        extra = [c for c in df.columns if c not in columns]
+        if missing:
+            problems.append(f"missing columns: {', '.join(map(repr, missing))}")
+        if extra:
+            problems.append(f"unknown columns (a schema change needs a rebuild): {', '.join(map(repr, extra))}")
+    bad_quarters = sorted(set(df[quarter_col]) - set(QUARTERS))
+    if bad_quarters:
+        problems.append(f"unknown quarters: {bad_quarters}")
+    else:
+        expected = df[year_col].astype(str) + df[quarter_col]
+        mismatched = df.loc[df[period_key_col].astype(str) != expected, period_key_col].tolist()
+        if mismatched:
+            problems.append(f"period keys that don't match year and quarter: {mismatched}")
+    duplicated = df.loc[df[period_key_col].duplicated(), period_key_col].tolist()
+    if duplicated:
+        problems.append(f"duplicated periods: {duplicated}")
+    # Totals against their components and gender gaps against the counts (inclusion.validate)
+    for result in check_dataset('historical', df):
+        if result['failed'] and result['severity'] == 'error' and result['rule'] != 'period_unique':
+            periods = [example['row'] for example in result.get('examples', [])]
+            problems.append(f"{result['description']}: fails for {periods}")
+    return problems
+
+
+def _write_parquet(table, path):
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+
+class QuarterlyStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self._manifest_path = os.path.join(root, 'manifest.json')
+
+    def exists(self):
+        return os.path.exists(self._manifest_path)
+
+    def manifest(self):
+        with open(self._manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @property
+    def version(self):
+        return self.manifest()['version'] if self.exists() else 0
+
+    def periods(self):
+        return list(self.manifest()['periods']) if self.exists() else []
+
+    @staticmethod
+    def _schema(manifest):
+        import pyarrow as pa
+
+        return pa.ipc.read_schema(pa.py_buffer(bytes.fromhex(manifest['schema'])))
+
+    # Reading
+
+    def read(self, years=None):
+        """Stored periods (of `years` only, if given) in period order."""
+        return self._read(self.manifest(), years)
+
+    def _read(self, manifest, years=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        files = [path for key, path in manifest['periods'].items()
+                 if years is None or int(key[:4]) in years]
+        schema = self._schema(manifest)
+        if not files:
+            return schema.empty_table().to_pandas()
+        table = pa.concat_tables(pq.read_table(os.path.join(self.root, path), schema=schema) for path in files)
+        df = table.to_pandas()
+        return df.iloc[period_number(df).to_numpy().argsort(kind='stable')].reset_index(drop=True)
+
+    def aggregate(self, name):
+        """A stored aggregate table; 'year_end' is the only one so far."""
+        import pyarrow.parquet as pq
+
+        return pq.read_table(os.path.join(self.root, 'aggregates', f'{name}.parquet')).to_pandas()
+
+    # Writing
+
+    def append(self, df, since_version=0):
+        """Add the periods of `df` that aren't stored yet; returns a summary.
+
+        A new store counts its versions up from `since_version`.
+        """
+        import pyarrow as pa
+
+        created = not self.exists()
+        if created:
+            manifest = {'columns': list(df.columns), 'periods': {}, 'version': since_version}
+        else:
+            manifest = self.manifest()
+        problems = validate_release(df, manifest['columns'])
+        if problems:
+            raise ValueError('invalid release:\n  ' + '\n  '.join(problems))
+        df = df[manifest['columns']]
+        if created:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            manifest['schema'] = schema.serialize().to_pybytes().hex()
+        else:
+            schema = self._schema(manifest)
+
+        keys = df[period_key_col].astype(str)
+        stored = keys.isin(manifest['periods'])
+        changed = self._changed_periods(df[stored.to_numpy()], schema) if stored.any() else []
+        if changed:
+            raise ValueError(f"periods already stored with different values (the store is append-only): {changed}")
+
+        new = df[~stored.to_numpy()]
+        for key, row in zip(keys[~stored], range(len(new))):
+            path = f'year={key[:4]}/{key}.parquet'
+            table = pa.Table.from_pandas(new.iloc[[row]], preserve_index=False).cast(schema)
+            _write_parquet(table, os.path.join(self.root, path))
+            manifest['periods'][key] = path
+
+        years = sorted(set(new[year_col].astype(int)))
+        if years:
+            manifest['version'] += 1
+            manifest['updated'] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+            self._update_aggregates(manifest, years, splice=not created)
+            # The commit point: until now readers see the previous version
+            self._write_manifest(manifest)
+        return {'added': keys[~stored].tolist(), 'skipped': keys[stored].tolist(), 'years': years}
+
+    def _changed_periods(self, df, schema):
+        import pyarrow as pa
+
+        current = self.read(years=set(df[year_col].astype(int)))
+        current = current.set_index(current[period_key_col].astype(str))
+        incoming = pa.Table.from_pandas(df, preserve_index=False).cast(schema).to_pandas()
+        keys = incoming[period_key_col].astype(str)
+        current = current.loc[keys, incoming.columns].reset_index(drop=True)
+        # Missing values on both sides count as equal, as in Series.equals
+        same = incoming.eq(current) | (incoming.isna() & current.isna())
+        return keys[~same.all(axis=1).to_numpy()].tolist()
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f'{self._manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _update_aggregates(self, manifest, years, splice=True):
+        """Recompute the aggregates of `years` over the periods of `manifest`
+        and splice them into the stored tables (or replace them, for a new
+        store, so leftovers of an interrupted one don't survive)."""
+        import pyarrow as pa
+
+        rows = year_end(self._read(manifest, set(years)), '4T').reset_index(drop=True)
+        try:
+            current = self.aggregate('year_end') if splice else None
+        except FileNotFoundError:
+            current = None
+        table = rows if current is None else pd.concat([current[~current[year_col].isin(years)], rows],
+                                                       ignore_index=True)
+        table = table.sort_values(year_col, kind='stable').reset_index(drop=True)
+        _write_parquet(pa.Table.from_pandas(table, preserve_index=False),
+                       os.path.join(self.root, 'aggregates', 'year_end.parquet'))
+
+    def rebuild(self):
+        """Drop the store and seed it from the registered historical CSV.
+
+        The version keeps counting from the dropped store's, so caches keyed
+        on it never mistake the rebuilt store for an older one.
+        """
+        previous = self.version
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+        return self.append(read_csv('historical'), since_version=previous)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--store', default=STORE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    append = commands.add_parser('append', help='append the new periods of release CSVs')
+    append.add_argument('paths', nargs='+')
+    commands.add_parser('rebuild', help='recreate the store from the registered historical CSV')
+    commands.add_parser('status', help='show the stored periods')
+    args = parser.parse_args(argv)
+
+    store = QuarterlyStore(args.store)
+    if args.command == 'status':
+        if not store.exists():
+            print(f"No store at {store.root}; run 'rebuild' first")
+            return 1
+        periods = store.periods()
+        print(f"{len(periods)} periods ({periods[0]} .. {periods[-1]}), version {store.version}")
+        return 0
+    if args.command == 'rebuild':
+        results = [store.rebuild()]
+    else:
+        try:
+            results = [store.append(read_release(path)) for path in args.paths]
+        except ValueError as e:
+            print(e)
+            return 1
+    # Drop the superseded shared copies; the dashboards pick up the new version
+    clear_shared('historical')
+    for result in results:
+        print(f"added {len(result['added'])} period(s) {', '.join(result['added'])}; "
+              f"skipped {len(result['skipped'])} already stored; "
+              f"aggregates updated for {', '.join(map(str, result['years'])) or 'no years'}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
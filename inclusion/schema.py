@@ -0,0 +1,83 @@
+"""Two-level headers of the historical CNBV sheet.
+
+Headers there read 'Category\\nEntity_Metric', e.g.
+'Crédito\\nBanca_Tarjeta de crédito', and the period columns read
+'Periodo_Año' (or 'Periodo_Clave\\nPeriodo'). HeaderSchema parses them once into
+a (category, entity, metric) MultiIndex with a dict lookup on top, so the
+dashboard picks columns by name instead of by position and a quarterly file
+with shifted or extra columns still resolves.
+"""
+from functools import lru_cache
+
+import pandas as pd
+
+LEVELS = ('category', 'entity', 'metric')
+
+# Metrics of the gender breakdowns, which share categories with the totals
+GENDER_METRICS = ('Mujeres', 'Hombres', 'Brecha')
+
+
+def parse_header(column):
+    """Split a raw header into (category, entity, metric); entity is '' for
+    single-level headers such as 'Periodo_Año'."""
+    head, newline, tail = column.partition('\n')
+    if newline and '_' in tail:
+        entity, _, metric = tail.rpartition('_')
+        return head.strip(), entity.strip(), metric.strip()
+    category, _, metric = head.partition('_')
+    return category.strip(), '', metric.strip()
+
+
+class HeaderSchema:
+    """Name-indexed view over a frame's raw headers."""
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        keys = [parse_header(c) for c in self.columns]
+        self.index = pd.MultiIndex.from_tuples(keys, names=LEVELS)
+        self._positions = {}
+        self._groups = {}
+        for position, key in enumerate(keys):
+            # Keep the first occurrence if a file repeats a header
+            self._positions.setdefault(key, position)
+            self._groups.setdefault(key[:2], {}).setdefault(key[2], self.columns[position])
+
+    def __contains__(self, key):
+        return tuple(key) in self._positions
+
+    def position(self, category, entity, metric):
+        try:
+            return self._positions[(category, entity, metric)]
+        except KeyError:
+            raise KeyError(f"no column for {(category, entity, metric)!r}") from None
+
+    def column(self, category, entity, metric):
+        """Raw header for (category, entity, metric)."""
+        return self.columns[self.position(category, entity, metric)]
+
+    def group(self, category, entity, exclude=()):
+        """{metric: raw header} for one category/entity, in file order."""
+        try:
+            group = self._groups[(category, entity)]
+        except KeyError:
+            raise KeyError(f"no columns for {(category, entity)!r}") from None
+        return {metric: col for metric, col in group.items() if metric not in exclude}
+
+    def gender_pair(self, category, entity):
+        """(women, men) headers of a gender breakdown."""
+        return self.column(category, entity, 'Mujeres'), self.column(category, entity, 'Hombres')
+
+    def select(self, df, category, entity, exclude=()):
+        """Columns of one group, relabelled by metric."""
+        group = self.group(category, entity, exclude)
+        return df[list(group.values())].set_axis(list(group), axis=1)
+
+
+@lru_cache(maxsize=16)
+def _schema(columns):
+    return HeaderSchema(columns)
+
+
+def header_schema(columns):
+    """Parsed schema for a set of headers; parsed once per distinct header set."""
+    return _schema(tuple(columns))
@@ -0,0 +1,149 @@
+"""Datasets shared between worker processes through memory-mapped Arrow files.
+
+The first process to need a dataset writes it as an uncompressed Arrow IPC
+file under FIMX_SHARED_DIR (default /dev/shm/fimx-<uid>, i.e. RAM); every
+process then memory-maps that file and converts it to pandas without copying
+the numeric columns. The page cache holds one physical copy per host however
+many Streamlit workers attach, and the frames are read-only: numeric columns
+are views on the mapping, so an accidental in-place write raises instead of
+corrupting what other sessions see.
+
+Derived columns go on a shallow copy per session (see
+inclusion.metrics.add_derived_metrics), which adds new columns next to the
+shared ones without copying them. Some pandas operations (row masks, column
+lists) consolidate such a frame, which copies it for that session only; the
+shared mapping itself is never copied.
+
+Each process keeps one attachment per dataset and column list: when a newer
+version is attached (after an ingest or a quarterly append) the older one's
+mapping is closed and forgotten. Frames already handed out stay valid, since
+their buffers hold the mapped region until they're garbage collected.
+
+Set FIMX_SHARED_DIR to an empty string to disable the store; shared_frame()
+then just calls its loader, as it also does when pyarrow is missing.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+
+from inclusion.data import SCHEMA_VERSION, csv_path, parquet_path
+
+# (name, parts) -> (path, frame, memory map) of the version attached last
+_attached = {}
+_lock = threading.Lock()
+
+
+def shared_dir():
+    """Directory of the shared files, or None when the store is disabled."""
+    path = os.environ.get('FIMX_SHARED_DIR')
+    if path is None:
+        if not os.path.isdir('/dev/shm'):
+            return None
+        path = f'/dev/shm/fimx-{os.getuid()}'
+    return path or None
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def dataset_key(name, parts=(), version=None):
+    """Key of a shared file: changes when the source CSV, its columnar build,
+    the typing schema, the caller's `parts` (e.g. the column list) or its
+    `version` change."""
+    payload = json.dumps([name, SCHEMA_VERSION, _stamp(csv_path(name)), _stamp(parquet_path(name)), list(parts),
+                          version], default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def to_arrow(df):
+    """Arrow table for `df` (index included) that converts back without copies.
+
+    pyarrow turns NaN into nulls by default, and a float column with nulls has
+    to be copied to put the NaNs back; storing the NaNs as values avoids that.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    for i, field in enumerate(table.schema):
+        if field.name in df.columns and df[field.name].dtype.kind == 'f':
+            table = table.set_column(i, field, pa.array(df[field.name].to_numpy(), from_pandas=False))
+    return table
+
+
+def publish(path, df):
+    """Write `df` to `path` atomically; concurrent publishers are harmless."""
+    import pyarrow as pa
+
+    table = to_arrow(df)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def attach(path):
+    """(read-only DataFrame, memory map) over the file at `path`."""
+    import pyarrow as pa
+
+    source = pa.memory_map(path)
+    table = pa.ipc.open_file(source).read_all()
+    # split_blocks keeps one block per column, which is what allows zero-copy
+    return table.to_pandas(split_blocks=True), source
+
+
+def shared_frame(name, loader, parts=(), version=None):
+    """The frame `loader()` returns, published once per host and attached
+    zero-copy in every process.
+
+    `name` is the registered dataset it derives from (its files key the
+    cache), `parts` anything else that changes the result, such as the
+    column list, and `version` the version of a source other than the
+    dataset's files (e.g. the quarterly store). Attaching a new version
+    releases the previous one of the same name and parts.
+    """
+    directory = shared_dir()
+    if directory is None:
+        return loader()
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return loader()
+
+    path = os.path.join(directory, f'{name}-{dataset_key(name, parts, version)}.arrow')
+    slot = (name, json.dumps(list(parts), default=str))
+    with _lock:
+        current = _attached.get(slot)
+        if current is not None and current[0] == path:
+            return current[1]
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            publish(path, loader())
+        frame, source = attach(path)
+        _attached[slot] = (path, frame, source)
+        if current is not None:
+            current[2].close()
+        return frame
+
+
+def attached():
+    """Paths of the files this process has attached, one per name and parts."""
+    with _lock:
+        return sorted(path for path, _, _ in _attached.values())
+
+
+def clear(name='*'):
+    """Remove the shared files of `name` (all datasets by default), e.g. after
+    a data update. Processes that still map them keep working."""
+    directory = shared_dir()
+    if directory is None:
+        return
+    for path in glob.glob(os.path.join(directory, f'{name}-*.arrow')):
+        os.remove(path)
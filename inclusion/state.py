@@ -0,0 +1,49 @@
+"""State-level snapshot: the frame behind the main dashboard page and the API.
+
+load_state() reads only the columns the dashboard uses, indexed by state name;
+state_metrics() adds the derived metrics and the Financial Inclusion Index.
+"""
+from inclusion.data import load_dataset
+from inclusion.index_engine import DEFAULT_SPEC, fi_index
+from inclusion.metrics import add_derived_metrics
+from inclusion.shared import shared_frame
+
+# Columns the state-level sections actually use; the rest of the file is never read
+STATE_COLUMNS = [
+    'Clave_Estado', 'Estado', 'Poblacion', 'Poblacion_adulta', 'Superficie_km2',
+    'Sucursales_banca_comercial_10mil_adultos', 'Sucursales_banca_desarrollo_10mil_adultos',
+    'Sucursales_cooperativas_10mil_adultos', 'Sucursales_microfinancieras_10mil_adultos',
+    'Cajeros_10mil_adultos', 'Corresponsales_10mil_adultos', 'TPV_10mil_adultos',
+    'Contratos_celular_10mil_adultos',
+    'Cuentas_Nivel1_10mil_adultos_Banca', 'Cuentas_Nivel2_10mil_adultos_Banca',
+    'Cuentas_Nivel3_10mil_adultos_Banca', 'Cuentas_cuentas_transaccionales_tradicionales_10mil_adultos_Banca',
+    'Creditos_hipotecarios_10mil_adultos_Banca', 'Creditos_personales_10mil_adultos_Banca',
+    'Creditos_nomina_10mil_adultos_Banca', 'Creditos_automotrices_10mil_adultos_Banca',
+    'Creditos_ABCD_10mil_adultos_Banca',
+]
+
+
+def _read_state():
+    df = load_dataset('state', columns=STATE_COLUMNS)
+    df.set_index('Estado', inplace=True)
+    return df[df.index != 'Sin identificar']
+
+
+def load_state():
+    """State frame indexed by 'Estado', without the 'Sin identificar' row.
+
+    The frame comes from the shared store and is read-only.
+    """
+    return shared_frame('state', _read_state, STATE_COLUMNS)
+
+
+def state_metrics(df=None, spec=DEFAULT_SPEC):
+    """State frame with the derived metrics and FI_Index for `spec`."""
+    df = add_derived_metrics(load_state() if df is None else df)
+    df['FI_Index'] = fi_index(df, spec)
+    return df
+
+
+def ranking(series, n=3):
+    """(top n, bottom n) of a per-state metric; missing values are skipped."""
+    return series.nlargest(n), series.nsmallest(n)
@@ -0,0 +1,200 @@
+"""Nightly batch: rank municipalities by how underserved they are.
+
+Usage::
+
+    python -m inclusion.underserved                              # default scoring
+    python -m inclusion.underserved --scenarios scenarios.json   # one ranking per variant
+    python -m inclusion.underserved --workers 8 --output build/reports/underserved
+
+Every municipality gets, per ScoringSpec:
+
+    zero_branches    no branch of any institution type (metrics.institution_columns)
+    zero_atms        no ATMs
+    gap              mean shortfall against the state median over the spec's
+                     metrics (infrastructure, institution and credit densities
+                     by default): (median - value) / median, clipped to [0, 1]
+    largest_gap      the metric with the biggest shortfall
+    need             weighted mean of the two flags and the gap, in [0, 1]
+    adults_underserved  need * adult population
+    score            need * adults ** population_exponent, what the report ranks by
+
+States are scored independently (the medians are per state), each in a worker
+of a process pool; the workers attach the municipal frame from the shared
+store (inclusion.shared) instead of receiving a pickled copy. The report is
+written as Parquet and CSV, ranked within each scenario and within each state.
+
+A scenarios file is a JSON list of ScoringSpec fields, e.g.::
+
+    [{"name": "infrastructure", "metrics": ["Cajeros_10mil_adultos", "Corresponsales_10mil_adultos"]},
+     {"name": "population-heavy", "population_exponent": 1.0}]
+"""
+import argparse
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+
+import numpy as np
+import pandas as pd
+
+from inclusion import metrics
+from inclusion.data import BUILD_DIR
+from inclusion.drilldown import MUNICIPAL_COLUMNS, load_municipal
+
+ADULTS_COL = 'Poblacion_adulta_accessMunicipal'
+SCORE_METRICS = tuple(dict.fromkeys(metrics.infrastructure_columns + metrics.institution_columns
+                                    + metrics.credit_columns))
+UNDERSERVED_COLUMNS = MUNICIPAL_COLUMNS + ['Estado', ADULTS_COL]
+REPORT_PATH = os.path.join(BUILD_DIR, 'reports', 'underserved')
+
+
+@dataclass(frozen=True)
+class ScoringSpec:
+    """Weights of one scoring variant; see the module docstring."""
+    name: str = 'default'
+    zero_branch_weight: float = 1.0
+    zero_atm_weight: float = 1.0
+    gap_weight: float = 1.0
+    population_exponent: float = 0.5
+    metrics: tuple = SCORE_METRICS
+
+    def __post_init__(self):
+        object.__setattr__(self, 'metrics', tuple(self.metrics))
+        unknown = [col for col in self.metrics if col not in SCORE_METRICS]
+        if unknown:
+            raise ValueError(f'Unknown metrics {unknown}; expected a subset of {SCORE_METRICS}')
+        if self.zero_branch_weight + self.zero_atm_weight + self.gap_weight <= 0:
+            raise ValueError('At least one weight must be positive')
+
+
+def load_scenarios(path):
+    """ScoringSpecs from a JSON list of their fields."""
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    names = {field.name for field in fields(ScoringSpec)}
+    specs = []
+    for entry in entries:
+        unknown = set(entry) - names
+        if unknown:
+            raise ValueError(f'Unknown scenario fields {sorted(unknown)}')
+        specs.append(ScoringSpec(**entry))
+    return specs
+
+
+def score_state(frame, specs):
+    """Scores of one state's municipalities, one block of rows per spec."""
+    values = frame[list(SCORE_METRICS)].to_numpy(dtype=float)
+    with warnings.catch_warnings():
+        # Metrics with no data in the state have no median and no shortfall
+        warnings.simplefilter('ignore', RuntimeWarning)
+        medians = np.nanmedian(values, axis=0)
+        shortfall = np.clip((medians - values) / np.where(medians > 0, medians, np.nan), 0, 1)
+
+    branches = frame[metrics.institution_columns]
+    zero_branches = (branches.sum(axis=1) == 0) & branches.notna().any(axis=1)
+    zero_atms = frame['Cajeros_10mil_adultos'] == 0
+    adults = frame[ADULTS_COL].to_numpy(dtype=float)
+
+    blocks = []
+    for spec in specs:
+        positions = [SCORE_METRICS.index(col) for col in spec.metrics]
+        spec_shortfall = shortfall[:, positions]
+        has_gap = ~np.isnan(spec_shortfall).all(axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            gap = np.nan_to_num(np.nanmean(spec_shortfall, axis=1))
+        largest = np.argmax(np.nan_to_num(spec_shortfall, nan=-1), axis=1)
+        weights = spec.zero_branch_weight + spec.zero_atm_weight + spec.gap_weight
+        need = (spec.zero_branch_weight * zero_branches.to_numpy()
+                + spec.zero_atm_weight * zero_atms.to_numpy()
+                + spec.gap_weight * gap) / weights
+        blocks.append(pd.DataFrame({
+            'scenario': spec.name,
+            'Clave_Municipio': frame['Clave_Municipio'].to_numpy(),
+            'Municipio': frame['Municipio'].astype(str).to_numpy(),
+            'Clave_Estado': frame['Clave_Estado'].to_numpy(),
+            'Estado': frame['Estado'].astype(str).to_numpy(),
+            'zero_branches': zero_branches.to_numpy(),
+            'zero_atms': zero_atms.to_numpy(),
+            'gap': gap,
+            'largest_gap': np.where(has_gap & (gap > 0), np.asarray(spec.metrics, dtype=object)[largest], None),
+            'need': need,
+            'adults': adults,
+            'adults_underserved': need * adults,
+            'score': need * np.power(adults, spec.population_exponent),
+        }))
+    return pd.concat(blocks, ignore_index=True)
+
+
+# Per-worker municipal frame, attached from the shared store once per process
+_frame = None
+
+
+def _init_worker():
+    global _frame
+    _frame = load_municipal(UNDERSERVED_COLUMNS)
+
+
+def _score_worker(state, specs):
+    return score_state(_frame[_frame['Clave_Estado'] == state], specs)
+
+
+def run(specs=(ScoringSpec(),), workers=None):
+    """The ranked report for `specs`, scoring each state in a worker process
+    (in this process when workers=1)."""
+    specs = list(specs)
+    names = [spec.name for spec in specs]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Scenario names must be unique: {names}')
+    frame = load_municipal(UNDERSERVED_COLUMNS)
+    states = sorted(frame['Clave_Estado'].dropna().unique().tolist())
+    if workers == 1:
+        parts = [score_state(frame[frame['Clave_Estado'] == state], specs) for state in states]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            parts = list(pool.map(_score_worker, states, [specs] * len(states)))
+    return rank(pd.concat(parts, ignore_index=True))
+
+
+def rank(report):
+    """Sort by scenario and score, adding the overall and within-state rank."""
+    report = report.sort_values(['scenario', 'score', 'Clave_Municipio'], ascending=[True, False, True],
+                                kind='stable', ignore_index=True)
+    report.insert(1, 'rank', report.groupby('scenario').cumcount() + 1)
+    report.insert(2, 'state_rank', report.groupby(['scenario', 'Clave_Estado']).cumcount() + 1)
+    return report
+
+
+def write_report(report, path=REPORT_PATH):
+    """Write `path`.parquet and `path`.csv; returns the two paths."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(report, preserve_index=False), f'{path}.parquet', compression='zstd')
+    report.to_csv(f'{path}.csv', index=False)
+    return f'{path}.parquet', f'{path}.csv'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', help='JSON list of ScoringSpec fields (default: the default spec)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--output', default=REPORT_PATH, help='report path without extension')
+    parser.add_argument('--top', type=int, default=10, help='rows to print per scenario')
+    args = parser.parse_args(argv)
+
+    specs = load_scenarios(args.scenarios) if args.scenarios else [ScoringSpec()]
+    report = run(specs, args.workers)
+    for path in write_report(report, args.output):
+        print(f'wrote {path}')
+    columns = ['rank', 'Municipio', 'Estado', 'need', 'adults_underserved', 'largest_gap']
+    for name, rows in report.groupby('scenario', sort=False):
+        print(f'\n{name}')
+        print(rows[columns].head(args.top).to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,375 @@
+"""Consistency rules for the CNBV datasets, checked before they're published.
+
+Usage::
+
+    python -m inclusion.validate                      # every registered CSV
+    python -m inclusion.validate historical --report build/validation.json
+
+Exits 1 when an error-level rule fails. The ingest (inclusion.ingest) runs the
+same checks and refuses to write a build with errors, and a quarterly release
+(inclusion.quarterly append) must pass the historical rules.
+
+Rule kinds:
+
+    sum           target == sum of components (within atol + rtol * |target|),
+                  e.g. Captación Banca Total = Ahorro + Plazo + Tradicionales +
+                  Simplificadas and Simplificadas = N1 + N2 + N3
+    gap           a gender gap (Brecha) == (Hombres - Mujeres) / (Hombres +
+                  Mujeres) * 100, the published one being rounded to 0.1
+    non_negative  counts and densities can't be negative (every numeric
+                  column but the gaps)
+    unique        one row per key
+    rollup        per state, the municipal values (densities weighted by adult
+                  population) add up to the state file's
+
+All rules of a kind are checked together over the whole frame: the sum rules
+are one product of the value matrix with a (columns, rules) matrix of
+coefficients, the gap rules one array expression over the stacked columns, and
+the rollups one group-by over every rolled-up column. Rows where a column of a
+rule is missing aren't checked by it. Historical columns are named by
+(category, entity, metric) and resolved through inclusion.schema, so shifted
+or extra columns don't matter; a rule whose columns are absent is reported as
+skipped.
+"""
+import argparse
+import datetime
+import json
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from inclusion.data import DATASETS, read_csv
+from inclusion.schema import header_schema
+
+KINDS = ('sum', 'gap', 'non_negative', 'unique', 'rollup')
+SEVERITIES = ('error', 'warning')
+EXAMPLES = 5  # failing rows listed per rule in the report
+
+
+@dataclass(frozen=True)
+class Rule:
+    """One check; see the module docstring for the kinds."""
+    name: str
+    kind: str
+    target: object = None  # checked column (a (category, entity, metric) for the historical sheet)
+    components: tuple = ()  # columns it's made of; for rollups the municipal column
+    rtol: float = 1e-6
+    atol: float = 0.0
+    severity: str = 'error'
+    weight: str = None  # rollups: municipal column weighting a density
+    description: str = ''
+
+    def __post_init__(self):
+        object.__setattr__(self, 'components', tuple(self.components))
+        if self.kind not in KINDS:
+            raise ValueError(f'Unknown rule kind {self.kind!r}; expected one of {KINDS}')
+        if self.severity not in SEVERITIES:
+            raise ValueError(f'Unknown severity {self.severity!r}; expected one of {SEVERITIES}')
+
+
+def _sum(name, target, components, description, **kwargs):
+    return Rule(name, 'sum', target, components, description=description, **kwargs)
+
+
+def _banca(metric, category='Captación'):
+    return (category, 'Banca', metric)
+
+
+def _eacp(metric, category='Captación'):
+    return (category, 'EACP', metric)
+
+
+# Gender breakdowns of the historical sheet: (category, entity) with Mujeres, Hombres and Brecha
+GENDER_GROUPS = (
+    ('Cuentas de captación', 'Banca'), ('Crédito', 'Banca'), ('Créditos hipotecarios', 'Banca múltiple'),
+    ('Tarjetas de débito', 'Banca'), ('Tarjetas de crédito', 'Banca'), ('Captación', 'EACP'),
+    ('Crédito al consumo', 'EACP'), ('Crédito a la vivienda', 'EACP'), ('Crédito comercial', 'EACP'),
+)
+BANCA_CREDIT_PRODUCTS = ('Tarjeta de crédito', 'Personal', 'Nómina', 'ABCD', 'Grupal', 'Hipotecario', 'Automotriz')
+BRANCH_TYPES = ('Sucursales_banca_comercial_10mil_adultos', 'Sucursales_banca_desarrollo_10mil_adultos',
+                'Sucursales_cooperativas_10mil_adultos', 'Sucursales_microfinancieras_10mil_adultos')
+
+HISTORICAL_RULES = [
+    Rule('period_unique', 'unique', ('Periodo', '', 'Clave'), description='one row per quarter'),
+    _sum('captacion_banca_total', _banca('Total'),
+         [_banca(m) for m in ('Ahorro', 'Plazo', 'Tradicionales', 'Simplificadas')],
+         'Captación Banca Total = Ahorro + Plazo + Tradicionales + Simplificadas'),
+    _sum('captacion_banca_simplificadas', _banca('Simplificadas'), [_banca(m) for m in ('N1', 'N2', 'N3')],
+         'Simplificadas = N1 + N2 + N3'),
+    _sum('credito_banca_total', _banca('Total', 'Crédito'),
+         [_banca(m, 'Crédito') for m in BANCA_CREDIT_PRODUCTS], 'Crédito Banca Total = sum of the products'),
+    _sum('captacion_eacp_total', _eacp('Total'), [_eacp(m) for m in ('Ahorro', 'Plazo', 'Vista')],
+         'Captación EACP Total = Ahorro + Plazo + Vista'),
+    # The EACP credit series are compiled from several reports and are off by up to ~0.4%
+    _sum('credito_eacp_total', _eacp('Total', 'Crédito'),
+         [_eacp(m, 'Crédito') for m in ('Tarjeta de crédito', 'Consumo', 'Vivienda', 'Comercial')],
+         'Crédito EACP Total = Tarjeta de crédito + Consumo + Vivienda + Comercial', rtol=0.005),
+    _sum('credito_eacp_sin_comercial', _eacp('Total', 'Crédito'),
+         [_eacp('Total sin comercial', 'Crédito'), _eacp('Comercial', 'Crédito')],
+         'Crédito EACP Total = Total sin comercial + Comercial'),
+    *[Rule(f"brecha_{category}_{entity}".lower().replace(' ', '_'), 'gap', (category, entity, 'Brecha'),
+           [(category, entity, 'Mujeres'), (category, entity, 'Hombres')], atol=0.051,
+           description=f'{category} {entity} Brecha = (Hombres - Mujeres) / (Hombres + Mujeres) * 100')
+      for category, entity in GENDER_GROUPS],
+    Rule('non_negative', 'non_negative', description='no negative counts'),
+]
+
+# The branch densities are rounded to 0.01, so the total can be off by 0.025
+STATE_RULES = [
+    Rule('state_unique', 'unique', 'Clave_Estado', description='one row per state'),
+    _sum('total_branches', 'Total_sucursales_10mil_adultos', BRANCH_TYPES,
+         'Total branches = commercial + development + cooperative + microfinance', atol=0.025, rtol=0),
+    Rule('non_negative', 'non_negative', description='no negative populations, counts or densities'),
+]
+MUNICIPAL_RULES = [
+    Rule('municipality_unique', 'unique', 'Clave_Municipio', description='one row per municipality'),
+    _sum('total_branches', 'Total_sucursales_10mil_adultos', BRANCH_TYPES,
+         'Total branches = commercial + development + cooperative + microfinance', atol=0.025, rtol=0),
+    Rule('non_negative', 'non_negative', description='no negative populations, counts or densities'),
+]
+
+RULES = {'historical': HISTORICAL_RULES, 'state': STATE_RULES, 'municipal': MUNICIPAL_RULES}
+
+# Densities the municipal file covers fully; the others (development-bank and
+# cooperative branches, level-1 accounts, ...) are known not to add up
+ROLLUP_COLUMNS = (
+    'Sucursales_banca_comercial_10mil_adultos', 'Cajeros_10mil_adultos', 'Contratos_celular_10mil_adultos',
+    'Cuentas_deposito_ahorro_10mil_adultos_EACP', 'Cuentas_deposito_a_la_vista_10mil_adultos_EACP',
+    'Cuentas_deposito_a_plazo_10mil_adultos_EACP', 'Cuentas_credito_al_consumo_10mil_adultos_EACP',
+    'Cuentas_Nivel2_10mil_adultos_Banca', 'Cuentas_Nivel3_10mil_adultos_Banca',
+    'Tarjetas_credito_10mil_adultos_Banca', 'Creditos_hipotecarios_10mil_adultos_Banca',
+    'Creditos_grupales_10mil_adultos_Banca', 'Creditos_personales_10mil_adultos_Banca',
+    'Creditos_nomina_10mil_adultos_Banca', 'Creditos_automotrices_10mil_adultos_Banca',
+    'Creditos_ABCD_10mil_adultos_Banca', 'Transacciones_en_TPV_10mil_adultos_Banca',
+    'Transacciones_en_Cajeros_10mil_adultos_Banca',
+)
+# The two files use different population estimates, ~10% apart in a few states
+ROLLUP_RULES = [
+    Rule('rollup_adults', 'rollup', 'Poblacion_adulta', ['Poblacion_adulta'], rtol=0.15, severity='warning',
+         description='municipal adult population adds up to the state'),
+    *[Rule(f'rollup_{col}', 'rollup', col, [col], rtol=0.15, severity='warning', weight='Poblacion_adulta',
+           description='adult-weighted municipal density matches the state') for col in ROLLUP_COLUMNS],
+]
+
+ROW_KEYS = {'historical': ('Periodo', '', 'Clave'), 'state': 'Estado', 'municipal': 'Clave_Municipio'}
+
+
+def _result(rule, checked=0, failed=None, examples=(), missing=()):
+    result = {'rule': rule.name, 'kind': rule.kind, 'severity': rule.severity, 'description': rule.description,
+              'checked': int(checked), 'failed': int(failed or 0)}
+    if missing:
+        result['skipped'] = f"missing columns: {', '.join(map(str, missing))}"
+    if examples:
+        result['examples'] = list(examples)
+    return result
+
+
+def _value(x):
+    if isinstance(x, (np.floating, float)):
+        return None if np.isnan(x) else round(float(x), 6)
+    return x.item() if isinstance(x, np.generic) else x
+
+
+def _examples(labels, bad, **columns):
+    rows = np.flatnonzero(bad)[:EXAMPLES]
+    return [{'row': _value(labels[i]), **{name: _value(values[i]) for name, values in columns.items()}}
+            for i in rows]
+
+
+class _Resolver:
+    """Column names of a frame for rule columns; None for absent ones."""
+
+    def __init__(self, df, by_schema):
+        self.columns = set(df.columns)
+        self.schema = header_schema(df.columns) if by_schema else None
+
+    def __call__(self, column):
+        if self.schema is not None and isinstance(column, tuple):
+            return self.schema.column(*column) if column in self.schema else None
+        return column if column in self.columns else None
+
+
+def check(df, rules, row_key=None, by_schema=False):
+    """Results of `rules` (all but rollups) over `df`, in rule order."""
+    resolve = _Resolver(df, by_schema)
+    key = resolve(row_key) if row_key is not None else None
+    labels = df[key].to_numpy() if key is not None else np.arange(len(df))
+    results = {}
+
+    resolved = {}
+    for rule in rules:
+        if rule.kind in ('sum', 'gap'):
+            names = [rule.target, *rule.components]
+            columns = [resolve(c) for c in names]
+            if None in columns:
+                results[rule.name] = _result(rule, missing=[n for n, c in zip(names, columns) if c is None])
+            else:
+                resolved[rule.name] = columns
+
+    sums = [r for r in rules if r.kind == 'sum' and r.name in resolved]
+    gaps = [r for r in rules if r.kind == 'gap' and r.name in resolved]
+    needed = list(dict.fromkeys(c for r in sums + gaps for c in resolved[r.name]))
+    values = df[needed].to_numpy(dtype=float) if needed else np.empty((len(df), 0))
+    position = {col: i for i, col in enumerate(needed)}
+
+    if sums:
+        # residual[:, j] = sum of rule j's components - its target, for every rule at once
+        coefficients = np.zeros((len(needed), len(sums)))
+        for j, rule in enumerate(sums):
+            target, *components = resolved[rule.name]
+            for col in components:
+                coefficients[position[col], j] += 1
+            coefficients[position[target], j] -= 1
+        incomplete = np.isnan(values).astype(float) @ (coefficients != 0) > 0
+        residual = np.nan_to_num(values) @ coefficients
+        targets = values[:, [position[resolved[r.name][0]] for r in sums]]
+        rtol = np.array([r.rtol for r in sums])
+        atol = np.array([r.atol for r in sums])
+        bad = (np.abs(residual) > atol + rtol * np.abs(np.nan_to_num(targets))) & ~incomplete
+        for j, rule in enumerate(sums):
+            results[rule.name] = _result(rule, (~incomplete[:, j]).sum(), bad[:, j].sum(), _examples(
+                labels, bad[:, j], value=targets[:, j], components_sum=targets[:, j] + residual[:, j]))
+
+    if gaps:
+        gap, women, men = (values[:, [position[resolved[r.name][i]] for r in gaps]] for i in range(3))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            expected = (men - women) / (men + women) * 100
+        complete = ~np.isnan(gap) & ~np.isnan(expected)
+        bad = complete & (np.abs(np.nan_to_num(gap - expected)) > np.array([r.atol for r in gaps]))
+        for j, rule in enumerate(gaps):
+            results[rule.name] = _result(rule, complete[:, j].sum(), bad[:, j].sum(),
+                                         _examples(labels, bad[:, j], value=gap[:, j], expected=expected[:, j]))
+
+    for rule in rules:
+        if rule.kind == 'non_negative':
+            # Gender gaps are signed
+            signed = {resolved[r.name][0] for r in gaps}
+            numeric = df.select_dtypes('number').drop(columns=[c for c in signed if c in df.columns])
+            matrix = numeric.to_numpy(dtype=float)
+            negative = matrix < 0
+            bad = negative.any(axis=1)
+            examples = [{'row': _value(labels[i]), 'columns': [str(c) for c in numeric.columns[negative[i]]]}
+                        for i in np.flatnonzero(bad)[:EXAMPLES]]
+            results[rule.name] = _result(rule, len(df), bad.sum(), examples)
+        elif rule.kind == 'unique':
+            column = resolve(rule.target)
+            if column is None:
+                results[rule.name] = _result(rule, missing=[rule.target])
+                continue
+            keys = df[column]
+            bad = (keys.duplicated(keep=False) & keys.notna()).to_numpy()
+            results[rule.name] = _result(rule, keys.notna().sum(), bad.sum(),
+                                         [{'row': _value(k)} for k in keys[bad].unique()[:EXAMPLES]])
+    return [results[rule.name] for rule in rules if rule.name in results]
+
+
+def check_rollup(state, municipal, rules=ROLLUP_RULES, key='Clave_Estado'):
+    """Results of the rollup `rules`: per state, the sum (or, for a rule with a
+    weight, the weighted mean) of the municipal column against the state's."""
+    rules = [r for r in rules if r.target in state.columns and r.components[0] in municipal.columns
+             and (r.weight is None or r.weight in municipal.columns)]
+    if not rules:
+        return []
+    values = municipal[[r.components[0] for r in rules]].to_numpy(dtype=float)
+    weights = np.column_stack([np.ones(len(municipal)) if r.weight is None else municipal[r.weight].to_numpy(float)
+                               for r in rules])
+    observed = ~np.isnan(values)
+    # Weighted sums and the weights they cover, for every rule in one group-by
+    totals = pd.DataFrame(np.hstack([np.where(observed, values * weights, 0), np.where(observed, weights, 0)]))
+    totals = totals.groupby(municipal[key].to_numpy()).sum()
+    n = len(rules)
+    sums, covered = totals.iloc[:, :n].to_numpy(), totals.iloc[:, n:].to_numpy()
+    weighted = np.array([r.weight is not None for r in rules])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rolled = np.where(weighted, sums / covered, sums)
+
+    states = state[state[key].notna()].set_index(key)
+    states = states[~states.index.duplicated()].reindex(totals.index)
+    expected = states[[r.target for r in rules]].to_numpy(dtype=float)
+    complete = ~np.isnan(expected) & (covered > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bad = complete & (np.abs(rolled - expected) > np.array([r.rtol for r in rules]) * np.abs(expected))
+    labels = states['Estado'].fillna('').to_numpy() if 'Estado' in states.columns else totals.index.to_numpy()
+    return [_result(rule, complete[:, j].sum(), bad[:, j].sum(),
+                    _examples(labels, bad[:, j], value=expected[:, j], municipal=rolled[:, j]))
+            for j, rule in enumerate(rules)]
+
+
+class ValidationError(ValueError):
+    """Raised when data fails error-level rules; `report` has the details."""
+
+    def __init__(self, report):
+        super().__init__('data failed validation:\n  ' + '\n  '.join(failures(report)))
+        self.report = report
+
+
+def check_dataset(name, df):
+    """Results of the rules registered for dataset `name` over `df`."""
+    return check(df, RULES.get(name, []), ROW_KEYS.get(name), by_schema=name == 'historical')
+
+
+def validate_frames(frames):
+    """Report over {dataset name: frame}; rollups run when both 'state' and
+    'municipal' are given."""
+    datasets = {name: {'rows': len(df), 'rules': check_dataset(name, df)} for name, df in frames.items()}
+    if 'state' in frames and 'municipal' in frames:
+        datasets['state']['rules'].extend(check_rollup(frames['state'], frames['municipal']))
+    results = [r for dataset in datasets.values() for r in dataset['rules']]
+    errors = sum(r['severity'] == 'error' and r['failed'] > 0 for r in results)
+    warnings = sum(r['severity'] == 'warning' and r['failed'] > 0 for r in results)
+    return {
+        'generated': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'ok': errors == 0,
+        'errors': errors,
+        'warnings': warnings,
+        'datasets': datasets,
+    }
+
+
+def validate(names=None):
+    """Report over the registered CSVs `names` (default: all); the state and
+    municipal files are both read when either is named, for the rollups."""
+    names = list(names or DATASETS)
+    if {'state', 'municipal'} & set(names):
+        names = list(dict.fromkeys(names + ['state', 'municipal']))
+    return validate_frames({name: read_csv(name) for name in names})
+
+
+def failures(report, severity='error'):
+    """'dataset: rule (failed/checked rows): description' for each failed rule."""
+    return [f"{name}: {r['rule']} ({r['failed']}/{r['checked']} rows): {r['description']}"
+            for name, dataset in report['datasets'].items() for r in dataset['rules']
+            if r['failed'] and r['severity'] == severity]
+
+
+def write_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='dataset',
+                        help=f"datasets to check (default: all of {', '.join(DATASETS)})")
+    parser.add_argument('--report', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(DATASETS)
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(sorted(unknown))}")
+
+    report = validate(args.names)
+    if args.report:
+        write_report(report, args.report)
+        for line in failures(report) + failures(report, 'warning'):
+            print(line)
+        print(f"{report['errors']} errors, {report['warnings']} warnings; wrote {args.report}")
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,191 @@
+"""Figure-cache warm-up: build every chart the dashboards can show before anyone asks.
+
+The widget space is small and finite, so inclusion.catalog can list every
+figure each page can request; warming builds them all into the figure cache
+(inclusion.figcache), so no user pays the pandas + Plotly cost of a cold
+combination.
+
+Two ways to run it:
+
+- In the Streamlit process: each page calls start() at the top, which warms
+  the process' in-memory cache from a background thread pool once per process.
+- Ahead of time, into the disk cache every replica reads
+  (FIMX_FIGURE_CACHE_DIR must be set), optionally in a process pool:
+
+      python -m inclusion.warmup --processes --workers 8
+      python -m inclusion.warmup --drilldowns   # also every municipal drill-down
+
+Either way, once every figure is cached the warm-up writes its status as JSON
+to FIMX_READY_FILE (or --ready-file), which a readiness probe can test for
+(e.g. ``test -f /tmp/fimx-ready``) to route traffic only to warm replicas.
+The file is removed when a warm-up starts. Set FIMX_WARMUP=0 to skip the
+in-process warm-up.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    # Plotly imports its JSON engine lazily; import it with this module so the
+    # page thread and the warm-up thread don't both start that import
+    import orjson  # noqa: F401
+except ImportError:
+    orjson = None
+
+from inclusion import catalog
+from inclusion.figcache import default_cache
+from inclusion.figures import CHARTS
+
+
+def build(figure, sources, cache=None):
+    """Put one catalog Figure in the cache; True if it had to be built."""
+    built = []
+
+    def make():
+        built.append(True)
+        return CHARTS[figure.chart](sources[figure.source], **figure.params)
+
+    (cache or default_cache()).get_or_build(figure.spec(), make)
+    return bool(built)
+
+
+def warm(figures, sources, workers=4, cache=None):
+    """Build `figures` in a thread pool; returns how many weren't cached yet."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(lambda figure: build(figure, sources, cache), figures))
+
+
+# Sources of a warm-up worker process, loaded once by the initializer
+_worker_sources = None
+
+
+def _init_worker(pages):
+    global _worker_sources
+    _worker_sources = catalog.load_sources(pages)
+
+
+def _build_in_worker(figure):
+    return build(figure, _worker_sources)
+
+
+def warm_processes(figures, pages, workers=None):
+    """Build `figures` in a process pool. Each worker loads the data itself
+    (attaching the shared store) and writes to the disk cache, so this only
+    helps when FIMX_FIGURE_CACHE_DIR is set."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pages,)) as pool:
+        return sum(pool.map(_build_in_worker, figures, chunksize=4))
+
+
+def write_ready(path, status):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def clear_ready(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class WarmUp:
+    """One warm-up run and its progress, for status() and the ready file."""
+
+    def __init__(self, pages=catalog.PAGES, drilldowns=False, workers=4, ready_file=None):
+        self.pages = tuple(pages)
+        self.drilldowns = drilldowns
+        self.workers = workers
+        self.ready_file = ready_file
+        self.state = 'pending'
+        self.figures = self.built = 0
+        self.seconds = None
+        self.error = None
+
+    def status(self):
+        return {'state': self.state, 'pages': list(self.pages), 'figures': self.figures, 'built': self.built,
+                'seconds': self.seconds, 'error': self.error}
+
+    def run(self, processes=False):
+        self.state = 'warming'
+        if self.ready_file:
+            clear_ready(self.ready_file)
+        start = time.perf_counter()
+        try:
+            sources = catalog.load_sources(self.pages)
+            figures = catalog.figures(sources, self.pages, self.drilldowns)
+            self.figures = len(figures)
+            if processes:
+                self.built = warm_processes(figures, self.pages, self.workers)
+            else:
+                self.built = warm(figures, sources, self.workers)
+        except Exception as e:
+            self.state, self.error = 'failed', repr(e)
+            raise
+        finally:
+            self.seconds = round(time.perf_counter() - start, 3)
+        self.state = 'ready'
+        if self.ready_file:
+            write_ready(self.ready_file, self.status())
+        return self.status()
+
+
+_process_warmup = None
+_start_lock = threading.Lock()
+
+
+def start(pages=catalog.PAGES, drilldowns=False, workers=4):
+    """Warm this process' figure cache in a background thread, once per
+    process; later calls return the running (or finished) warm-up."""
+    global _process_warmup
+    with _start_lock:
+        if _process_warmup is None:
+            _process_warmup = WarmUp(pages, drilldowns, workers, os.environ.get('FIMX_READY_FILE'))
+            if os.environ.get('FIMX_WARMUP', '1') == '0':
+                _process_warmup.state = 'disabled'
+            else:
+                threading.Thread(target=_run_quietly, args=(_process_warmup,), name='fimx-warmup',
+                                 daemon=True).start()
+        return _process_warmup
+
+
+def _run_quietly(warmup):
+    try:
+        warmup.run()
+    except Exception:
+        pass  # recorded in warmup.status()
+
+
+def status():
+    """Status of this process' warm-up ({'state': 'not started'} before start())."""
+    return _process_warmup.status() if _process_warmup is not None else {'state': 'not started'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', nargs='+', choices=catalog.PAGES, default=list(catalog.PAGES))
+    parser.add_argument('--drilldowns', action='store_true', help="also every state's municipal drill-downs")
+    parser.add_argument('--workers', type=int, default=None, help='pool size (default: one per CPU)')
+    parser.add_argument('--processes', action='store_true', help='build in a process pool instead of threads')
+    parser.add_argument('--ready-file', default=os.environ.get('FIMX_READY_FILE'),
+                        help='write the status here when done (default: FIMX_READY_FILE)')
+    args = parser.parse_args(argv)
+
+    cache = default_cache()
+    if not cache.disk_dir:
+        print('FIMX_FIGURE_CACHE_DIR is not set: the figures would only live in this process; '
+              'set it to the directory the dashboard replicas share')
+        return 2
+    warmup = WarmUp(args.pages, args.drilldowns, args.workers or os.cpu_count(), args.ready_file)
+    result = warmup.run(processes=args.processes)
+    print(f"{result['figures']} figures, {result['built']} built, "
+          f"{result['figures'] - result['built']} already cached, {result['seconds']:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
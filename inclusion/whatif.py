@@ -0,0 +1,211 @@
+"""What-if projections: add infrastructure somewhere, see metrics, FI_Index and ranks move.
+
+An Addition puts `count` new units (corresponsales, ATMs, branches, ...) of one
+*_10mil_adultos column into a state, optionally only into its municipalities
+of one population type, split between them by adult population or evenly. A
+state's density is its absolute count per 10,000 adults, so the addition
+raises it by count / Poblacion_adulta * 10,000 whichever municipalities get
+the units; the split only matters for the municipal view
+(municipal_allocation()).
+
+Simulator.run() evaluates a batch of scenarios (each a list of additions) as
+array operations: the additions become (scenario, state, column, density
+delta) arrays, FI_Index and the state ranking are recomputed for every
+scenario at once, and only the touched entries of the density matrix are
+materialized. For index specs that are linear in the densities (no
+normalization, or per capita) the index change is accumulated directly
+from the touched entries; min-max and z-score specs depend on every state,
+so they are recomputed on dense blocks of scenarios.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from inclusion.index_engine import DEFAULT_SPEC, combine, normalize
+
+ALLOCATIONS = ('population', 'even')
+TYPE_COL = 'Tipo_de_poblacion_accessMunicipal'
+
+
+@dataclass(frozen=True)
+class Addition:
+    column: str
+    count: float
+    state: int  # Clave_Estado
+    population_type: str = None  # only municipalities of this Tipo_de_poblacion
+    allocation: str = 'population'
+
+    def __post_init__(self):
+        if self.allocation not in ALLOCATIONS:
+            raise ValueError(f'Unknown allocation {self.allocation!r}; expected one of {ALLOCATIONS}')
+
+
+def ranks(values):
+    """Rank of every column in each row of `values` (1 = highest; NaN last)."""
+    order = np.argsort(np.where(np.isnan(values), np.inf, -values), axis=-1, kind='stable')
+    result = np.empty_like(order)
+    np.put_along_axis(result, order, np.arange(1, values.shape[-1] + 1)[None, :], axis=-1)
+    return result
+
+
+class BatchResult:
+    """FI_Index and ranks of every state under each scenario of a batch.
+
+    fi, rank: (scenarios, states) arrays; base_fi, base_rank: (states,) arrays
+    without any addition. The density changes are kept as the touched
+    (scenario, state, column, delta) entries.
+    """
+
+    def __init__(self, simulator, names, fi, rank, touched):
+        self.simulator = simulator
+        self.names = names
+        self.fi = fi
+        self.rank = rank
+        self.touched = touched
+
+    @property
+    def fi_delta(self):
+        return self.fi - self.simulator.base_fi
+
+    @property
+    def rank_delta(self):
+        """Places gained (positive) or lost (negative) by each state."""
+        return self.simulator.base_rank - self.rank
+
+    def summary(self):
+        """One row per scenario: largest index gain and how the ranking moved."""
+        deltas = np.nan_to_num(self.fi_delta)
+        moved = self.rank_delta
+        best = np.argmax(moved, axis=1)
+        return pd.DataFrame({
+            'scenario': self.names,
+            'max_fi_delta': deltas.max(axis=1),
+            'states_moved': (moved != 0).sum(axis=1),
+            'best_mover': np.asarray(self.simulator.states)[best],
+            'places_gained': moved[np.arange(len(best)), best],
+        })
+
+    def states(self, i=0):
+        """Per-state before/after table for scenario `i`: FI_Index, rank and
+        every density the scenario touched."""
+        sim = self.simulator
+        table = pd.DataFrame({
+            'FI_Index': sim.base_fi, 'FI_Index_after': self.fi[i], 'FI_Index_delta': self.fi_delta[i],
+            'rank': sim.base_rank, 'rank_after': self.rank[i], 'rank_change': self.rank_delta[i],
+        }, index=pd.Index(sim.states, name='Estado'))
+        scenario, state, column, delta = self.touched
+        mine = scenario == i
+        for k in np.unique(column[mine]):
+            after = sim.base[:, k].copy()
+            np.add.at(after, state[mine & (column == k)], delta[mine & (column == k)])
+            table[f'{sim.columns[k]}_after'] = after
+        return table
+
+
+class Simulator:
+    """What-if evaluator over a state frame (as returned by load_state()) for one index spec."""
+
+    def __init__(self, state_frame, spec=DEFAULT_SPEC, municipal=None, block=1024):
+        frame = state_frame[state_frame['Clave_Estado'].notna()]
+        self.states = list(frame.index)
+        self.keys = frame['Clave_Estado'].astype(int).to_numpy()
+        self._state_pos = {key: i for i, key in enumerate(self.keys)}
+        self.columns = [col for col in frame.columns if '_10mil_adultos' in col]
+        self._column_pos = {col: k for k, col in enumerate(self.columns)}
+        missing = [col for col in spec.columns if col not in self._column_pos]
+        if missing:
+            raise ValueError(f'Index components missing from the state frame: {missing}')
+        self.base = frame[self.columns].to_numpy(dtype=float)
+        self.adults = frame['Poblacion_adulta'].to_numpy(dtype=float)
+        self.population = frame[spec.population].to_numpy(dtype=float)
+        self.spec = spec
+        self.municipal = municipal
+        # (Clave_Estado, Tipo_de_poblacion) pairs that have municipalities
+        self._typed = None if municipal is None else set(zip(municipal['Clave_Estado'], municipal[TYPE_COL]))
+        self.block = block
+        self._components = np.array([self._column_pos[col] for col in spec.columns])
+        self.linear = spec.normalization in ('none', 'per_capita')
+        self.base_fi = self._fi(self.base[None])[0]
+        self.base_rank = ranks(self.base_fi[None])[0]
+
+    def _fi(self, matrices):
+        """FI_Index of (scenarios, states, columns) density matrices."""
+        components = normalize(matrices[..., self._components], self.spec.normalization, self.population)
+        return combine(components, self.spec.weights)
+
+    def check(self, addition):
+        """Raise ValueError if `addition` is limited to a population type that
+        has no municipalities in its state (checked when the simulator has the
+        municipal frame): its units would go nowhere."""
+        if (addition.population_type is not None and self._typed is not None
+                and (addition.state, addition.population_type) not in self._typed):
+            raise ValueError(f'No municipality of type {addition.population_type!r} in state {addition.state}')
+
+    def _encode(self, scenarios):
+        """Flatten scenarios into (scenario, state, column, density delta) arrays."""
+        for additions in scenarios:
+            for a in additions:
+                self.check(a)
+        rows = [(i, self._state_pos[a.state], self._column_pos[a.column], a.count)
+                for i, additions in enumerate(scenarios) for a in additions]
+        if not rows:
+            return (np.empty(0, dtype=np.intp),) * 3 + (np.empty(0),)
+        scenario, state, column, count = (np.array(values) for values in zip(*rows))
+        return scenario, state, column, count / self.adults[state] * 10000
+
+    def run(self, scenarios, names=None):
+        """BatchResult for `scenarios`, a list of lists of Additions (ValueError
+        if one can't be placed, see check())."""
+        scenario, state, column, delta = self._encode(scenarios)
+        return self.run_arrays(len(scenarios), scenario, state, column, delta, names)
+
+    def run_arrays(self, n, scenario, state, column, delta, names=None):
+        """BatchResult from already encoded additions: row positions of the
+        states and columns, and the density delta of each addition."""
+        names = list(names) if names is not None else [f'scenario {i + 1}' for i in range(n)]
+        if self.linear:
+            # Each touched entry moves the index by its delta times the column's weight
+            weights = np.zeros(len(self.columns))
+            weights[self._components] = self.spec.weights
+            scale = 10000 / self.population[state] if self.spec.normalization == 'per_capita' else 1.0
+            fi = np.tile(self.base_fi, (n, 1))
+            np.add.at(fi, (scenario, state), delta * weights[column] * scale)
+        else:
+            fi = np.empty((n, len(self.states)))
+            for start in range(0, n, self.block):
+                stop = min(start + self.block, n)
+                matrices = np.repeat(self.base[None], stop - start, axis=0)
+                mine = (scenario >= start) & (scenario < stop)
+                np.add.at(matrices, (scenario[mine] - start, state[mine], column[mine]), delta[mine])
+                fi[start:stop] = self._fi(matrices)
+        return BatchResult(self, names, fi, ranks(fi), (scenario, state, column, delta))
+
+    def municipal_allocation(self, addition):
+        """How `addition` splits between the state's municipalities, with
+        their density before and after (needs the municipal frame)."""
+        if self.municipal is None:
+            raise ValueError('Simulator was built without a municipal frame')
+        self.check(addition)
+        frame = self.municipal
+        mask = (frame['Clave_Estado'] == addition.state).to_numpy()
+        if addition.population_type is not None:
+            mask &= (frame[TYPE_COL] == addition.population_type).to_numpy()
+        rows = frame[mask]
+        adults = rows['Poblacion_adulta'].to_numpy(dtype=float)
+        if addition.allocation == 'population':
+            share = adults / adults.sum() if adults.sum() > 0 else np.full(len(rows), 1 / max(len(rows), 1))
+        else:
+            share = np.full(len(rows), 1 / max(len(rows), 1))
+        units = addition.count * share
+        before = rows[addition.column].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            after = np.nan_to_num(before) + np.where(adults > 0, units / adults * 10000, np.nan)
+        return pd.DataFrame({
+            'Municipio': rows['Municipio'].astype(str).to_numpy(),
+            TYPE_COL: rows[TYPE_COL].astype(str).to_numpy(),
+            'Poblacion_adulta': adults,
+            'units': units,
+            addition.column: before,
+            f'{addition.column}_after': after,
+        }, index=rows.index)
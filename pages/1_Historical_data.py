@@ -0,0 +1,174 @@
+import streamlit as st
+
+from inclusion.catalog import CARD_TITLES, historical_maps, trend_params
+from inclusion.data import fingerprint
+from inclusion.figcache import cached_figure, plotly_chart_json
+from inclusion import forecast, historical, warmup
+from inclusion.historical import card_gender_shares, load_historical
+from inclusion.profiling import debug_panel, profiled, timed, widget_state
+
+st.set_page_config(page_title="Financial Inclusion MX - Historical data", page_icon="💸", layout="centered")
+
+# Build every figure the pages can show into the figure cache, once per process
+warmup.start()
+
+# Timing and memory per block of this rerun; shown below the page with ?debug=1
+with profiled('historical', context=widget_state(st.session_state)) as profile:
+    debug = st.experimental_get_query_params().get('debug', ['0'])[0] == '1'
+    profile.mark('Data loading')
+
+    def section(title):
+        """Start a trends block: a header plus a new profiling section."""
+        profile.mark(title)
+        st.header(title)
+
+    # Read-only frame shared by every session and worker process; the store
+    # version changes when a quarterly release is appended, which reloads it
+    store_version = historical.store_version()
+
+    @st.cache_resource
+    def load_data(store_version):
+        return load_historical()
+
+    df = load_data(store_version)
+
+    @st.cache_resource
+    def data_version(store_version):
+        return fingerprint(load_data(store_version))
+
+    def show_chart(chart, source, version=None, **params):
+        """Render a chart from inclusion.figures through the figure cache."""
+        version = version or data_version(store_version)
+        plotly_chart_json(cached_figure(chart, source, version, **params), use_container_width=True)
+
+    # Year-end snapshots (4T, or the latest quarter for the current year), computed
+    # once (or kept up to date by the quarterly store) and shared by the trend
+    # charts and the gender analysis
+    @st.cache_data
+    def load_year_end(store_version):
+        return historical.load_year_end()
+
+    df_year_end = load_year_end(store_version)
+
+    # Next-quarter projections of every series, fitted in one batch per data version
+    @st.cache_resource
+    def load_forecast(store_version):
+        return forecast.fit(load_data(store_version))
+
+    projections = load_forecast(store_version)
+    trend_version = historical.trends_version(data_version(store_version), projections)
+
+    @st.cache_data
+    def load_trends(store_version):
+        return historical.trend_frame(load_year_end(store_version), load_forecast(store_version))
+
+    with timed('pandas'):
+        # Year-end bars (years as strings, for a categorical x-axis) followed by the
+        # projected year-end values
+        df_filtered = load_trends(store_version)
+
+    # Option label -> column for every trend section, shared with the warm-up and
+    # the static export (see inclusion.catalog)
+    maps = historical_maps(df_year_end.columns)
+    infra_map = maps['infrastructure']
+    captacion_map = maps['captacion']
+    captacion_eacp_map = maps['captacion_eacp']
+    credit_map = maps['credit']
+    credito_eacp_map = maps['credito_eacp']
+
+    st.title("Financial Inclusion Analysis - Mexico, historical data")
+
+    ###################################
+    # Infrastructure (Single Dropdown)
+    ###################################
+    section("Infrastructure trends")
+    infra_choice = st.selectbox("Select type of infrastructure:", list(infra_map.keys()), index=0)
+
+    # Single type: just show a bar chart with year on x and the value on y
+    show_chart('trend_bar', df_filtered, trend_version, **trend_params('infrastructure', infra_choice, maps))
+
+    ###################################
+    # Captación (Single Dropdown)
+    ###################################
+    section("Trends for 'Captación' - Banca")
+    capt_choice = st.selectbox("Select a type of 'Captación' (or total):", list(captacion_map.keys()), index=0)
+
+    show_chart('trend_bar', df_filtered, trend_version, **trend_params('captacion', capt_choice, maps))
+    if capt_choice == "Total":
+        st.markdown("""
+        **Note:** The total is composed of:
+        - Ahorro (Savings)
+        - Plazo (Term deposits)
+        - Tradicionales (Traditional)
+        - Simplificadas (Simplified)
+        
+        Where N1, N2, and N3 accounts make up the Simplified accounts category.
+    """)
+
+    ###################################
+    # Captación EACP (Single Dropdown)
+    ###################################
+    section("Trends for 'Captación' - Entidades de Ahorro y Crédito Popular")
+    capt_eacp_choice = st.selectbox("Select a type of 'Captación' (or total):", list(captacion_eacp_map.keys()), index=0)
+
+    # The total option charts the EACP total column
+    show_chart('trend_bar', df_filtered, trend_version, **trend_params('captacion_eacp', capt_eacp_choice, maps))
+
+    ###################################
+    # Crédito (Single Dropdown)
+    ###################################
+    section("Trends for 'Crédito' - Banca")
+    credit_choice = st.selectbox("Select a type of 'Crédito' (or total):", list(credit_map.keys()), index=0)
+
+    # The total option charts the Banca total column
+    show_chart('trend_bar', df_filtered, trend_version, **trend_params('credit', credit_choice, maps))
+
+    ###################################
+    # Crédito EACP (Single Dropdown)
+    ###################################
+    section("Trends for 'Crédito' - Entidades de Ahorro y Crédito Popular")
+    credit_eacp_choice = st.selectbox("Select a type of 'Crédito' (or total):", list(credito_eacp_map.keys()), index=0)
+
+    # The total option charts the EACP total column
+    show_chart('trend_bar', df_filtered, trend_version, **trend_params('credito_eacp', credit_eacp_choice, maps))
+
+    ###################################
+    # Gender Analysis - Cards
+    ###################################
+    section("Gender Analysis - Debit and Credit Cards")
+
+    df_gender = df_year_end
+
+    # Debit and credit cards by gender, from 2018 onwards
+    with timed('pandas'):
+        debit_data = card_gender_shares(df_gender, 'debit')
+        credit_data = card_gender_shares(df_gender, 'credit')
+
+    # Debit Cards Analysis
+    st.subheader("Debit cards by gender")
+    show_chart('gender_lines', debit_data, title=CARD_TITLES['debit'])
+    show_chart('gender_split', debit_data, title=f"{CARD_TITLES['debit']} (% distribution)")
+
+    # Credit Cards Analysis
+    st.subheader("Credit cards by gender")
+    show_chart('gender_lines', credit_data, title=CARD_TITLES['credit'])
+    show_chart('gender_split', credit_data, title=f"{CARD_TITLES['credit']} (% distribution)")
+
+    # Footer
+    st.markdown(
+        'Made by [Valentin Mendez](https://www.linkedin.com/in/valentemendez/) using information from the [CNBV](https://datos.gob.mx/busca/organization/2a93da6c-8c17-4671-a334-984536ac9d61?tags=inclusion)'
+    )
+
+    # Hide the "Made with Streamlit" footer
+    hide_streamlit_style = """
+<style>
+footer {visibility: hidden;}
+</style>
+"""
+
+    st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+
+# After the body, so interrupted and failed reruns are recorded too
+if debug:
+    debug_panel(profile.rerun)
+    st.json({'warmup': warmup.status()})
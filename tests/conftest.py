@@ -0,0 +1,36 @@
+"""Shared fixtures. The tests run against the shipped CSVs; anything they
+build goes to a temporary directory, and the shared-memory store and the
+disk figure cache are disabled so a running dashboard is never touched."""
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+os.environ['FIMX_SHARED_DIR'] = ''
+os.environ.pop('FIMX_FIGURE_CACHE_DIR', None)
+os.environ['FIMX_WARMUP'] = '0'
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    path = tmp_path / 'build'
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def csv_copy(tmp_path, monkeypatch):
+    """Point a registered dataset at a copy of its CSV, which the test may edit."""
+    from inclusion.data import DATASETS, csv_path
+
+    def copy(name):
+        path = tmp_path / os.path.basename(csv_path(name))
+        shutil.copyfile(csv_path(name), path)
+        monkeypatch.setitem(DATASETS, name, dict(DATASETS[name], csv=str(path)))
+        return str(path)
+    return copy
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import math
+
+import pytest
+
+from inclusion.api import MetricsAPI
+
+
+def get(api, path, headers=()):
+    """(status, headers, body) of a GET through the ASGI interface."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode('latin-1'),
+             'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]}
+    asyncio.run(api(scope, receive, send))
+    start, body = messages
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body['body']
+
+
+def test_conditional_requests():
+    api = MetricsAPI()
+    status, headers, body = get(api, '/v1/states?columns=Cajeros_10mil_adultos')
+    assert status == 200 and len(json.loads(body)) == 32
+    status, _, body = get(api, '/v1/states?columns=Cajeros_10mil_adultos', [('if-none-match', headers['etag'])])
+    assert (status, body) == (304, b'')
+    assert get(api, '/v1/states?columns=nope')[0] == 400
+
+
+@pytest.mark.parametrize('weight', ['ATMs:-5', 'ATMs:nan', 'ATMs:inf', 'ATMs:-inf', 'ATMs:x', 'Nope:1'])
+def test_bad_weights_are_rejected(weight):
+    status, _, body = get(MetricsAPI(), f'/v1/states?columns=FI_Index&weight={weight}')
+    assert status == 400, body
+
+
+def test_weights_change_the_index():
+    api = MetricsAPI()
+    default = json.loads(get(api, '/v1/states?columns=FI_Index')[2])
+    status, _, body = get(api, '/v1/states?columns=FI_Index&weight=ATMs:3&weight=Credits:0')
+    assert status == 200
+    weighted = json.loads(body)
+    assert all(math.isfinite(row['FI_Index']) and row['FI_Index'] >= 0 for row in weighted)
+    assert weighted != default
+
+
+def test_source_changes_reload_the_data_and_the_etags(csv_copy):
+    path = csv_copy('state')
+    api = MetricsAPI()
+    url = '/v1/states?columns=Cajeros_10mil_adultos'
+    _, headers, body = get(api, url)
+    before = {row['Estado']: row['Cajeros_10mil_adultos'] for row in json.loads(body)}
+    assert get(api, url, [('if-none-match', headers['etag'])])[0] == 304
+
+    # Double one state's ATM density in the CSV, as a re-run ingest would pick up
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().split('\n')
+    header = lines[0].split(',')
+    column = header.index('Cajeros_10mil_adultos')
+    row = lines[1].split(',')
+    state = row[header.index('Estado')]
+    row[column] = str(float(row[column]) * 2)
+    lines[1] = ','.join(row)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+
+    status, new_headers, body = get(api, url, [('if-none-match', headers['etag'])])
+    assert status == 200 and new_headers['etag'] != headers['etag']
+    after = {row['Estado']: row['Cajeros_10mil_adultos'] for row in json.loads(body)}
+    assert after[state] == pytest.approx(2 * before[state], rel=1e-5)
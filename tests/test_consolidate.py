@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inclusion.consolidate import aliases, base_name, collapse_duplicates
+from inclusion.data import read_csv
+
+
+def test_base_name():
+    assert base_name('Region_x_x') == 'Region'
+    assert base_name('Poblacion_accessState') == 'Poblacion'
+    assert base_name('Region.1') == 'Region'
+    assert base_name('Cuentas_ahorro_10mil_adultos_ Banca') == 'Cuentas_ahorro_10mil_adultos_Banca'
+
+
+def test_only_identical_columns_with_the_same_base_collapse():
+    df = pd.DataFrame({
+        'Region_x': ['a', 'b'], 'Region_y': ['a', 'b'],
+        'Poblacion_x': [1.0, np.nan], 'Poblacion_y': [1.0, 2.0],  # differ: both kept
+        'Cajeros': [5, 6], 'Otra': [5, 6],  # same values, unrelated names: both kept
+    })
+    frame, lineage = collapse_duplicates(df)
+    assert list(frame.columns) == ['Region', 'Poblacion_x', 'Poblacion_y', 'Cajeros', 'Otra']
+    assert lineage['Region'] == ['Region_x', 'Region_y']
+    assert aliases(lineage) == {'Region_x': 'Region', 'Region_y': 'Region'}
+
+
+@pytest.mark.parametrize('name', ['state', 'consolidated'])
+def test_every_original_column_is_recoverable(name):
+    df = read_csv(name)
+    frame, lineage = collapse_duplicates(df)
+    assert frame.shape[1] < df.shape[1]
+    assert sorted(col for cols in lineage.values() for col in cols) == sorted(df.columns)
+    for kept, originals in lineage.items():
+        for col in originals:
+            assert frame[kept].equals(df[col].rename(kept)), col
@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+import pytest
+
+from inclusion.correlations import correlation_pvalue, correlation_table
+from inclusion.metrics import add_derived_metrics, indicators
+from inclusion.state import state_metrics
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return state_metrics()
+
+
+def test_coefficients_match_pandas(frame):
+    targets = ['FI_Index', 'Poblacion']
+    table = correlation_table(frame, indicators, targets).set_index(['indicator', 'target'])
+    # The rows every pair is computed over
+    data = frame[indicators + targets].astype(float).dropna()
+    for (indicator, target), row in table.iterrows():
+        pair = data[[indicator, target]]
+        assert row['pearson_r'] == pytest.approx(pair[indicator].corr(pair[target]), abs=1e-9)
+        ranks = pair.rank()
+        assert row['spearman_rho'] == pytest.approx(ranks[indicator].corr(ranks[target]), abs=1e-9)
+        slope, intercept = np.polyfit(pair[indicator], pair[target], 1)
+        assert row['slope'] == pytest.approx(slope, rel=1e-6)
+        assert row['intercept'] == pytest.approx(intercept, rel=1e-6, abs=1e-9)
+        assert row['n'] == len(pair)
+
+
+def test_rows_with_gaps_are_dropped_for_every_pair(frame):
+    frame = add_derived_metrics(frame)
+    frame.iloc[0, frame.columns.get_loc('TPV_10mil_adultos')] = np.nan
+    table = correlation_table(frame, indicators, ['FI_Index'])
+    assert (table['n'] == frame[indicators + ['FI_Index']].dropna().shape[0]).all()
+
+
+def t_sf_two_sided(t, dof, steps=200001):
+    # Two-sided tail of Student's t by integrating its density
+    x = np.linspace(0, abs(t), steps)
+    density = (math.gamma((dof + 1) / 2) / (math.sqrt(dof * math.pi) * math.gamma(dof / 2))
+               * (1 + x ** 2 / dof) ** (-(dof + 1) / 2))
+    return 1 - 2 * np.trapz(density, x)
+
+
+@pytest.mark.parametrize('r, n', [(0.1, 32), (0.5, 32), (-0.8, 10), (0.35, 120), (0.99, 6)])
+def test_pvalues_match_students_t(r, n):
+    dof = n - 2
+    t = r * math.sqrt(dof / (1 - r ** 2))
+    assert correlation_pvalue(r, n) == pytest.approx(t_sf_two_sided(t, dof), abs=1e-7)
+
+
+def test_pvalues_closed_forms():
+    # dof = 1: p = 1 - 2/pi atan|t|; dof = 2: p = 1 - |t| / sqrt(2 + t^2)
+    for r in (0.2, 0.6, 0.95):
+        t = r / math.sqrt(1 - r ** 2)
+        assert correlation_pvalue(r, 3) == pytest.approx(1 - 2 / math.pi * math.atan(t), rel=1e-10)
+        t = r * math.sqrt(2 / (1 - r ** 2))
+        assert correlation_pvalue(r, 4) == pytest.approx(1 - t / math.sqrt(2 + t ** 2), rel=1e-10)
+    assert correlation_pvalue(0.0, 30) == pytest.approx(1.0)
+    assert np.isnan(correlation_pvalue(0.5, 2))
+
+
+def test_pvalues_match_scipy(frame):
+    stats = pytest.importorskip('scipy.stats')
+    table = correlation_table(frame, indicators, ['FI_Index'])
+    for _, row in table.iterrows():
+        data = frame[indicators + ['FI_Index']].astype(float).dropna()
+        x, y = data[row['indicator']], data['FI_Index']
+        assert row['pearson_p'] == pytest.approx(stats.pearsonr(x, y)[1], rel=1e-6, abs=1e-12)
+        assert row['spearman_p'] == pytest.approx(stats.spearmanr(x, y)[1], rel=1e-6, abs=1e-12)
@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+import pandas.testing as pdt
+
+from inclusion import ingest
+from inclusion.consolidate import collapse_duplicates
+from inclusion.data import _columnar_entry, load_dataset, read_csv
+
+
+def test_columnar_build_round_trips(build_dir):
+    ingest.build(['state', 'municipal'], build_dir=build_dir)
+    # Every file is written to a temporary name and moved into place
+    assert not [name for name in os.listdir(build_dir) if '.tmp' in name]
+    expected, _ = collapse_duplicates(read_csv('state'))
+    pdt.assert_frame_equal(load_dataset('state', build_dir=build_dir), expected)
+
+    columns = ['Clave_Municipio', 'Tipo_de_poblacion_accessMunicipal', 'Cajeros_10mil_adultos']
+    pdt.assert_frame_equal(load_dataset('municipal', columns, build_dir=build_dir),
+                           read_csv('municipal', columns))
+
+
+def test_collapsed_columns_load_by_original_name(build_dir):
+    ingest.build(['state'], build_dir=build_dir)
+    columns = ['Region_accessState', 'Region_eacpUsageState', 'Poblacion_adulta']
+    df = load_dataset('state', columns, build_dir=build_dir)
+    assert list(df.columns) == columns
+    pdt.assert_series_equal(df['Region_accessState'], df['Region_eacpUsageState'], check_names=False)
+
+
+def test_same_size_edit_makes_the_build_stale(build_dir, csv_copy):
+    path = csv_copy('municipal')
+    ingest.build(['municipal'], build_dir=build_dir)
+    assert _columnar_entry('municipal', build_dir) is not None
+
+    # Touching the file without changing it keeps the build
+    os.utime(path, ns=(0, 0))
+    assert _columnar_entry('municipal', build_dir) is not None
+
+    # Same byte count, different content
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    before = read_csv('municipal', ['Municipio', 'Estado_accessMunicipal'])
+    name = before['Municipio'].iloc[0]
+    edited = text.replace(name, name[::-1], 1)
+    assert len(edited.encode('utf-8')) == len(text.encode('utf-8')) and edited != text
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(edited)
+
+    assert _columnar_entry('municipal', build_dir) is None
+    after = load_dataset('municipal', ['Municipio', 'Estado_accessMunicipal'], build_dir=build_dir)
+    assert not after.equals(before)
+    assert (after == name[::-1]).any(axis=None)
+
+
+def test_typed_frames_have_no_text_numbers():
+    df = read_csv('municipal')
+    assert not [col for col in df.select_dtypes('object').columns if col.endswith('_10mil_adultos')]
+    assert isinstance(df['Tipo_de_poblacion_accessMunicipal'].dtype, pd.CategoricalDtype)
+
+
+def test_scratch_builds_leave_shared_frames_alone(build_dir, tmp_path, monkeypatch):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    (shared / 'state-0123.arrow').write_bytes(b'')
+    monkeypatch.setenv('FIMX_SHARED_DIR', str(shared))
+    ingest.build(['state'], build_dir=build_dir, drop_shared=False)
+    assert (shared / 'state-0123.arrow').exists()
+    ingest.build(['state'], build_dir=build_dir)
+    assert not (shared / 'state-0123.arrow').exists()
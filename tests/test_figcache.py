@@ -0,0 +1,60 @@
+import json
+
+import plotly.graph_objects as go
+import pytest
+import streamlit as st
+
+from inclusion import figcache
+from inclusion.figcache import ChartSpec, FigureCache, cached_figure, plotly_chart_json
+from inclusion.figures import CHARTS
+from inclusion.metrics import add_derived_metrics
+from inclusion.state import load_state
+
+
+def test_spec_keys_ignore_parameter_order():
+    assert ChartSpec.make('credit', 'v1', a=1, b=2).key() == ChartSpec.make('credit', 'v1', b=2, a=1).key()
+    assert ChartSpec.make('credit', 'v1', a=1).key() != ChartSpec.make('credit', 'v2', a=1).key()
+
+
+def test_lru_and_disk(tmp_path):
+    cache = FigureCache(maxsize=2, disk_dir=str(tmp_path))
+    for key in 'abc':
+        cache.put(key, f'"{key}"')
+    assert cache.stats()['entries'] == 2 and cache.evictions == 1
+    assert cache.get('a') == '"a"' and cache.disk_hits == 1
+    assert FigureCache(disk_dir=str(tmp_path)).get('c') == '"c"'
+
+
+def test_cached_figure_builds_once():
+    df = add_derived_metrics(load_state())
+    cache = FigureCache()
+    first = cached_figure('credit', df, 'test', cache=cache)
+    assert cached_figure('credit', df, 'test', cache=cache) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert json.loads(first) == json.loads(CHARTS['credit'](df).to_json())
+
+
+def test_other_streamlit_versions_use_the_public_api(monkeypatch):
+    calls = []
+    monkeypatch.setattr(st, '__version__', '99.0.0')
+    monkeypatch.setattr(st, 'plotly_chart', lambda fig, **kwargs: calls.append((fig, kwargs)))
+    monkeypatch.setattr(figcache, '_direct_plotly_chart', lambda *args: pytest.fail('private path used'))
+
+    fig = go.Figure(go.Bar(x=['a', 'b'], y=[1, 2]))
+    plotly_chart_json(fig.to_json(), use_container_width=True)
+    (sent, kwargs), = calls
+    assert sent.to_plotly_json() == fig.to_plotly_json()
+    assert kwargs == {'use_container_width': True}
+
+
+def test_direct_path_falls_back_when_the_message_changed(monkeypatch):
+    calls = []
+
+    def broken(*args):
+        raise AttributeError('PlotlyChart has no field spec')
+
+    monkeypatch.setattr(st, '__version__', figcache.DIRECT_PLOTLY_VERSIONS[0] + '0')
+    monkeypatch.setattr(figcache, '_direct_plotly_chart', broken)
+    monkeypatch.setattr(st, 'plotly_chart', lambda fig, **kwargs: calls.append(fig))
+    plotly_chart_json(go.Figure().to_json())
+    assert len(calls) == 1
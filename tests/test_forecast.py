@@ -0,0 +1,69 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from inclusion import forecast
+from inclusion.historical import load_historical, load_year_end, trend_frame
+from inclusion.periods import period_number, quarter_col, year_col
+
+
+@pytest.fixture(scope='module')
+def history():
+    df = load_historical().copy()
+    # Gaps in one series, so it's fitted on fewer quarters than the others
+    column = forecast.metric_columns(df)[3]
+    df.loc[df.index[-6:-2], column] = np.nan
+    return df
+
+
+def per_series(df, column, horizon=forecast.HORIZON, window=forecast.WINDOW, level=forecast.LEVEL):
+    # One np.linalg.lstsq per series, on its observed quarters in the window
+    periods = period_number(df).to_numpy()
+    last = periods.max()
+    values = df[column].to_numpy(dtype=float)
+    rows = (periods > last - window) & ~np.isnan(values)
+    X, y = forecast.design(periods[rows] - last), values[rows]
+    beta, _, rank, _ = np.linalg.lstsq(X, y, rcond=None)
+    sigma = np.sqrt(((y - X @ beta) ** 2).sum() / max(len(y) - rank, 1))
+    X0 = forecast.design(np.arange(1, horizon + 1))
+    mean = X0 @ beta
+    leverage = np.einsum('hi,ij,hj->h', X0, np.linalg.pinv(X.T @ X), X0)
+    half_width = NormalDist().inv_cdf(0.5 + level / 2) * sigma * np.sqrt(1 + leverage)
+    return mean, mean - half_width, mean + half_width, len(y)
+
+
+def test_batch_matches_per_series_lstsq(history):
+    result = forecast.fit(history)
+    checked = 0
+    for i, column in enumerate(result.columns):
+        mean, lower, upper, n = per_series(history, column)
+        if n < forecast.MIN_OBSERVATIONS:
+            assert np.isnan(result.mean[:, i]).all()
+            continue
+        scale = max(np.abs(history[column]).max(), 1.0)
+        np.testing.assert_allclose(result.mean[:, i], mean, rtol=1e-7, atol=1e-9 * scale, err_msg=column)
+        np.testing.assert_allclose(result.lower[:, i], lower, rtol=1e-7, atol=1e-9 * scale, err_msg=column)
+        np.testing.assert_allclose(result.upper[:, i], upper, rtol=1e-7, atol=1e-9 * scale, err_msg=column)
+        checked += 1
+    assert checked > 50
+
+
+def test_exact_trend_is_recovered():
+    periods = np.arange(2015 * 4, 2022 * 4)
+    df = pd.DataFrame({year_col: periods // 4, quarter_col: [f'{p % 4 + 1}T' for p in periods],
+                                'value': 3.0 * periods + np.tile([0.0, 5.0, -2.0, 1.0], len(periods) // 4)})
+    result = forecast.fit(df)
+    future = result.periods
+    np.testing.assert_allclose(result.mean[:, 0], 3.0 * future + np.array([0.0, 5.0, -2.0, 1.0])[future % 4])
+    np.testing.assert_allclose(result.upper[:, 0] - result.lower[:, 0], 0, atol=1e-6)
+
+
+def test_projections_are_year_end_points():
+    trends = trend_frame(load_year_end(), forecast.fit(load_historical()))
+    projected = trends[trends['forecast']]
+    # One point per year, on the same categorical axis as the bars
+    assert projected[year_col].is_unique
+    assert set(projected[year_col]) <= {str(year) for year in range(2000, 2100)}
+    assert (projected[quarter_col] == '4T').sum() >= len(projected) - 1
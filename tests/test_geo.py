@@ -0,0 +1,78 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from inclusion import geo
+from inclusion.geo import Topology
+
+# A zigzag border from (0, 0) to (0, 1) that simplification can straighten
+BORDER = [[0.01 * (i % 2) if 0 < i < 20 else 0.0, y] for i, y in enumerate(np.linspace(0, 1, 21).tolist())]
+
+
+def square(x0, left):
+    # `left` is the shared border when the square lies to its right
+    ring = left + [[x0 + 1, 1.0], [x0 + 1, 0.0]] if x0 >= 0 else [[x0, 0.0], [x0, 1.0]] + left[::-1]
+    return ring + [ring[0]]
+
+
+def features(key='CVE_ENT', wiggle=BORDER):
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {key: '01'}, 'geometry': {'type': 'Polygon', 'coordinates': [square(-1, wiggle)]}},
+        {'type': 'Feature', 'properties': {key: '02'}, 'geometry': {'type': 'Polygon', 'coordinates': [square(0, wiggle)]}},
+    ]}
+
+
+def border_points(feature):
+    ring = feature['geometry']['coordinates'][0][0]
+    return {tuple(point) for point in ring if abs(point[0]) < 0.05 and 0 < point[1] < 1}
+
+
+def test_shared_border_is_one_arc():
+    topology = Topology.from_features(features()['features'], 'CVE_ENT')
+    refs = [ref for geometry in topology.geometries for ring in geometry['polygons'][0] for ref in ring]
+    arcs = [ref if ref >= 0 else ~ref for ref in refs]
+    shared = {arc for arc in arcs if arcs.count(arc) == 2}
+    assert len(shared) == 1
+    # Used forwards by one neighbour and backwards by the other
+    (arc,) = shared
+    assert sorted(ref >= 0 for ref in refs if ref in (arc, ~arc)) == [False, True]
+
+
+@pytest.mark.parametrize('tolerance', [0.0001, 0.005, 0.05])
+def test_simplification_keeps_neighbours_joined(tolerance):
+    topology = Topology.from_features(features()['features'], 'CVE_ENT')
+    left, right = topology.to_geojson(tolerance)['features']
+    assert border_points(left) == border_points(right)
+    # Above the zigzag's amplitude only the point that keeps the arc from collapsing is left
+    assert len(border_points(left)) == (19 if tolerance < 0.01 else 1)
+
+
+@pytest.fixture
+def geo_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(geo, 'GEO_DIR', str(tmp_path / 'geo'))
+    monkeypatch.setattr(geo, 'BUILD_DIR', str(tmp_path / 'build'))
+    os.makedirs(geo.GEO_DIR)
+    return geo.GEO_DIR
+
+
+def write_states(path, data, mtime_ns):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_replaced_boundaries_are_picked_up(geo_dir):
+    path = geo.geojson_path('state')
+    write_states(path, features(), 1_000_000_000_000_000_000)
+    first, _ = geo.layer_geojson('state')
+    assert geo.layer_geojson('state')[0] is first
+
+    # Same size, new mtime
+    data = features()
+    data['features'][1]['properties']['CVE_ENT'] = '03'
+    write_states(path, data, 2_000_000_000_000_000_000)
+    second, _ = geo.layer_geojson('state')
+    assert [feature['id'] for feature in second['features']] == [1, 3]
+    assert len(os.listdir(os.path.join(geo.BUILD_DIR, 'geo'))) == 2
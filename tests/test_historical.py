@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from inclusion.data import csv_path, load_dataset
+from inclusion.historical import card_gender_shares, year_end_snapshots
+from inclusion.periods import quarter_col, year_col
+
+
+@pytest.fixture(scope='module')
+def raw():
+    return pd.read_csv(csv_path('historical'))
+
+
+@pytest.fixture(scope='module')
+def year_end_df():
+    return year_end_snapshots(load_dataset('historical'))
+
+
+def original_year_end(raw):
+    # The dashboard's original rule: 4T, except 2T for 2024
+    rows = [raw[(raw[year_col] == year) & (raw[quarter_col] == ('2T' if year == 2024 else '4T'))]
+            for year in raw[year_col].unique()]
+    return pd.concat(rows, ignore_index=True).sort_values(year_col)
+
+
+def test_year_end_snapshots_match_the_original_rule(raw, year_end_df):
+    expected = original_year_end(raw)
+    assert list(year_end_df[year_col]) == list(expected[year_col])
+    assert list(year_end_df[quarter_col]) == list(expected[quarter_col])
+
+
+@pytest.mark.parametrize('card, women, men', [('debit', 46, 47), ('credit', 49, 50)])
+def test_card_shares_match_the_original_positions(raw, year_end_df, card, women, men):
+    original = original_year_end(raw)
+    original = pd.DataFrame({
+        'Year': original[year_col],
+        'Women': original.iloc[:, women].str.replace(',', '').astype(float),
+        'Men': original.iloc[:, men].str.replace(',', '').astype(float),
+    })
+    original = original[original['Year'] >= 2018].sort_values('Year')
+
+    shares = card_gender_shares(year_end_df, card)
+    np.testing.assert_array_equal(shares['Year'], original['Year'])
+    np.testing.assert_allclose(shares['Women'], original['Women'])
+    np.testing.assert_allclose(shares['Men'], original['Men'])
+    pdt.assert_series_equal((shares['Men %'] + shares['Women %']).round(1),
+                            pd.Series(100.0, index=shares.index), check_names=False, atol=0.1)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from inclusion.drilldown import load_municipal
+from inclusion.index_engine import (COMPONENT_GROUPS, DEFAULT_SPEC, IndexEngine, IndexSpec, fi_index,
+                                    spec_from_groups)
+from inclusion.metrics import account_columns, credit_columns
+from inclusion.state import load_state
+
+
+def original_fi_index(df):
+    # The formula the dashboard computed inline before the index engine
+    return (
+        df['Sucursales_banca_comercial_10mil_adultos'] +
+        df['Cajeros_10mil_adultos'] +
+        df['Corresponsales_10mil_adultos'] +
+        df[account_columns].sum(axis=1) / 1000 +
+        df[credit_columns].sum(axis=1) / 1000
+    ) / 5
+
+
+@pytest.mark.parametrize('load', [load_state, load_municipal])
+def test_default_spec_is_the_original_formula(load):
+    df = load()
+    pdt.assert_series_equal(fi_index(df, DEFAULT_SPEC), original_fi_index(df).astype(float),
+                            check_names=False, rtol=1e-6)
+
+
+def test_missing_components_count_as_zero():
+    df = load_state().iloc[:6].copy()
+    df.iloc[1, df.columns.get_loc(account_columns[0])] = np.nan
+    df.iloc[2, df.columns.get_loc(credit_columns[1])] = np.nan
+    df.iloc[3, [df.columns.get_loc(col) for col in account_columns + credit_columns]] = np.nan
+    df.iloc[4, [df.columns.get_loc(col) for col in DEFAULT_SPEC.columns]] = np.nan
+    index = fi_index(df, DEFAULT_SPEC)
+    expected = original_fi_index(df).astype(float)
+    pdt.assert_series_equal(index.drop(df.index[4]), expected.drop(df.index[4]), check_names=False, rtol=1e-6)
+    assert np.isnan(index.iloc[4]) and np.isnan(expected.iloc[4])
+    # Normalized specs skip the gap the same way
+    assert np.isfinite(fi_index(df, spec_from_groups({'Accounts': 1, 'ATMs': 1}, 'zscore')).iloc[1])
+
+
+def test_normalizations():
+    df = load_state()
+    groups = {group: 1 for group in COMPONENT_GROUPS}
+    columns = [col for cols, _ in COMPONENT_GROUPS.values() for col in cols]
+    values = df[columns].astype(float)
+
+    minmax = fi_index(df, spec_from_groups(groups, 'minmax'))
+    scaled = (values - values.min()) / (values.max() - values.min())
+    expected = sum(scaled[cols].mean(axis=1) for cols, _ in COMPONENT_GROUPS.values()) / len(COMPONENT_GROUPS)
+    pdt.assert_series_equal(minmax, expected, check_names=False)
+
+    zscore = fi_index(df, spec_from_groups(groups, 'zscore'))
+    standard = (values - values.mean()) / values.std(ddof=0)
+    expected = sum(standard[cols].mean(axis=1) for cols, _ in COMPONENT_GROUPS.values()) / len(COMPONENT_GROUPS)
+    pdt.assert_series_equal(zscore, expected, check_names=False)
+
+
+def test_per_capita_divides_by_population():
+    df = pd.DataFrame({'count': [10.0, 30.0], 'Poblacion_adulta': [1000.0, 2000.0]})
+    spec = IndexSpec((('count', 1.0),), 'per_capita')
+    np.testing.assert_allclose(fi_index(df, spec), [100.0, 150.0])
+
+
+def test_engine_memoizes_by_spec():
+    engine = IndexEngine(load_state())
+    spec = spec_from_groups({'ATMs': 1, 'Credits': 2})
+    assert engine.evaluate(spec) is engine.evaluate(IndexSpec(spec.components))
+    assert engine.evaluate(spec) is not engine.evaluate(DEFAULT_SPEC)
+
+
+def test_invalid_specs_are_rejected():
+    with pytest.raises(ValueError):
+        IndexSpec((('Cajeros_10mil_adultos', 1.0),), 'log')
+    with pytest.raises(ValueError):
+        spec_from_groups({'ATMs': 0})
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from inclusion.drilldown import load_municipal
+from inclusion.peers import PEER_FEATURES, TYPE_COL, PeerIndex
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return load_municipal()
+
+
+@pytest.fixture(scope='module')
+def index(frame):
+    return PeerIndex(frame)
+
+
+def brute_force(frame, key, k, population_type=None):
+    values = frame[PEER_FEATURES].astype(float)
+    z = ((values - values.mean()) / values.std(ddof=0).replace(0, 1)).fillna(0).to_numpy()
+    row = np.flatnonzero(frame['Clave_Municipio'].to_numpy() == key)[0]
+    distances = np.sqrt(((z - z[row]) ** 2).sum(axis=1))
+    candidates = np.ones(len(frame), dtype=bool)
+    if population_type is not None:
+        candidates = frame[TYPE_COL].to_numpy() == population_type
+    candidates[row] = False
+    rows = np.flatnonzero(candidates)
+    return np.sort(distances[rows])[:k]
+
+
+@pytest.mark.parametrize('position', [0, 17, 500, -1])
+def test_peers_match_brute_force(frame, index, position):
+    key = frame['Clave_Municipio'].iloc[position]
+    peers = index.query(key, k=10)
+    assert key not in set(peers['Clave_Municipio'])
+    np.testing.assert_allclose(peers['distance'], brute_force(frame, key, 10), rtol=1e-4, atol=1e-4)
+
+
+def test_peers_of_one_population_type(frame, index):
+    key = frame['Clave_Municipio'].iloc[42]
+    for kind in index.types:
+        peers = index.query(key, k=5, population_type=kind)
+        assert (peers[TYPE_COL] == kind).all()
+        np.testing.assert_allclose(peers['distance'], brute_force(frame, key, 5, kind), rtol=1e-4, atol=1e-4)
+
+
+def test_unknown_municipality():
+    index = PeerIndex(load_municipal().head(20))
+    with pytest.raises(KeyError):
+        index.query(-1)
+    assert len(index.query(index.frame['Clave_Municipio'].iloc[0], k=50)) == 19
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inclusion.periods import (latest_per_year, period_number, qoq, quarter_col, rolling, select_periods, year_col,
+                               year_end, yoy)
+
+
+@pytest.fixture
+def series():
+    # 2021 4T .. 2023 2T with 2022 3T missing, shuffled
+    periods = [(2021, '4T'), (2022, '1T'), (2022, '2T'), (2022, '4T'), (2023, '1T'), (2023, '2T')]
+    df = pd.DataFrame({year_col: [y for y, _ in periods], quarter_col: [q for _, q in periods],
+                       'value': [10.0, 11.0, 12.0, 14.0, 15.0, 16.0]})
+    return df.sample(frac=1, random_state=0)
+
+
+def test_period_number_orders_quarters(series):
+    numbers = period_number(series)
+    assert numbers[series[quarter_col] == '1T'].min() == 2022 * 4
+    assert (numbers.sort_values().diff().dropna() > 0).all()
+
+
+def test_year_end_falls_back_to_the_latest_quarter(series):
+    picked = year_end(series)
+    assert list(zip(picked[year_col], picked[quarter_col])) == [(2021, '4T'), (2022, '4T'), (2023, '2T')]
+    assert select_periods(series, 'year_end').equals(picked)
+
+
+def test_latest_per_year(series):
+    picked = latest_per_year(series)
+    assert list(picked[quarter_col]) == ['4T', '4T', '2T']
+
+
+def test_changes_match_on_the_period_not_the_row(series):
+    ordered = series.sort_values([year_col, quarter_col])
+    change = qoq(ordered, ['value'], pct=False)['value']
+    # 2022 4T follows a missing 3T, so it has no previous quarter
+    expected = [np.nan, 1.0, 1.0, np.nan, 1.0, 1.0]
+    np.testing.assert_array_equal(change.to_numpy(), expected)
+
+    growth = yoy(ordered, ['value'])['value']
+    assert growth[(ordered[year_col] == 2022) & (ordered[quarter_col] == '4T')].item() == pytest.approx(40.0)
+    assert growth.isna().sum() == 3  # 2021 4T and 2022 1T, 2T have no year-earlier quarter
+
+
+def test_rolling_is_in_period_order(series):
+    result = rolling(series, ['value'], window=2, agg='sum')['value']
+    np.testing.assert_array_equal(result.to_numpy(), [np.nan, 21.0, 23.0, 26.0, 29.0, 31.0])
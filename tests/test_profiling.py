@@ -0,0 +1,55 @@
+import pytest
+
+from inclusion.profiling import Registry, RerunProfile, prometheus_text, profiled, record, timed
+
+
+class StopException(Exception):
+    """Stands in for Streamlit's st.stop() exception, matched by name."""
+
+
+class RerunException(Exception):
+    """Stands in for the exception Streamlit raises when a widget changes mid-run."""
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    from inclusion import profiling
+
+    fresh = Registry()
+    monkeypatch.setattr(profiling, 'REGISTRY', fresh)
+    return fresh
+
+
+def test_sections_collect_their_metrics(registry):
+    with profiled('page') as profile:
+        profile.mark('one')
+        with timed('pandas'):
+            record('charts', 2)
+        profile.mark('two')
+        record('payload_bytes', 10)
+    rerun = profile.rerun
+    assert rerun['status'] == 'ok'
+    assert [s['section'] for s in rerun['sections']] == ['one', 'two']
+    one, two = rerun['sections']
+    assert one['charts'] == 2 and one['pandas_s'] > 0 and two['payload_bytes'] == 10
+    # Nothing is recorded outside a profile
+    record('charts', 1)
+    assert rerun['sections'][0]['charts'] == 2
+
+
+@pytest.mark.parametrize('error, status', [(StopException, 'stopped'), (RerunException, 'interrupted'),
+                                           (ValueError, 'error')])
+def test_interrupted_reruns_are_recorded(registry, error, status):
+    with pytest.raises(error):
+        with profiled('page') as profile:
+            profile.mark('slow section')
+            raise error()
+    assert profile.rerun['status'] == status
+    assert profile.rerun['sections'][0]['section'] == 'slow section'
+    assert f'fimx_reruns_total{{page="page",status="{status}"}} 1' in prometheus_text(registry)
+
+
+def test_finish_outside_the_context():
+    profile = RerunProfile('page')
+    profile.mark('only')
+    assert profile.finish()['status'] == 'ok'
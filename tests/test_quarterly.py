@@ -0,0 +1,77 @@
+import pandas.testing as pdt
+import pytest
+
+from inclusion import quarterly
+from inclusion.data import read_csv
+from inclusion.periods import period_number, year_end
+from inclusion.quarterly import QuarterlyStore, period_key_col
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture(scope='module')
+def release():
+    df = read_csv('historical')
+    return df.iloc[period_number(df).to_numpy().argsort(kind='stable')].reset_index(drop=True)
+
+
+def test_append_then_read_round_trips(tmp_path, release):
+    store = QuarterlyStore(str(tmp_path / 'historical'))
+    first = store.append(release.iloc[:-5])
+    assert first['skipped'] == [] and store.version == 1
+
+    # The overlap is skipped, only the last five periods are written
+    second = store.append(release.iloc[-8:].sample(frac=1, random_state=0))
+    assert sorted(second['added']) == sorted(release[period_key_col].iloc[-5:].astype(str))
+    assert len(second['skipped']) == 3 and store.version == 2
+
+    pdt.assert_frame_equal(store.read(), release, check_dtype=False)
+    year = int(release[period_key_col].astype(str).iloc[-1][:4])
+    pdt.assert_frame_equal(store.read(years={year}).reset_index(drop=True),
+                           release[release[period_key_col].astype(str).str.startswith(str(year))]
+                           .reset_index(drop=True), check_dtype=False)
+
+
+def test_changed_periods_are_rejected(tmp_path, release):
+    store = QuarterlyStore(str(tmp_path / 'historical'))
+    store.append(release)
+    altered = release.iloc[-3:].copy()
+    altered.iloc[1, 3] = altered.iloc[1, 3] + 1
+    with pytest.raises(ValueError, match=f"append-only.*{altered[period_key_col].iloc[1]}"):
+        store.append(altered)
+    assert store.append(release.iloc[-3:])['added'] == []
+
+
+def test_rebuild_keeps_counting_versions(tmp_path, release):
+    store = QuarterlyStore(str(tmp_path / 'historical'))
+    store.append(release.iloc[:-1])
+    store.append(release.iloc[-1:])
+    assert store.version == 2
+    store.rebuild()
+    assert store.version == 3
+    store.rebuild()
+    assert store.version == 4
+
+
+@pytest.mark.parametrize('split', [3, 5, 9])
+def test_spliced_aggregates_match_a_full_recompute(tmp_path, release, split):
+    store = QuarterlyStore(str(tmp_path / 'historical'))
+    store.append(release.iloc[:-split])
+    store.append(release.iloc[-split:])
+    pdt.assert_frame_equal(store.aggregate('year_end'), year_end(store.read(), '4T').reset_index(drop=True))
+
+
+def test_manifest_is_written_last(tmp_path, release, monkeypatch):
+    store = QuarterlyStore(str(tmp_path / 'historical'))
+    store.append(release.iloc[:-2])
+    before = store.aggregate('year_end')
+
+    def failing(*args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(quarterly, '_write_parquet', failing)
+    with pytest.raises(OSError):
+        store.append(release.iloc[-2:])
+    # Readers still see the previous version, with its aggregates
+    assert store.version == 1 and len(store.periods()) == len(release) - 2
+    pdt.assert_frame_equal(store.aggregate('year_end'), before)
@@ -0,0 +1,53 @@
+import pytest
+
+from inclusion.data import load_dataset
+from inclusion.schema import HeaderSchema, header_schema, parse_header
+
+
+@pytest.fixture(scope='module')
+def columns():
+    return list(load_dataset('historical').columns)
+
+
+def test_parse_header():
+    assert parse_header('Crédito\nBanca_Tarjeta de crédito') == ('Crédito', 'Banca', 'Tarjeta de crédito')
+    assert parse_header('Infraestructura\nBanca, Socap y Sofipo_TPV') == \
+        ('Infraestructura', 'Banca, Socap y Sofipo', 'TPV')
+    assert parse_header('Periodo_Año') == ('Periodo', '', 'Año')
+
+
+def test_names_resolve_to_the_original_positions(columns):
+    # The page originally read the card breakdowns by position
+    schema = header_schema(columns)
+    assert schema.gender_pair('Tarjetas de débito', 'Banca') == (columns[46], columns[47])
+    assert schema.gender_pair('Tarjetas de crédito', 'Banca') == (columns[49], columns[50])
+
+
+def test_shifted_and_extra_columns_still_resolve(columns):
+    shuffled = columns[::-1] + ['Nueva categoría\nBanca_Algo']
+    original, moved = HeaderSchema(columns), HeaderSchema(shuffled)
+    for key in original.index:
+        assert moved.column(*key) == original.column(*key)
+    assert moved.column('Nueva categoría', 'Banca', 'Algo') == 'Nueva categoría\nBanca_Algo'
+
+
+def test_groups_and_lookups(columns):
+    schema = header_schema(columns)
+    captacion = schema.group('Captación', 'Banca', exclude=('Mujeres', 'Hombres', 'Brecha'))
+    assert list(captacion)[:3] == ['Ahorro', 'Plazo', 'N1'] and 'Total' in captacion
+    assert ('Captación', 'Banca', 'Total') in schema
+    with pytest.raises(KeyError):
+        schema.column('Captación', 'Banca', 'No existe')
+    with pytest.raises(KeyError):
+        schema.group('No existe', 'Banca')
+
+
+def test_select_relabels_by_metric(columns):
+    df = load_dataset('historical')
+    selected = header_schema(columns).select(df, 'Captación', 'Banca')
+    assert 'Total' in selected.columns
+    assert selected['Total'].equals(df[header_schema(columns).column('Captación', 'Banca', 'Total')].rename('Total'))
+
+
+def test_schema_is_parsed_once_per_header_set(columns):
+    assert header_schema(columns) is header_schema(list(columns))
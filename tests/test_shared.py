@@ -0,0 +1,52 @@
+import gc
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from inclusion import shared
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv('FIMX_SHARED_DIR', str(tmp_path / 'shared'))
+    monkeypatch.setattr(shared, '_attached', {})
+    return tmp_path / 'shared'
+
+
+def frame(value):
+    return pd.DataFrame({'x': np.full(1000, value, dtype=float), 'y': np.arange(1000)},
+                        index=pd.Index([f'r{i}' for i in range(1000)], name='key'))
+
+
+def test_round_trip_is_read_only_and_zero_copy(store):
+    loaded = shared.shared_frame('state', lambda: frame(1.0))
+    pdt.assert_frame_equal(loaded, frame(1.0))
+    assert shared.shared_frame('state', lambda: pytest.fail('published twice')) is loaded
+    with pytest.raises(ValueError):
+        loaded['x'].to_numpy()[0] = 2.0
+
+
+def test_new_versions_release_the_old_mapping(store):
+    first = shared.shared_frame('historical', lambda: frame(1.0), ('quarterly',), version=1)
+    for version in range(2, 6):
+        latest = shared.shared_frame('historical', lambda: frame(float(version)), ('quarterly',), version=version)
+    assert len(shared.attached()) == 1
+    assert latest['x'].iloc[0] == 5.0
+    # A frame handed out before the newer version stays readable
+    gc.collect()
+    assert first['x'].sum() == 1000.0
+
+    # Other column lists of the same dataset keep their own attachment
+    shared.shared_frame('historical', lambda: frame(9.0), ('other columns',), version=5)
+    assert len(shared.attached()) == 2
+
+
+def test_clear_removes_the_files(store):
+    shared.shared_frame('state', lambda: frame(1.0))
+    shared.shared_frame('municipal', lambda: frame(1.0))
+    shared.clear('state')
+    assert [p.name.split('-')[0] for p in store.iterdir()] == ['municipal']
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inclusion.data import DATASETS, apply_schema, read_csv
+
+
+@pytest.mark.parametrize('name', list(DATASETS))
+def test_typed_values_equal_the_raw_text(name):
+    raw = read_csv(name, typed=False)
+    typed = read_csv(name)
+    assert list(typed.columns) == list(raw.columns)
+    for col in raw.columns:
+        text, values = raw[col], typed[col]
+        if text.dtype == object and pd.api.types.is_numeric_dtype(values):
+            # Thousands separators and decimal commas
+            text = pd.to_numeric(text.str.replace(DATASETS[name].get('thousands') or '\x00', '', regex=False)
+                                 .str.replace(',', '.', regex=False), errors='coerce')
+        if pd.api.types.is_numeric_dtype(values):
+            np.testing.assert_allclose(values.to_numpy(dtype=float), text.to_numpy(dtype=float),
+                                       rtol=0, equal_nan=True, err_msg=col)
+        else:
+            assert values.astype(object).where(values.notna(), None).tolist() == \
+                text.astype(object).where(text.notna(), None).tolist(), col
+
+
+def test_numeric_text_becomes_numbers():
+    df = read_csv('historical')
+    assert df.select_dtypes('number').shape[1] > 0.9 * df.shape[1]
+
+
+def test_compact_dtypes():
+    df = apply_schema('municipal', pd.DataFrame({
+        'small': np.arange(5, dtype=np.int64),
+        'quarters': np.linspace(0, 1, 5),
+        'ratio': np.linspace(0, 1, 5) / 3,
+        'big': [float(2 ** 26 + 1), np.nan, 1.0, 2.0, 3.0],
+        'Tipo_de_poblacion': ['Rural', 'Urbano', 'Rural', 'Rural', 'Urbano'],
+    }))
+    assert df['small'].dtype == np.int32
+    assert df['quarters'].dtype == np.float32
+    # float32 would round these
+    assert df['ratio'].dtype == np.float64
+    assert df['big'].dtype == np.float64 and df['big'].iloc[0] == 2 ** 26 + 1
+    assert isinstance(df['Tipo_de_poblacion'].dtype, pd.CategoricalDtype)
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from inclusion import metrics
+from inclusion.drilldown import load_municipal
+from inclusion.underserved import (ADULTS_COL, SCORE_METRICS, UNDERSERVED_COLUMNS, ScoringSpec, load_scenarios,
+                                   run)
+
+
+@pytest.fixture(scope='module')
+def report():
+    return run([ScoringSpec(), ScoringSpec('atms', metrics=['Cajeros_10mil_adultos'], zero_branch_weight=0,
+                                           population_exponent=1.0)], workers=1)
+
+
+def direct_scores(spec):
+    # The scores written out with a groupby per state
+    frame = load_municipal(UNDERSERVED_COLUMNS)
+    frame = frame[frame['Clave_Estado'].notna()]
+    values = frame[list(spec.metrics)].astype(float)
+    medians = values.groupby(frame['Clave_Estado']).transform('median')
+    shortfall = ((medians - values) / medians.where(medians > 0)).clip(0, 1)
+    gap = shortfall.mean(axis=1).fillna(0)
+    branches = frame[metrics.institution_columns]
+    zero_branches = (branches.sum(axis=1) == 0) & branches.notna().any(axis=1)
+    zero_atms = frame['Cajeros_10mil_adultos'] == 0
+    need = (spec.zero_branch_weight * zero_branches + spec.zero_atm_weight * zero_atms + spec.gap_weight * gap) / (
+        spec.zero_branch_weight + spec.zero_atm_weight + spec.gap_weight)
+    return pd.DataFrame({
+        'Clave_Municipio': frame['Clave_Municipio'], 'gap': gap, 'need': need,
+        'score': need * frame[ADULTS_COL].astype(float) ** spec.population_exponent,
+    }).sort_values('Clave_Municipio', ignore_index=True)
+
+
+@pytest.mark.parametrize('spec', [ScoringSpec(), ScoringSpec('atms', metrics=['Cajeros_10mil_adultos'],
+                                                              zero_branch_weight=0, population_exponent=1.0)])
+def test_scores_match_a_direct_computation(report, spec):
+    rows = report[report['scenario'] == spec.name]
+    got = rows[['Clave_Municipio', 'gap', 'need', 'score']].sort_values('Clave_Municipio', ignore_index=True)
+    pdt.assert_frame_equal(got, direct_scores(spec), check_dtype=False)
+
+
+def test_ranks(report):
+    for _, rows in report.groupby('scenario'):
+        assert list(rows['rank']) == list(range(1, len(rows) + 1))
+        assert rows['score'].is_monotonic_decreasing
+        for _, state in rows.groupby('Clave_Estado'):
+            assert list(state['state_rank']) == list(range(1, len(state) + 1))
+
+
+def test_worker_processes_give_the_same_report(report):
+    pdt.assert_frame_equal(run([ScoringSpec()], workers=2), report[report['scenario'] == 'default']
+                           .reset_index(drop=True))
+
+
+def test_scenarios_file(tmp_path):
+    path = tmp_path / 'scenarios.json'
+    path.write_text(json.dumps([{'name': 'atms', 'metrics': ['Cajeros_10mil_adultos']}]))
+    assert load_scenarios(str(path)) == [ScoringSpec('atms', metrics=('Cajeros_10mil_adultos',))]
+    path.write_text(json.dumps([{'name': 'x', 'weight': 1}]))
+    with pytest.raises(ValueError):
+        load_scenarios(str(path))
+    with pytest.raises(ValueError):
+        ScoringSpec(metrics=['Poblacion'])
+    assert np.isin(list(SCORE_METRICS), load_municipal(UNDERSERVED_COLUMNS).columns).all()
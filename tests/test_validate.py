@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+from inclusion.data import read_csv
+from inclusion.ingest import build
+from inclusion.schema import header_schema
+from inclusion.validate import GENDER_GROUPS, ValidationError, check_dataset, check_rollup, validate
+
+
+def results(name, df):
+    return {r['rule']: r for r in check_dataset(name, df)}
+
+
+def test_shipped_files_pass():
+    report = validate()
+    assert report['ok'] and report['errors'] == 0
+    checked = [r for dataset in report['datasets'].values() for r in dataset['rules']]
+    assert all(r['checked'] > 0 for r in checked if 'skipped' not in r)
+
+
+@pytest.fixture(scope='module')
+def historical():
+    return read_csv('historical')
+
+
+def test_corrupted_total_is_flagged(historical):
+    df = historical.copy()
+    total = header_schema(df.columns).column('Captación', 'Banca', 'Total')
+    row = df.index[5]
+    df.loc[row, total] *= 1.1
+    result = results('historical', df)['captacion_banca_total']
+    assert result['failed'] == 1
+    (example,) = result['examples']
+    assert example['row'] == df.loc[row, 'Periodo_Clave\nPeriodo']
+    assert example['value'] == pytest.approx(df.loc[row, total], rel=1e-6)
+    others = [r for name, r in results('historical', df).items() if name != 'captacion_banca_total']
+    assert not any(r['failed'] for r in others)
+
+
+def test_corrupted_gap_and_negative_counts(historical):
+    df = historical.copy()
+    schema = header_schema(df.columns)
+    gap = schema.column(*GENDER_GROUPS[0], 'Brecha')
+    row = df[gap].last_valid_index()
+    df.loc[row, gap] += 1
+    df.loc[df.index[3], schema.column('Captación', 'Banca', 'N1')] = -1
+    found = results('historical', df)
+    assert sum(r['failed'] for name, r in found.items() if name.startswith('brecha_')) == 1
+    assert found['non_negative']['failed'] == 1
+    # N1 is part of Simplificadas, so its sum breaks too
+    assert found['captacion_banca_simplificadas']['failed'] == 1
+
+
+def test_duplicates_and_branch_totals():
+    df = read_csv('state')
+    df = pd.concat([df, df.iloc[[0]]], ignore_index=True)
+    df.loc[df.index[1], 'Total_sucursales_10mil_adultos'] += 0.5
+    found = results('state', df)
+    assert found['state_unique']['failed'] == 2
+    assert found['total_branches']['failed'] == 1
+
+
+def test_rollup_flags_a_state_that_does_not_add_up():
+    state, municipal = read_csv('state'), read_csv('municipal')
+    assert not any(r['failed'] for r in check_rollup(state, municipal))
+    state.loc[state['Clave_Estado'] == 9, 'Cajeros_10mil_adultos'] *= 2
+    (result,) = [r for r in check_rollup(state, municipal) if r['rule'] == 'rollup_Cajeros_10mil_adultos']
+    assert result['failed'] == 1
+
+
+def test_ingest_refuses_invalid_data(csv_copy, build_dir):
+    path = csv_copy('state')
+    df = pd.read_csv(path)
+    df.loc[0, 'Total_sucursales_10mil_adultos'] += 1
+    df.to_csv(path, index=False)
+    with pytest.raises(ValidationError, match='total_branches'):
+        build(['state'], build_dir=build_dir, drop_shared=False)
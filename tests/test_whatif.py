@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inclusion.drilldown import load_municipal
+from inclusion.index_engine import DEFAULT_SPEC, fi_index, spec_from_groups
+from inclusion.state import load_state
+from inclusion.whatif import Addition, Simulator, ranks
+
+SCENARIOS = [
+    [Addition('Corresponsales_10mil_adultos', 500, 7)],
+    [Addition('Cajeros_10mil_adultos', 2000, 20), Addition('Cajeros_10mil_adultos', 1000, 20),
+     Addition('Sucursales_banca_comercial_10mil_adultos', 300, 9)],
+    [],
+    [Addition('Corresponsales_10mil_adultos', 5000, 32)],
+]
+
+
+@pytest.fixture(scope='module')
+def states():
+    df = load_state()
+    return df[df['Clave_Estado'].notna()]
+
+
+def direct(states, spec, additions):
+    # Apply the additions to a copy of the frame and recompute the index from scratch
+    df = states.copy()
+    for a in additions:
+        row = df['Clave_Estado'] == a.state
+        df.loc[row, a.column] += a.count / df.loc[row, 'Poblacion_adulta'] * 10000
+    return fi_index(df, spec).to_numpy(dtype=float)
+
+
+@pytest.mark.parametrize('spec', [DEFAULT_SPEC, spec_from_groups({'ATMs': 1, 'Credits': 2}, 'minmax'),
+                                  spec_from_groups({'ATMs': 1, 'Banking agents': 1}, 'zscore')])
+def test_batch_matches_a_direct_recomputation(states, spec):
+    result = Simulator(states, spec, block=3).run(SCENARIOS)
+    for i, additions in enumerate(SCENARIOS):
+        expected = direct(states, spec, additions)
+        np.testing.assert_allclose(result.fi[i], expected, rtol=1e-6, atol=1e-8)
+        expected_rank = pd.Series(expected).rank(ascending=False, method='first').astype(int)
+        np.testing.assert_array_equal(result.rank[i], expected_rank)
+    np.testing.assert_array_equal(result.fi[2], result.simulator.base_fi)
+    assert result.summary()['states_moved'].iloc[2] == 0
+
+
+def test_ranks_put_missing_values_last():
+    np.testing.assert_array_equal(ranks(np.array([[1.0, np.nan, 3.0, 2.0]])), [[3, 4, 1, 2]])
+
+
+def test_municipal_allocation_splits_by_adults(states):
+    sim = Simulator(states, municipal=load_municipal())
+    addition = Addition('Cajeros_10mil_adultos', 1000, 9)
+    split = sim.municipal_allocation(addition)
+    assert split['units'].sum() == pytest.approx(1000)
+    np.testing.assert_allclose(split['units'] / split['units'].sum(),
+                               split['Poblacion_adulta'] / split['Poblacion_adulta'].sum())
+    even = sim.municipal_allocation(Addition('Cajeros_10mil_adultos', 1000, 9, allocation='even'))
+    np.testing.assert_allclose(even['units'], 1000 / len(even))
+    with pytest.raises(ValueError):
+        Addition('Cajeros_10mil_adultos', 1, 9, allocation='random')
+
+
+def test_additions_to_an_absent_population_type_are_rejected(states):
+    municipal = load_municipal()
+    sim = Simulator(states, municipal=municipal)
+    present = set(zip(municipal['Clave_Estado'], municipal['Tipo_de_poblacion_accessMunicipal']))
+    state, kind = next((s, t) for s in sorted(set(municipal['Clave_Estado'])) for t in sorted(set(
+        municipal['Tipo_de_poblacion_accessMunicipal'].dropna())) if (s, t) not in present)
+    addition = Addition('Cajeros_10mil_adultos', 1000, int(state), kind)
+    with pytest.raises(ValueError):
+        sim.run([[addition]])
+    with pytest.raises(ValueError):
+        sim.municipal_allocation(addition)
+    # Without the municipal frame there's nothing to check against
+    assert Simulator(states).run([[addition]]).fi_delta.any()